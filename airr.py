@@ -8,17 +8,53 @@
 # 2025.04.20 rinos4u	予定の追加ボタンが押せないケースがあり更に改善(execute_scriptでクリック)
 # 2026.04.05 rinos4u	検索でヒットした数と同じ数ダウンロードできない場合にリトライする
 # 2026.04.26 rinos4u	予定件数が取得できない場合のリトライ追加
+# 2026.10.18 rinos4u	固定ウェイトをwebctrlの条件待ちに置き換え
+# 2026.10.18 rinos4u	検索リストをwebctrl.tableで行単位に一括抽出するように変更
+# 2026.10.18 rinos4u	webctrl.Poolから呼ぶログイン処理(login)を追加
+# 2026.10.18 rinos4u	予約一覧をCSVダウンロードで取得するモード(fetch: csv)を追加
+# 2026.10.18 rinos4u	件数不一致のリトライで、取得済みページを残して不足ページだけ再取得するように変更
+# 2026.10.18 rinos4u	削除を事務所単位にまとめ、1回の期間検索の結果から続けてキャンセルするように変更
+# 2026.10.18 rinos4u	予定設定の実行順を事務所単位で決めるスケジューラ(setorder)を追加し、切替/読込回数の見積もりと実績を表示
+# 2026.10.18 rinos4u	表示中のページ/事務所/ログイン状態を記録し、不要なページ移動と事務所確認を省略
+# 2026.10.18 rinos4u	予定追加の詳細画面をスクリプト実行で開くように変更(従来のクリック操作はフォールバック)
+# 2026.10.18 rinos4u	追加/削除の結果をjournalに記録
+# 2026.10.18 rinos4u	予定1件/グループ1つ単位のリトライ(opretry)を追加。応答しないブラウザは作り直して継続
+# 2026.10.18 rinos4u	追加した予約番号をサイボウズUIDとの対応表(idmap)に記録
+# 2026.10.18 rinos4u	時刻が移動した予定を既存予約の変更で反映する更新(~)を追加
+# 2026.10.18 rinos4u	直呼び出しテストの設定をloadconfで読み込むように変更
+# 2026.10.18 rinos4u	予定を共通のEventで扱い、重複チェックを文字列化からEventの同一判定に変更
+# 2026.10.18 rinos4u	中間ファイルをsnapshot(既定はバイナリ)で書き出すように変更
+# 2026.10.18 rinos4u	件数と先頭ページが前回と同じ事務所は残りのページを読まずに前回の予定を使うモード(quickget)を追加
+# 2026.10.18 rinos4u	一括取得/一括削除のリトライ回数を1ページ/1件単位に変更
+# 2026.10.18 rinos4u	一括削除で見つからなかった予約は、全ページを確認できた場合以外は個別削除に回す
+# 2026.10.18 rinos4u	件数不一致のリトライで全件数が変わっていたら、取得済みページを捨てて最初から取得する
+# 2026.10.18 rinos4u	予約番号の対応表(idmap)は予定設定の最後にまとめて保存する
+# 2026.10.18 rinos4u	スクリプトで押しても予定追加の詳細画面が出ない場合は、従来のクリック操作で開き直す
+# 2026.10.18 rinos4u	設定読み込み時のコンパイル(compile_conf)を追加し、部屋リソースをfrozensetにしておく
+# 2026.10.18 rinos4u	登録ボタンを押したことをjournalに記録し、再実行時に再登録しないように変更
+# 2026.10.18 rinos4u	webctrl(selenium)はブラウザを使う時に読み込むように変更 (解析/設定のテストはseleniumが無くても動く)
 
 ################################################################################
 # import
 ################################################################################
 import time
-import yaml
-import webctrl
+import os
+import pickle
+import hashlib
+import journal
+import idmap
+import loadconf
+import snapshot
+from event import Event
+import csv
+import re
+from pathlib import Path
 
 from datetime import datetime, timedelta
 from logconf import g_logger
 
+webctrl = loadconf.lazy_import('webctrl') # selenium(ブラウザ)は最初に使う時に読み込む
+
 ################################################################################
 # const
 ################################################################################
@@ -28,13 +64,18 @@ URL_APPEND = 'https://airreserve.net/reserve/calendar/'
 CAL_TYPE = 'airr'
 
 CONF_FILE = 'config.yaml'
-MIDDLE_FILE = 'log/mid_airr.yaml'
+MIDDLE_FILE = 'log/mid_airr' # 拡張子は形式(snapshot)に応じて付く
+QUICK_FILE  = 'log/quick_airr_%s.pkl' # quickget用の前回の事務所ごとの予定 (%sは設定名)
 
 WAIT_LOGIN  = 1 # どのアカウントでログインしたか分かるように表示を止める
 WAIT_SHOW   = 1 # どの設定を入れたか分かるように表示を止める
-WAIT_AFTER  = 1
+WAIT_AFTER  = 1   # 以下3つは固定ウェイト設定時の待ち時間
 WAIT_SET    = 0.5
 WAIT_SEARCH = 3 # 時間のかかる検索情報表示
+WAIT_RESULT = 30 # 検索結果表示待ちのタイムアウト
+WAIT_FORM   = 10 # 予定追加の吹き出し/詳細画面表示待ちのタイムアウト
+
+OP_RETRY    = 2 # 予定1件/グループ1つ単位のリトライ回数 (opretry未指定時)
 
 # 名前欄に入れられる最大文字列
 MAX_DESC    = 20
@@ -42,9 +83,75 @@ MAX_DESC    = 20
 # 検索のコラム数
 SEARCH_COLUMN = 8
 
+# 登録完了画面の予約番号 (例: '予約番号：AB12345678')
+BOOKING_NO = re.compile(r'予約番号\s*[:：]?\s*([0-9A-Za-z]{8,})')
+
+# 検索結果の表示範囲 (例: '全299件中 1〜50件' → 全件数, 先頭, 末尾)
+RESULT_RANGE = re.compile(r'全(\d+)件中\s*(\d+)\D+(\d+)件')
+
+# CSVダウンロード (fetch: csv)
+CSV_DIR     = 'log/download'         # ダウンロード先(download未指定時)
+CSV_BUTTON  = 'CSV'                  # 予約一覧のダウンロードボタン(a/buttonの表示文字列の先頭一致)
+EDIT_BUTTON = '変更'                 # 検索結果の予約の変更ボタン(a/buttonの表示文字列の先頭一致)
+CSV_ENCODES = ('utf-8-sig', 'cp932') # CSVの文字コード候補
+# CSVのカラム名の候補 (先に見つかったものを使用)
+CSV_COLUMNS = {
+    'no':     ('予約番号',),
+    'bgn':    ('予約開始日時', '利用開始日時', '開始日時'),
+    'end':    ('予約終了日時', '利用終了日時', '終了日時'),
+    'sei':    ('お客様名(姓)', 'お客様名（姓）', '姓', '予約者名(姓)'),
+    'mei':    ('お客様名(名)', 'お客様名（名）', '名', '予約者名(名)'),
+    'menu':   ('予約メニュー', 'メニュー', 'メニュー名'),
+    'resrc':  ('予約リソース', 'リソース', 'リソース名'),
+    'status': ('予約ステータス', 'ステータス'),
+}
+CSV_CANCEL = 'キャンセル' # ステータスにこの文字列を含む予約は除外
+
+# 表示されている先頭の空き枠(schldCell)をクリック。空き枠が無ければfalse
+JS_CELLCLICK = '''
+const e = [...document.getElementsByClassName('schldCell')].find(e => e.getClientRects().length);
+if (!e) return false;
+e.scrollIntoView({block: 'center'});
+e.click();
+return true;
+'''
+
+# 予定追加の吹き出しでメニュー(arguments[0])と開始時刻(先頭)を選び、詳細画面を開く
+# 成功なら空文字列、失敗なら設定できなかった項目名を返す
+JS_REGIST = '''
+const fire = e => e.dispatchEvent(new Event('change', {bubbles: true}));
+const menu = document.getElementById('bookingMenuBalloonSelectMenu');
+const opt = menu && menu.options && [...menu.options].find(o => o.text.trim() == arguments[0]);
+if (!opt) return 'menu';
+menu.value = opt.value;
+fire(menu);
+for (const c of ['startHour', 'startMinute']) {
+    const s = document.getElementsByClassName(c)[0];
+    if (!s) return c;
+    s.selectedIndex = 0;
+    fire(s);
+}
+const btn = document.getElementById('bookingRegist');
+if (!btn) return 'regist';
+btn.click();
+return '';
+'''
+
 ################################################################################
 # globals
 ################################################################################
+# 予定設定時の事務所切替/ページ読み込みの実績回数
+g_count = {'switch': 0, 'load': 0}
+
+# ブラウザの状態 (ar_stateで参照。ブラウザが再起動されたらリセット)
+#  drv:   状態を記録したドライバ
+#  page:  表示中のページ (URL_SEARCH/URL_APPEND、不明ならNone)
+#  store: 選択中の事務所 (不明ならNone)
+#  login: 1ならログイン済み
+g_state = {'drv': None, 'page': None, 'store': None, 'login': 0}
+
+# quickget用の前回の取得結果 (事務所 → (検索結果の要約, 予定))
+g_quick = {}
 
 ################################################################################
 # util funcs
@@ -57,13 +164,59 @@ def ar_login(conf):
     time.sleep(WAIT_LOGIN) # 入力確認も兼ねて、表示したまま少し待つ
 
     # クリックしてページ遷移を待つ
+    tok = webctrl.mark()
     webctrl.click('primary', webctrl.By.CLASS_NAME)
-    webctrl.wait()
+    webctrl.wait(since=tok)
+
+# ブラウザの状態を取得 (ドライバが変わっていたら何も分からない状態に戻す)
+def ar_state():
+    drv = webctrl.driver()
+    if g_state['drv'] is not drv:
+        g_state.update(drv=drv, page=None, store=None, login=0)
+    return g_state
+
+# 現在のURLがどのページか (URL_SEARCH/URL_APPEND、どちらでもなければNone)
+def ar_where():
+    cur = webctrl.url()
+    for url in (URL_SEARCH, URL_APPEND):
+        if cur.startswith(url.split('?')[0]):
+            return url
+    return None
+
+# 指定ページを開き、必要ならログインと店舗選択をする
+# ログイン済みで既にそのページを表示中なら何もしない (force=1なら常に開き直す)
+def ar_open(conf, url, force = 0):
+    st = ar_state()
+    if not force and st['login'] and st['page'] == url and ar_where() == url:
+        g_logger.debug('arr:skip open %s' % (url))
+        return
+    webctrl.jump(url)
+    g_count['load'] += 1
+    st['page'] = url
+
+    # ユーザ/パスワード画面に遷移した？
+    if 'login' in webctrl.url():
+        ar_login(conf)
+        st['page']  = ar_where()
+        st['store'] = None
+
+    # 店舗選択画面なら先頭を叩いておく
+    selst = webctrl.gets('h1', webctrl.By.TAG_NAME)
+    if selst and '選択' in selst[0]:
+        g_logger.debug('arr:select top page %s' % (selst[0]))
+        webctrl.click('storeList__list__innerBox__name', webctrl.By.CLASS_NAME)
+        st['page']  = ar_where()
+        st['store'] = None
+    st['login'] = 1
 
-# 事務所が違うなら変更
+# 事務所が違うなら変更 (選択中の事務所が分かっていれば確認しない)
 def ar_checkgroup(group):
-    time.sleep(WAIT_AFTER)
+    st = ar_state()
+    if st['store'] == group:
+        return 0
+
     # 事務所情報を取得
+    webctrl.wait_elem('cmn-hdr-btn-text', webctrl.By.CLASS_NAME, fallback=WAIT_AFTER)
     menu = webctrl.finds('cmn-hdr-btn-text', webctrl.By.CLASS_NAME)
     if len(menu) < 2:
         g_logger.error('arr:too small menu %s' % (len(menu)))
@@ -72,39 +225,336 @@ def ar_checkgroup(group):
     if group not in menu[1].text:
         g_logger.debug('change:group from %s' % (menu[1].text))
         menu[1].click()
-        time.sleep(WAIT_AFTER)
+        webctrl.wait_elem('cmn-hdr-account-menu-link', webctrl.By.CLASS_NAME, clickable=1, fallback=WAIT_AFTER)
+        tok = webctrl.mark()
         webctrl.click('cmn-hdr-account-menu-link', webctrl.By.CLASS_NAME)
-        time.sleep(WAIT_AFTER)
-        webctrl.wait()
+        webctrl.wait(since=tok, fallback=WAIT_AFTER * 2)
         store = webctrl.finds('storeList__list__innerBox', webctrl.By.CLASS_NAME)
         for s in store:
             if group in s.text:
+                tok = webctrl.mark()
                 s.click()
-                webctrl.wait()
+                webctrl.wait(since=tok)
+                g_count['switch'] += 1
+                g_count['load']   += 1
+                st['page'] = ar_where() # 切り替え後のページ
                 break
         else:
             # 事務所が見つからなかった!?
             g_logger.error('arr:store not found %s' % (group))
             return 2
 
+    st['store'] = group
     return 0 # 成功
+
+# 予約検索リストを1回のスクリプト実行で取得し、予約ごとのカラム(SEARCH_COLUMN個)のリストで返す
+def ar_searchrows():
+    rows = []
+    for row in webctrl.table('tr', target=webctrl.find('bookingSearchList')):
+        cols = '\n'.join(row['cells']).split('\n')
+        if len(cols) == SEARCH_COLUMN:
+            rows.append(cols)
+        elif row['cells']:
+            rows = None # 想定外の行構造
+            break
+    if rows:
+        return rows
+
+    # 行単位で分割できない場合は、従来どおりリスト全体のテキストをカラム数で区切る
+    g_logger.debug('arr:searchrows fallback')
+    bookary = webctrl.get('bookingSearchList').split('\n')
+    return [bookary[i:i + SEARCH_COLUMN] for i in range(0, len(bookary) - (SEARCH_COLUMN - 1), SEARCH_COLUMN)]
+
+# 共通フォーマットの予定を作成 (resrcは「、」区切りのリソース(部屋、人))
+def ar_book(conf, group, no, tbgn, tend, name, menu, resrc):
+    # リソース分割
+    room, person = resrc.split('、') # 仮でroom/personに入れる
+    if room not in conf['roomres']:
+        room, person = person, room # 逆なら反転しておく
+
+    return Event(CAL_TYPE, tbgn, tend,
+                 group + '@' + room + '@' + person + '@' + menu + '@' + no,
+                 name.replace(' ', '')) # 半角スペースが入ることがあるので削除しておく
+
+# 同一の予定が無ければ追加 (Eventの同一判定でチェック)。重複ならFalse
+# warn=0は再取得したページの重複(取得済み)なので警告しない
+def ar_adduniq(ret, old, book, warn = 1):
+    if book in old:
+        if warn:
+            g_logger.warning('arr:多重登録 %s' % (book)) # 多重登録が見つかったら警告しておく
+        return False
+    old.add(book)
+    ret.append(book)
+    g_logger.debug('arr:add %s' % (book))
+    return True
+
+# CSVの日時を変換 (例: '2025/01/11 12:34'、'2025/01/11(土) 12:34'、'2025-01-11 12:34:00')
+def ar_csvtime(s):
+    s = re.sub(r'\(.\)', '', s).replace('-', '/').strip()
+    for fmt in ('%Y/%m/%d %H:%M', '%Y/%m/%d %H:%M:%S'):
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    raise ValueError('arr:invalid csv time %s' % s)
+
+# 検索結果の予約一覧をCSVでダウンロードし、予定のリストで返す
+# ダウンロードやカラムの解析ができなければNone(ページ送りでの取得に切り替える)
+def ar_readcsv(conf, group):
+    path = Path(conf.get('download', CSV_DIR))
+    webctrl.setdownload(path)
+    before = {f.name for f in path.iterdir()}
+
+    # ダウンロードボタンを押して完了を待つ
+    for tag in ('a', 'button'):
+        btn = webctrl.search(tag, CSV_BUTTON, webctrl.By.TAG_NAME)
+        if btn:
+            break
+    else:
+        g_logger.info('arr:CSVダウンロードボタンが見つかりません')
+        return None
+    webctrl.fclick(btn)
+    file = webctrl.wait_download(path, before)
+    if not file:
+        g_logger.info('arr:CSVがダウンロードできませんでした')
+        return None
+    g_logger.debug('arr:csv %s' % file)
+
+    # 文字コードを判定して読み込み
+    for enc in CSV_ENCODES:
+        try:
+            with open(file, encoding=enc, newline='') as f:
+                rows = list(csv.DictReader(f))
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        g_logger.info('arr:CSVの文字コードが判定できません %s' % file)
+        return None
+    file.unlink() # 次回の判定のため読み込んだファイルは削除
+
+    # カラム名を対応付け
+    cols = {}
+    header = rows[0].keys() if rows else []
+    for key, names in CSV_COLUMNS.items():
+        cols[key] = next((n for n in names if n in header), None)
+    if rows and not all(cols[k] for k in ('no', 'bgn', 'end', 'sei', 'menu', 'resrc')):
+        g_logger.info('arr:CSVのカラムが解析できません %s' % list(header))
+        return None
+
+    ret = []
+    for row in rows:
+        if cols['status'] and CSV_CANCEL in row[cols['status']]:
+            continue
+        name = row[cols['sei']] + (row[cols['mei']] if cols['mei'] else '')
+        resrc = re.sub('[,，、]', '、', row[cols['resrc']])
+        ret.append(ar_book(conf, group, row[cols['no']], ar_csvtime(row[cols['bgn']]), ar_csvtime(row[cols['end']]), name, row[cols['menu']], resrc))
+    return ret
     
 ################################################################################
 # Plugin API
 ################################################################################
-# 予定取得
-def get_cal_searchlist(conf, group):
-    # 予定検索ボタン
-    #webctrl.click('h-ico-search', webctrl.By.CLASS_NAME)
-    # 予定検索ページを開く
-    webctrl.jump(URL_SEARCH)
-    time.sleep(WAIT_AFTER)
-
-    # 開始日(現在)～終了日(range加算)を設定
-    today = datetime.now()
-    daymin = today.replace(hour=0, minute=0, second=0, microsecond=0)
-    daymax = daymin + timedelta(days=conf['range'] - 1)
-    g_logger.debug('arr:get %s to %s' % (daymin, daymax))
+# 設定のコンパイル (loadconfから設定読み込み時に1回だけ呼ばれる)
+# 部屋リソースは予約1件ごとに参照するのでfrozensetに、事務所の一覧はタプルにしておく
+def compile_conf(conf):
+    for key in ('user', 'pass', 'range', 'group', 'roomres', 'addmenu', 'addsei', 'delreason'):
+        if key not in conf:
+            raise KeyError(key)
+    if conf.get('fetch', 'list') not in ('list', 'csv'):
+        raise ValueError('fetch %s' % conf['fetch'])
+    if conf.get('setorder', 'store') not in ('store', 'soon'):
+        raise ValueError('setorder %s' % conf['setorder'])
+    conf['roomres'] = frozenset(conf['roomres'])
+    conf['group']   = tuple(conf['group'])
+    return conf
+
+# 予定検索ページを開き、必要ならログイン (webctrl.Poolのlogin用)
+def login(conf):
+    ar_open(conf, URL_SEARCH)
+
+# 検索結果の表示範囲を取得 (全件数, 先頭, 末尾)。取得できなければNone
+def ar_resultrange():
+    m = RESULT_RANGE.search(webctrl.get('resultNumTxt', webctrl.By.CLASS_NAME) or '')
+    return tuple(map(int, m.groups())) if m else None
+
+# 予約一覧の取得状態 (リトライ時は同じ状態を渡して不足ページだけ再取得する)
+#  ret:   取得した予定
+#  old:   追加済みセット
+#  pages: ページ先頭の件番号 → そのページで読めた行数
+#  dups:  多重登録で件数から外した数
+#  total: 取得を始めた時の全件数 (リトライ時に件数が変わっていれば取得済みのページは使わない)
+def ar_newstate():
+    return {'ret': [], 'old': set(), 'pages': {}, 'dups': 0, 'total': None}
+
+# 取得状態を最初からに戻す (同じstateを参照しているリトライ側にも反映させる)
+def ar_resetstate(state):
+    state.clear()
+    state.update(ar_newstate())
+
+# 検索結果の要約 (検索範囲、全件数、先頭ページの行の指紋)
+def ar_summary(daymin, daymax, total, rows):
+    return hashlib.blake2b(repr((daymin, daymax, total, rows)).encode('utf-8'), digest_size=16).digest()
+
+# quickget用の前回の取得結果を読み込む
+def ar_loadquick(conf):
+    g_quick.clear()
+    path = QUICK_FILE % conf['name']
+    if not conf.get('quickget', 0) or not os.path.exists(path):
+        return
+    try:
+        with open(path, mode='rb') as f:
+            g_quick.update(pickle.load(f))
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        g_logger.warning('arr:quick load error %s %s' % (path, e))
+
+# quickget用に今回の取得結果を保存
+def ar_savequick(conf):
+    if not conf.get('quickget', 0):
+        return
+    path = QUICK_FILE % conf['name']
+    with open(path + '.tmp', mode='wb') as f:
+        pickle.dump(g_quick, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path) # 書きかけのファイルを残さない
+
+# 未取得または行数が足りないページのうち、bgnより後ろで最初のページの先頭件番号を返す (無ければNone)
+def ar_nextpage(state, total, size, bgn):
+    for top in range(bgn + size, total + 1, size):
+        if state['pages'].get(top, 0) < min(size, total - top + 1):
+            return top
+    return None
+
+# 先頭件番号topのページへ移動 (離れたページはページ番号のリンク、無ければ次ページボタン)
+def ar_gopage(top, bgn, size):
+    tok = webctrl.mark()
+    if top == bgn + size or not webctrl.exclick("//a[normalize-space()='%d']" % ((top - 1) // size + 1), webctrl.By.XPATH):
+        if not webctrl.exclick('icnNext', webctrl.By.CLASS_NAME):
+            return False # 次ページが押せなければ終了
+
+    # 更新を待つ
+    webctrl.wait(WAIT_RESULT, tok, WAIT_SEARCH)
+    return True
+
+# 空いている予定をクリック (スクリプトで押せない場合の従来処理)。押せなければFalse
+def ar_clickcell():
+    # →schldCellが複数あり、場所によりエラーになる。例外なくなるまで叩く
+    for elm in webctrl.finds('schldCell', webctrl.By.CLASS_NAME):
+        try:
+            webctrl.fmove(elm, 0) # クリックできる場所まで移動するのを待つ
+            webctrl.driver().execute_script('arguments[0].click();', elm)
+            return True # 例外が発生しなかったら継続
+        except:
+            pass
+
+        # ここは上手く押せないことがあるので、もう1回トライ
+        try:
+            webctrl.fmove(elm) # クリックできる場所まで移動するのを待つ
+            webctrl.fclick(elm)
+            return True # 例外が発生しなかったら継続
+        except:
+            pass
+
+        # ここは上手く押せないことがあるので、もう1回トライ
+        try:
+            webctrl.fmove(elm, 0) # クリックできる場所まで移動するのを待つ
+            webctrl.fclick(elm, 0)
+            return True # 例外が発生しなかったら継続
+        except:
+            pass
+    return False
+
+# 吹き出しのメニューをaddmenuにセットして[予約登録]を押す (スクリプトで押せない場合の従来処理)
+# 押す前のページ状態の印を返す
+def ar_clickregist(conf):
+    webctrl.set('bookingMenuBalloonSelectMenu', conf['addmenu'])
+    webctrl.selindex('startHour',   0, webctrl.By.CLASS_NAME)
+    webctrl.selindex('startMinute', 0, webctrl.By.CLASS_NAME)
+    webctrl.settle(WAIT_SET)
+    tok = webctrl.mark()
+    webctrl.click('bookingRegist')
+    return tok
+
+# 予定追加の詳細画面を開く。空き枠が押せない/詳細画面が表示されなければFalse
+# 空き枠のクリックと、吹き出しのメニュー選択～詳細画面表示を、それぞれ1回のスクリプト実行で行う
+# スクリプトで操作できなかった場合や、スクリプトで押しても詳細画面が出ない場合は従来のクリック操作で行う
+def ar_openform(conf):
+    # 空いている予定をクリックして、吹き出しの表示を待つ
+    drv = webctrl.driver()
+    if not drv.execute_script(JS_CELLCLICK):
+        g_logger.debug('arr:cell script click failed')
+        if not ar_clickcell():
+            return False
+    webctrl.wait_elem('bookingMenuBalloonSelectMenu', clickable=1, timeout=WAIT_FORM, fallback=WAIT_SET)
+
+    # メニューをaddmenuにセットして詳細画面を開く
+    tok = webctrl.mark()
+    err = drv.execute_script(JS_REGIST, conf['addmenu'])
+    if err:
+        g_logger.debug('arr:regist script failed %s' % err)
+        tok = ar_clickregist(conf)
+    webctrl.wait(since=tok, fallback=WAIT_SET) # 詳細画面の表示待ち
+    if webctrl.wait_elem('rmStartDate', clickable=1, timeout=WAIT_FORM, fallback=0):
+        return True
+    if err:
+        return False
+
+    # スクリプトでは押せたのに詳細画面が出ない → 従来のクリック操作でもう1回押す (吹き出しが閉じていれば空き枠から開き直す)
+    g_logger.debug('arr:regist script did not open the form')
+    if not webctrl.wait_elem('bookingMenuBalloonSelectMenu', clickable=1, timeout=WAIT_SET, fallback=0):
+        if not ar_clickcell():
+            return False
+        webctrl.wait_elem('bookingMenuBalloonSelectMenu', clickable=1, timeout=WAIT_FORM, fallback=WAIT_SET)
+    try:
+        tok = ar_clickregist(conf)
+    except webctrl.NoSuchElementException:
+        return False
+    webctrl.wait(since=tok, fallback=WAIT_SET)
+    return bool(webctrl.wait_elem('rmStartDate', clickable=1, timeout=WAIT_FORM, fallback=0))
+
+# 登録直後の画面から予約番号を取得 (見つからなければ空文字列)
+def ar_lastno():
+    m = BOOKING_NO.search(webctrl.get('body', webctrl.By.TAG_NAME) or '')
+    return m.group(1) if m else ''
+
+# 予定設定の実行順を決める (事務所の切り替えが最小になるよう事務所単位にまとめる)
+#  setorder=store: 事務所名順
+#  setorder=soon:  直近の予定を含む事務所から順
+# 事務所内は追加→削除の順(削除は事務所単位で一括処理)で、それぞれ日時の早い順
+# 並べ替えた予定と、事務所切替/ページ読み込み回数の見積もりを返す
+def ar_schedule(conf, merge):
+    groups = {}
+    for i in merge:
+        groups.setdefault(i.store, []).append(i)
+    if conf.get('setorder', 'store') == 'soon':
+        order = sorted(groups, key=lambda g: min(i.tbgn for i in groups[g]))
+    else:
+        order = sorted(groups)
+
+    ret  = []
+    load = 0
+    for group in order:
+        ops = sorted(groups[group], key=lambda i: (i.ctyp, i.tbgn))
+        ret += ops
+
+        # 見積もり: 事務所切替1回 + 追加1件ごとに登録1回 + 削除は検索ページと検索の2回 + 1件ごとにキャンセル1回
+        #          + 更新1件ごとに検索ページ/検索/登録の3回
+        nadd = 0 if conf['skipadd'] else sum(1 for i in ops if i.ctyp == '+')
+        ndel = 0 if conf['skipdel'] else sum(1 for i in ops if i.ctyp == '-')
+        nupd = 0 if conf['skipadd'] or conf['skipdel'] else sum(1 for i in ops if i.ctyp == '~')
+        load += 1 + nadd + (2 + ndel if ndel else 0) + 3 * nupd
+    return ret, len(order), load
+
+# 予定設定の見積もりと実績を表示
+def ar_report(estsw, estld):
+    g_logger.info('arr:事務所切替 %d回(見積%d回)、ページ読込 %d回(見積%d回)' % (g_count['switch'], estsw, g_count['load'], estld))
+
+# 予約一覧を検索 (daymin～daymaxの日付で、キャンセル状態を除く予約)
+# 「該当する予約がありません」の場合はFalse
+def ar_search(conf, daymin, daymax):
+    # 予定検索ページを開く (検索条件を初期状態にするため常に開き直す)
+    ar_open(conf, URL_SEARCH, 1)
+    webctrl.wait_elem('bookingFromDt', fallback=WAIT_AFTER)
+
+    # 開始日～終了日を設定
     webctrl.set('bookingFromDt', daymin.strftime('%Y/%m/%d'))
     webctrl.set('bookingToDt',   daymax.strftime('%Y/%m/%d'))
 
@@ -112,42 +562,202 @@ def get_cal_searchlist(conf, group):
     for i in range(3):
         webctrl.click('bookingStatusCdList%d' % i) 
 
-    # 検索実行
+    # 検索実行 (時間がかかる事が多いので、固定ウェイト時は特にウェイトを大きくしておく)
+    tok = webctrl.mark()
     webctrl.click('btn-search', webctrl.By.CLASS_NAME)
-    time.sleep(WAIT_SEARCH * 3) # 時間がかかる事が多いので、特にウェイトを大きくしておく
+    webctrl.wait(WAIT_RESULT, tok, WAIT_SEARCH * 3)
+    g_count['load'] += 1
 
     # 「該当する予約がありません」の場合はスキップ
     if 'ありません' in webctrl.get('dialogueMessage'):
-        g_logger.info('arr:no data')
         webctrl.click('closeErrDialogue')
-        return 0, []
+        return False
+    return True
+
+# 予約をキャンセル (triggerは予約のキャンセルボタン)。キャンセルしたら1
+def ar_cancel(conf, trigger):
+    # 継続するか確認する設定なら入力待ち
+    if conf['waitdel']:
+        ret = input('削除処理を継続しますか？(y/n):')
+        if ret != 'y' and ret != 'Y':
+            g_logger.info('削除処理をキャンセルしました')
+            return 0
+
+    # 削除実行
+    webctrl.fclick(trigger)
+    webctrl.wait_elem('cancelReason', clickable=1, fallback=WAIT_AFTER)
+    webctrl.set('cancelReason', conf['delreason']) # キャンセル理由
+    webctrl.settle(WAIT_SET)
+    tok = webctrl.mark()
+    webctrl.click('doCancel')
+    webctrl.wait(since=tok, fallback=WAIT_AFTER)
+    g_count['load'] += 1
+    return 1
+
+# 事務所groupの削除予定をまとめて削除
+# 削除予定の期間を1回だけ検索し、結果ページを辿りながら該当する予約をキャンセルする
+# delsは予約番号 → (表示用の番号, 予定)、totalは表示用の全件数
+# 予約番号 → 結果(1:削除、0:削除しない)をdoneに入れて返す。Noneは一覧から削除できなかったので個別に削除する
+# 一覧に無かった予約は、キャンセルで一覧が詰まらずに最終ページまで確認できた場合だけ削除済み(0)とし、
+# 途中でページ送りができなかった場合などはNone(個別に削除)にする
+# リトライ時は同じdoneを渡すと、処理済みの予約を飛ばして続きから処理する
+def ar_delbatch(conf, group, dels, total, done):
+    ar_checkgroup(group)
+    daymin = min(i.tbgn for _, i in dels.values()).replace(hour=0, minute=0, second=0, microsecond=0)
+    daymax = max(i.tend for _, i in dels.values())
+    g_logger.debug('arr:del %s %d件 %s to %s' % (group, len(dels), daymin, daymax))
+
+    found = ar_search(conf, daymin, daymax)
+    complete  = not found # 該当する予約が無ければ全て確認済み
+    cancelled = 0         # 今回の巡回でキャンセルした数 (キャンセル後は一覧が詰まるため、後ろのページの予約が前に移る)
+    while found:
+        # 現在のページの削除対象を探す (キャンセル後は一覧が更新されるため毎回探し直す)
+        bookary = next((b for b in ar_searchrows() if b[0] in dels and b[0] not in done), None)
+        if bookary:
+            no = bookary[0]
+            count, i = dels[no]
+            g_logger.info('削除:#%d/%d %s-%s %s %s' % (count, total, i.tbgn.strftime('%Y/%m/%d %H:%M'), i.tend.strftime('%H:%M'), i.summ, i.desc))
+
+            # サイボウズ追加でなければ警告
+            if bookary[5] != conf['addmenu']:
+                g_logger.warning('arr:del 検索タイプ異常 "%s"' % (bookary[5]))
+                done[no] = 0
+                continue
+
+            # 予約の行にあるキャンセルボタンで削除
+            trigger = [t for tr in webctrl.finds('tr', webctrl.By.TAG_NAME, webctrl.find('bookingSearchList')) if no in tr.text
+                         for t in webctrl.finds('js-popupCancelTrigger', webctrl.By.CLASS_NAME, tr)]
+            if not trigger:
+                g_logger.debug('arr:del trigger not found %s' % (no))
+                done[no] = None
+                continue
+            done[no] = ar_cancel(conf, trigger[0])
+            cancelled += done[no]
+
+            # 一覧が閉じられていたら同じ条件で検索し直す (処理済みの予約はdoneで除外)
+            if not webctrl.finds('bookingSearchList'):
+                found = ar_search(conf, daymin, daymax)
+            continue
+
+        # 全て処理済みなら終了
+        if len(done) == len(dels):
+            break
+
+        # 最終ページなら、キャンセルしていなければ全て確認済み。キャンセルしていれば先頭ページから探し直す
+        rng = ar_resultrange()
+        if rng and rng[2] >= rng[0]:
+            if not cancelled:
+                complete = True
+                break
+            cancelled = 0
+            found = ar_search(conf, daymin, daymax)
+            complete = not found
+            continue
+
+        # 次ページ処理
+        tok = webctrl.mark()
+        if not webctrl.exclick('icnNext', webctrl.By.CLASS_NAME):
+            break # 次ページが押せなければ終了
+        webctrl.wait(WAIT_RESULT, tok, WAIT_SEARCH)
+        g_count['load'] += 1
+
+    # 全ページを確認して無かった予約は削除済み(キャンセル済み)。確認できていなければ個別に削除する
+    for no in dels:
+        if no not in done:
+            if complete:
+                g_logger.info('arr:del no data %s' % (no))
+                done[no] = 0
+            else:
+                g_logger.debug('arr:del not found in list %s' % (no))
+                done[no] = None
+    return done
+
+# 予定取得
+# stateはar_newstateで作成した取得状態。リトライ時は前回の状態を渡すと、読めていないページだけ取得する
+def get_cal_searchlist(conf, group, state):
+    # 開始日(現在)～終了日(range加算)で検索
+    today = datetime.now()
+    daymin = today.replace(hour=0, minute=0, second=0, microsecond=0)
+    daymax = daymin + timedelta(days=conf['range'] - 1)
+    g_logger.debug('arr:get %s to %s' % (daymin, daymax))
+    found = ar_search(conf, daymin, daymax)
+
+    # 「該当する予約がありません」の場合はスキップ
+    if not found:
+        g_logger.info('arr:no data')
+        ar_resetstate(state)
+        return 0, state['ret']
 
     # 全件数totalnumを取得 (例: '全299件中 1〜50件')
-    try:
-        resultNumTxt = webctrl.get('resultNumTxt', webctrl.By.CLASS_NAME)
-        totalnum = int(resultNumTxt[1:resultNumTxt.find('件')])
-    except:
+    rng = ar_resultrange()
+    if not rng:
         g_logger.info('arr:予定リストの件数が取得できませんでした')
-        return 1, []
+        return 1, state['ret']
+    total, bgn, end = rng
+
+    # リトライ中に予約が増減して全件数が変わったら、ページの区切りがずれるため取得済みのページは捨てて最初から読む
+    if state['total'] is not None and state['total'] != total:
+        g_logger.info('arr:全件数が%d件から%d件に変わったため、最初から取得し直します' % (state['total'], total))
+        ar_resetstate(state)
+    state['total'] = total
+
+    ret = state['ret']
+    old = state['old'] # 追加済みセット
+    pages = state['pages']
+    size = end - bgn + 1 # 1ページの件数
+    totalnum = total - state['dups']
+
+    g_logger.debug('arr:%d件のアイテムがヒットしました' % (total))
+
+    # quickget=1なら、件数と先頭ページが前回と同じ事務所は前回の予定を使い、残りのページは読まない
+    # (先頭ページより後ろで件数の変わらない変更(時刻の移動など)は次に件数か先頭ページが変わるまで反映されない)
+    if conf.get('quickget', 0) and not pages:
+        state['summary'] = ar_summary(daymin, daymax, total, ar_searchrows())
+        last = g_quick.get(group)
+        if last and last[0] == state['summary']:
+            g_logger.info('arr:%-4s 件数と先頭ページが前回と同じため、前回の予定を使います' % group)
+            for book in last[1]:
+                ar_adduniq(ret, old, book, 0)
+            return len(ret), ret
+
+    # fetch=csvなら検索結果をCSVで一括取得 (件数が足りなければページ送りで取得する)
+    if conf.get('fetch', 'list') == 'csv' and not pages:
+        books = ar_readcsv(conf, group)
+        if books is not None and len(books) >= totalnum:
+            for book in books:
+                if not ar_adduniq(ret, old, book):
+                    state['dups'] += 1
+                    totalnum -= 1 # カウント上も外しておく
+            return totalnum, ret
+        g_logger.info('arr:ページ送りでの取得に切り替えます')
+
+    # 取得済みのページがあれば、先頭ページから不足しているページへ移動
+    if pages:
+        g_logger.info('arr:取得済み%dページを除いて再取得します' % (len(pages)))
+    if pages.get(bgn, 0) >= min(size, total - bgn + 1):
+        top = ar_nextpage(state, total, size, bgn)
+        if top is None or not ar_gopage(top, bgn, size):
+            return totalnum, ret
+        rng = ar_resultrange()
+        if not rng:
+            return totalnum, ret
+        _, bgn, end = rng
 
-    g_logger.debug('arr:%d件のアイテムがヒットしました' % (totalnum))
-    
     # ページを辿りながら全アイテムを取得(totalnumと同じになるはず)
-    ret = []
-    old = set() # 追加済みセット
     while True:
-        # 抽出した予定をオブジェクトに格納
-        bookary = webctrl.get('bookingSearchList').split('\n')
-        for i in range(0, len(bookary) - (SEARCH_COLUMN - 1), SEARCH_COLUMN):
-            # bookary[i + 0]: 予約番号
-            # bookary[i + 2]: 予約時間
-            # bookary[i + 3]: 名前 → 同期ツールではここに予定の詳細(desc)を格納
-            #                 全角のみだが、なぜか半角スペースが入る事がある(名前が空のとき?)
-            # bookary[i + 5]: 予約メニュー名 (自動入力の場合はconf['automenu']が入っている)
-            # bookary[i + 6]: 「、」区切りのリソース(部屋、人)。リソース名順でソートされている?
+        # 抽出した予定をオブジェクトに格納 (初めて読むページの重複だけ多重登録として扱う)
+        first = bgn not in pages
+        rows = ar_searchrows()
+        for bookary in rows:
+            # bookary[0]: 予約番号
+            # bookary[2]: 予約時間
+            # bookary[3]: 名前 → 同期ツールではここに予定の詳細(desc)を格納
+            #             全角のみだが、なぜか半角スペースが入る事がある(名前が空のとき?)
+            # bookary[5]: 予約メニュー名 (自動入力の場合はconf['automenu']が入っている)
+            # bookary[6]: 「、」区切りのリソース(部屋、人)。リソース名順でソートされている?
 
             # 開始/終了日時の抽出
-            dt = bookary[i + 2].split(' ')
+            dt = bookary[2].split(' ')
             dbgn = dt[2][:10]
             dend = dt[2][:10] #デフォルトは同日        (例：['2025/01/11(土)', '12:34', '2025/02/22(土)', '13:00～15:00'])
             tm = dt[3].split('～')
@@ -155,56 +765,40 @@ def get_cal_searchlist(conf, group):
                 dend = tm[1][:10]
                 tm[1] = dt[4]
 
-            # リソース分割
-            room, person = bookary[i + 6].split('、') # 仮でroom/personに入れる
-            if room not in conf['roomres']:
-                room, person = person, room # 逆なら反転しておく
-
             # 登録オブジェクト作成
-            book = {
-                'ctyp': CAL_TYPE,
-                'tbgn': datetime.strptime(dbgn + ' ' + tm[0], '%Y/%m/%d %H:%M'),
-                'tend': datetime.strptime(dend + ' ' + tm[1], '%Y/%m/%d %H:%M'),
-                'summ': group + '@' + room + '@' + person + '@' + bookary[i + 5] + '@' + bookary[i],
-                'desc': bookary[i + 3].replace(' ', '') # 半角スペースが入ることがあるので削除しておく
-            }
+            book = ar_book(conf, group, bookary[0],
+                           datetime.strptime(dbgn + ' ' + tm[0], '%Y/%m/%d %H:%M'),
+                           datetime.strptime(dend + ' ' + tm[1], '%Y/%m/%d %H:%M'),
+                           bookary[3], bookary[5], bookary[6])
 
             # 念のため同一の予定が無ければ追加
-            sbook = str(book) # 文字列化したオブジェクトで同一チェック
-            if sbook not in old:
-                old.add(sbook)
-                ret.append(book)
-                g_logger.debug('arr:add %s' % (sbook))
-            else:
-                g_logger.warning('arr:多重登録 %s' % (sbook)) # 多重登録が見つかったら警告しておく
+            if not ar_adduniq(ret, old, book, first) and first:
+                state['dups'] += 1
                 totalnum -= 1 # カウント上も外しておく
-        
-        # 次ページ処理
-        if not webctrl.exclick('icnNext', webctrl.By.CLASS_NAME):
-            break # 次ページが押せなければ終了
-
-        # 更新を待って次ページの解析
-        time.sleep(WAIT_SEARCH)
+        pages[bgn] = max(len(rows), pages.get(bgn, 0))
+        if len(rows) < end - bgn + 1:
+            g_logger.debug('arr:page %d-%d %d rows' % (bgn, end, len(rows)))
+
+        # 次に読むページ(未取得or不足)へ移動
+        top = ar_nextpage(state, total, size, bgn)
+        if top is None or not ar_gopage(top, bgn, size):
+            break
+
+        # 更新後の表示範囲で次ページの解析
+        rng = ar_resultrange()
+        if not rng:
+            break
+        _, bgn, end = rng
     return totalnum, ret
 
 def get_cal(conf):
     keep = webctrl.driver()
     if not keep:
-        webctrl.init(conf['devscale'])
+        webctrl.initconf(conf)
 
     # 予定検索ページを開く
-    webctrl.jump(URL_SEARCH)
-
-    # ユーザ/パスワード画面に遷移した？
-    if 'login' in webctrl.url():
-        ar_login(conf)
-        #webctrl.jump(URL_SEARCH) # 再度予定検索ページに移動
-
-    # 店舗選択画面なら先頭を叩いておく
-    selst = webctrl.gets('h1', webctrl.By.TAG_NAME)
-    if selst and '選択' in selst[0]:
-        g_logger.debug('arr:select top page1 %s' % (selst[0]))
-        webctrl.click('storeList__list__innerBox__name', webctrl.By.CLASS_NAME)
+    login(conf)
+    ar_loadquick(conf)
 
     # 応答値格納用
     #old = set() # 追加済みセット （→グループ別でチェックするためコメントアウト）
@@ -212,16 +806,18 @@ def get_cal(conf):
 
     for group in conf['group']:
         # 正しくリスト取得ができない場合がある。リトライ回数を設定
+        # リトライ時は取得済みのページを残して、不足しているページだけ再取得する
         diffretry = conf['diffretry']
+        state = ar_newstate()
+        last = 0 # 前回の取得数
         while True:
-            # 事務所確認
-            g_logger.debug('arr:group %s' % (group))
-            ar_checkgroup(group)
-
-            # 対象グループの予定数と予定リストを取得
-            totalnum, slist = get_cal_searchlist(conf, group)
+            # 対象グループの予定数と予定リストを取得 (例外時はstateに残した続きからリトライ)
+            # リトライ回数は1ページ単位 (読めたページが増えていれば数え直す)
+            totalnum, slist = ar_retry(conf, lambda: ar_getgroup(conf, group, state), URL_SEARCH, lambda: sum(state['pages'].values()))
             cnt = len(slist)
             if totalnum <= cnt: #多い場合も許容(別ユーザが同タイミングで追加する可能性)
+                if 'summary' in state:
+                    g_quick[group] = (state['summary'], list(slist)) # 全件取得できた事務所だけ次回のquickgetに使う
                 break
 
             # ヒット件数と取得できた件数が異なる(old重複は除く)
@@ -235,24 +831,13 @@ def get_cal(conf):
             
             # リトライ回数だけ繰り返す
             diffretry -= 1
-            if diffretry % 2:
-                # 残り奇数回のリトライは、keep設定を無視して強制的にChromeを再立ち上げする
-                webctrl.deinit()
-                time.sleep(WAIT_AFTER)
-                webctrl.init(conf['devscale'])
+            if diffretry % 2 and cnt <= last:
+                # 前回から増えずに残り奇数回のリトライは、keep設定を無視して強制的にChromeを再立ち上げする
+                webctrl.restart()
 
                 # 予定検索ページを開く
-                webctrl.jump(URL_SEARCH)
-
-                # ユーザ/パスワード画面に遷移した？
-                if 'login' in webctrl.url():
-                    ar_login(conf)
-
-                # 店舗選択画面なら先頭を叩いておく
-                selst = webctrl.gets('h1', webctrl.By.TAG_NAME)
-                if selst and '選択' in selst[0]:
-                    g_logger.debug('arr:select top page1 %s' % (selst[0]))
-                    webctrl.click('storeList__list__innerBox__name', webctrl.By.CLASS_NAME)
+                login(conf)
+            last = cnt
 
         if cnt:
             # グループごとに取得した件数を表示しておく
@@ -275,232 +860,350 @@ def get_cal(conf):
         webctrl.deinit()
 
     # 中間ファイルを保存しておく
-    with open(MIDDLE_FILE, mode='w', encoding='utf-8')as f:
-        yaml.safe_dump(ret, f, allow_unicode=True)
+    snapshot.save(MIDDLE_FILE, ret)
+    ar_savequick(conf)
 
     return ret
 
+# 1操作をリトライ付きで実行 (ブラウザを作り直した場合はurlのページを開き直してから再実行)
+# 続きから再開できる一括処理は、progress(処理済みの数など)が進んでいればリトライ回数を数え直す
+def ar_retry(conf, func, url = URL_APPEND, progress = None):
+    return webctrl.retry(func, conf.get('opretry', OP_RETRY) + 1, conf.get('opbackoff', webctrl.RETRY_BACKOFF), lambda: ar_open(conf, url), progress)
+
+# 1グループの事務所を選んで予定リストを取得 (get_cal_searchlistの戻り値)
+def ar_getgroup(conf, group, state):
+    g_logger.debug('arr:group %s' % (group))
+    ar_checkgroup(group)
+    return get_cal_searchlist(conf, group, state)
+
+# 予定を1件追加。追加したら1、しなければ0、処理を継続できなければNone
+# sentはリトライ間で共有する辞書。登録ボタンを押した後の例外では重複登録を避けるため再実行しない
+def ar_addone(conf, i, sent):
+    tbgn  = i.tbgn.strftime('%Y/%m/%d %H:%M')
+    tend  = i.tend.strftime('%Y/%m/%d %H:%M')
+    if sent:
+        g_logger.warning('arr:登録後に中断したため再登録しません。登録されているか確認してください %s～%s:%s' % (tbgn, tend, i.desc))
+        return 0
+
+    # 事務所確認 & 予定追加のページへ (状態が変わっていなければ何もしない)
+    ar_checkgroup(i.store)
+    ar_open(conf, URL_APPEND)
+
+    # ボタンが押しやすいように日単位に変更 → 変わらず、削除
+    # webctrl.fclick(webctrl.search('label', '日', webctrl.By.TAG_NAME))
+
+    # 空いている予定をクリックし、メニューをaddmenuにセットして詳細画面を開く
+    journal.pending(i)
+    if not ar_openform(conf):
+        journal.failed(i, 'form')
+        g_logger.error('arr:予定の追加ボタンが押せませんでした')
+        if conf['waitbtnerror']:
+            ret = input('手動で操作すると継続できる可能性があります。\n手動操作して処理を続けますか？(y/n):')
+            if ret != 'y' and ret != 'Y':
+                g_logger.info('追加処理をキャンセルしました')
+                return None
+        return 0
+
+    # 日時/場所/人/名前を入力
+    if not ar_fillform(conf, i):
+        return None # 予期せぬ事態。継続しても同じなので停止する。
+
+    # 少しだけ設定を見えるようにする
+    time.sleep(WAIT_SHOW)
+    webctrl.click('rmRegistButton')
+
+    # 継続するか確認する設定なら入力待ち
+    if conf['waitadd']:
+        ret = input('追加処理を継続しますか？(y/n):')
+        if ret != 'y' and ret != 'Y':
+            g_logger.info('追加処理をキャンセルしました')
+            ar_closeform()
+            return 0
+
+    webctrl.settle(WAIT_SHOW)
+    tok = webctrl.mark()
+    sent['regist'] = 1
+    journal.sent(i) # 異常終了後の再実行でも再登録しないように記録
+    webctrl.click('rmRegistButton')
+    webctrl.wait(since=tok, fallback=WAIT_SHOW) # 登録完了待ち
+    g_count['load'] += 1
+
+    # 上手く押せなかった場合はエラーを出す
+    if webctrl.get('rmRegistButton'):
+        g_logger.error('arr:failed %s～%s:%s' % (tbgn, tend, i.desc))
+        journal.failed(i, 'regist')
+        ar_closeform()
+        return 0
+
+    no = ar_lastno()
+    journal.applied(i, no)
+    idmap.put(i, no) # サイボウズUIDとの対応を記録 (番号が取れない場合は次回の同期時に記録)
+    return 1 # 追加成功
+
+# 詳細画面に予定iの日時/場所/人/名前を入力。場所/人の選択欄が見つからなければ0
+def ar_fillform(conf, i):
+    tbgn  = i.tbgn.strftime('%Y/%m/%d %H:%M')
+    tend  = i.tend.strftime('%Y/%m/%d %H:%M')
+
+    # 開始時間を設定 (2025/01/23 12:34)
+    webctrl.set('rmStartDate',       tbgn[  :10])
+    webctrl.settle(WAIT_SET)
+    webctrl.selindexvalue('rmStartTimeHour',   tbgn[11:13])
+    webctrl.settle(WAIT_SET)
+    webctrl.selindexvalue('rmStartTimeMinute', tbgn[14:16])
+    webctrl.settle(WAIT_SET)
+
+    # 終了時間を設定
+    webctrl.set('rmEndDate',         tend[  :10])
+    webctrl.settle(WAIT_SET)
+    webctrl.selindexvalue('rmEndTimeHour',     tend[11:13])
+    webctrl.settle(WAIT_SET)
+    webctrl.selindexvalue('rmEndTimeMinute',   tend[14:16])
+    webctrl.settle(WAIT_SET)
+    webctrl.click('exItem01', webctrl.By.NAME) # カレンダのフォーカス外し
+
+    # 場所/人をセット
+    webctrl.settle(WAIT_SET)
+    sel = webctrl.finds('resrcSelect', webctrl.By.CLASS_NAME)
+    if len(sel) < 2:
+        g_logger.error('arr:Invalid menu %d' % (len(sel)))
+        return 0
+    webctrl.fset(sel[0], i.room)
+    webctrl.fset(sel[1], i.person)
+
+    # セイは全角カナのみ。登録した文字をセット
+    webctrl.set('lastNmKn', conf['addsei'], webctrl.By.NAME)
+    webctrl.set('lastNm',   i.desc[        :MAX_DESC    ], webctrl.By.NAME)
+    webctrl.set('firstNm',  i.desc[MAX_DESC:MAX_DESC * 2], webctrl.By.NAME)
+    return 1
+
+# 詳細画面を閉じる (×ボタン & OK)
+def ar_closeform():
+    webctrl.click('js-popupRegistClose', webctrl.By.CLASS_NAME)
+    webctrl.settle(WAIT_AFTER)
+    webctrl.click('js-popupAlertClose')
+    webctrl.settle(WAIT_AFTER)
+
+# 予定を1件、予約番号で検索して削除 (一覧から削除できなかった場合)。削除したら1
+def ar_delone(conf, i):
+    no = i.no
+
+    ## 予定検索ページを開く
+    ar_open(conf, URL_SEARCH, 1)
+    webctrl.set('bookingNo', no)
+
+    # 検索実行
+    tok = webctrl.mark()
+    webctrl.click('btn-search', webctrl.By.CLASS_NAME)
+    webctrl.wait(WAIT_RESULT, tok, WAIT_SEARCH)
+    g_count['load'] += 1
+
+    # 検索ヒットが１件かつ、サイボウズ入力の場合だけ削除
+    rows = ar_searchrows()
+    if len(rows) != 1:
+        g_logger.warning('arr:del 検索数異常 %d' % (len(rows)))
+        return 0
+    bookary = rows[0]
+
+    # サイボウズ追加でなければ警告
+    if bookary[5] != conf['addmenu']:
+        g_logger.warning('arr:del 検索タイプ異常 "%s"' % (bookary[5]))
+        return 0
+
+    # 「該当する予約がありません」の場合はスキップ
+    if 'ありません' in webctrl.get('dialogueMessage'):
+        g_logger.info('arr:del no data')
+        webctrl.click('closeErrDialogue')
+        return 0
+
+    # 削除実行
+    if not ar_cancel(conf, webctrl.find('js-popupCancelTrigger', webctrl.By.CLASS_NAME)):
+        return 0
+    journal.applied(i, no)
+    return 1
+
+# 予定を1件、予約番号で検索して変更画面で日時/名前を更新 (cb2arで削除+追加をまとめた予定)。更新したら1、停止はNone
+# 変更ボタンや変更画面が見つからない場合は、従来通り削除+追加で反映する
+def ar_updone(conf, i, sent):
+    tbgn  = i.tbgn.strftime('%Y/%m/%d %H:%M')
+    tend  = i.tend.strftime('%Y/%m/%d %H:%M')
+    no    = i.no
+    if sent:
+        g_logger.warning('arr:登録後に中断したため再更新しません。更新されているか確認してください %s～%s:%s' % (tbgn, tend, i.desc))
+        return 0
+
+    # 予約番号で検索
+    ar_checkgroup(i.store)
+    ar_open(conf, URL_SEARCH, 1)
+    webctrl.set('bookingNo', no)
+    tok = webctrl.mark()
+    webctrl.click('btn-search', webctrl.By.CLASS_NAME)
+    webctrl.wait(WAIT_RESULT, tok, WAIT_SEARCH)
+    g_count['load'] += 1
+
+    # 検索ヒットが１件かつ、サイボウズ入力の場合だけ更新
+    rows = ar_searchrows()
+    if len(rows) != 1:
+        g_logger.warning('arr:upd 検索数異常 %d' % (len(rows)))
+        return 0
+    if rows[0][5] != conf['addmenu']:
+        g_logger.warning('arr:upd 検索タイプ異常 "%s"' % (rows[0][5]))
+        return 0
+
+    # 予約の行にある変更ボタンで変更画面を開く
+    journal.pending(i)
+    btn = None
+    for tr in webctrl.finds('tr', webctrl.By.TAG_NAME, webctrl.find('bookingSearchList')):
+        if no in tr.text:
+            btn = webctrl.search('a', EDIT_BUTTON, webctrl.By.TAG_NAME, tr) or webctrl.search('button', EDIT_BUTTON, webctrl.By.TAG_NAME, tr)
+            break
+    if btn:
+        webctrl.fclick(btn)
+    if not btn or not webctrl.wait_elem('rmStartDate', clickable=1, timeout=WAIT_FORM, fallback=WAIT_AFTER):
+        # 変更できない場合は削除+追加
+        g_logger.debug('arr:upd edit form not found %s' % (no))
+        journal.failed(i, 'edit')
+        old = i.replace(tbgn=i.obgn, tend=i.oend, desc=i.odesc)
+        if not ar_delone(conf, old):
+            return 0
+        res = ar_addone(conf, i.replace(ctyp='+', summ=i.place), sent)
+        if res:
+            journal.applied(i, no)
+        return res
+
+    # 日時/場所/人/名前を入力
+    if not ar_fillform(conf, i):
+        return None # 予期せぬ事態。継続しても同じなので停止する。
+    time.sleep(WAIT_SHOW)
+    webctrl.click('rmRegistButton')
+
+    # 継続するか確認する設定なら入力待ち
+    if conf['waitadd']:
+        ret = input('更新処理を継続しますか？(y/n):')
+        if ret != 'y' and ret != 'Y':
+            g_logger.info('更新処理をキャンセルしました')
+            ar_closeform()
+            return 0
+
+    webctrl.settle(WAIT_SHOW)
+    tok = webctrl.mark()
+    sent['regist'] = 1
+    journal.sent(i) # 異常終了後の再実行でも再登録しないように記録
+    webctrl.click('rmRegistButton')
+    webctrl.wait(since=tok, fallback=WAIT_SHOW) # 登録完了待ち
+    g_count['load'] += 1
+
+    # 上手く押せなかった場合はエラーを出す
+    if webctrl.get('rmRegistButton'):
+        g_logger.error('arr:upd failed %s～%s:%s' % (tbgn, tend, i.desc))
+        journal.failed(i, 'regist')
+        ar_closeform()
+        return 0
+
+    journal.applied(i, no)
+    idmap.put(i.replace(summ=i.place), no) # 予約番号は変わらないが、UIDとの対応を記録し直す
+    return 1 # 更新成功
+
 # 予定設定 ########################################################################
-# グループ切り替えを最小限にするために、mergeは事務所順に並べておくことが望ましい
+# グループ切り替えを最小限にするために、mergeはar_scheduleで事務所単位に並べ替えてから処理する
 def set_cal(conf, merge):
     retcount = 0
     keep = webctrl.driver()
     if not keep:
-        webctrl.init(conf['devscale'])
-
-    # 予定追加のページを開く
-    webctrl.jump(URL_APPEND)
-
-    # ユーザ/パスワード画面に遷移した？
-    if 'login' in webctrl.url():
-        ar_login(conf)
+        webctrl.initconf(conf)
 
-    # 店舗選択画面なら先頭を叩いておく
-    selst = webctrl.gets('h1', webctrl.By.TAG_NAME)
-    if selst and '選択' in selst[0]:
-        g_logger.debug('arr:select top page2 %s' % (selst[0]))
-        webctrl.click('storeList__list__innerBox__name', webctrl.By.CLASS_NAME)
+    # 実行順を決めて見積もりを表示
+    merge, estsw, estld = ar_schedule(conf, merge)
+    g_count['switch'] = g_count['load'] = 0
+    g_logger.debug('arr:schedule %s 事務所切替%d回 ページ読込%d回' % (conf.get('setorder', 'store'), estsw, estld))
 
     # 予定追加のページを開く
-    webctrl.jump(URL_APPEND)
-
-    count = 0 # 表示用のカウンタ
-    for i in merge:
-        count += 1
-        
-        tbgn  = i['tbgn'].strftime('%Y/%m/%d %H:%M')
-        tend  = i['tend'].strftime('%Y/%m/%d %H:%M')
-        summ  = i['summ'].split('@')
-        group = summ[0]
-
-        if i['ctyp'] == '+': # 追加マーク
-            # 追加が無効化されている場合はログ出力のみ
-            if conf['skipadd']:
-                g_logger.info('arr:skip reg %s～%s:%s %s' % (tbgn, tend, i['summ'], i['desc']))
-                continue
+    ar_open(conf, URL_APPEND)
 
-            # 追加処理開始
-            g_logger.info('追加:#%d/%d %s-%s %s %s' % (count, len(merge), tbgn, tend[-5:], i['summ'], i['desc']))
-
-            # 事務所確認
-            ar_checkgroup(group)
-
-            # ボタンが押しやすいように日単位に変更 → 変わらず、削除
-            # webctrl.fclick(webctrl.search('label', '日', webctrl.By.TAG_NAME))
-
-            # →schldCellが複数あり、場所によりエラーになる。例外なくなるまで叩く
-            # 空いている予定をクリック
-            for elm in webctrl.finds('schldCell', webctrl.By.CLASS_NAME):
-                try:
-                    webctrl.fmove(elm, 0)
-                    time.sleep(WAIT_AFTER) # クリックできる場所まで移動するのを待つ
-                    webctrl.driver().execute_script('arguments[0].click();', elm)
-                    break # 例外が発生しなかったら継続
-                except:
-                    pass
-
-                # ここは上手く押せないことがあるので、もう1回トライ
-                try:
-                    webctrl.fmove(elm)
-                    time.sleep(WAIT_AFTER) # クリックできる場所まで移動するのを待つ
-                    webctrl.fclick(elm)
-                    break # 例外が発生しなかったら継続
-                except:
-                    pass
-
-                # ここは上手く押せないことがあるので、もう1回トライ
-                try:
-                    webctrl.fmove(elm, 0)
-                    time.sleep(WAIT_AFTER) # クリックできる場所まで移動するのを待つ
-                    webctrl.fclick(elm, 0)
-                    break # 例外が発生しなかったら継続
-                except:
-                    pass
+    # 削除予定は事務所単位にまとめておく (事務所 → 予約番号 → (表示用の番号, 予定))
+    dels = {}
+    for count, i in enumerate(merge, 1):
+        if i.ctyp == '-' and len(i.no) >= 8:
+            dels.setdefault(i.store, {})[i.no] = (count, i)
+    delres = {} # 事務所 → ar_delbatchの結果
 
-            else:
-                g_logger.error('arr:予定の追加ボタンが押せませんでした')
-                if conf['waitbtnerror']:
-                    ret = input('手動で操作すると継続できる可能性があります。\n手動操作して処理を続けますか？(y/n):')
-                    if ret != 'y' and ret != 'Y':
-                        g_logger.info('追加処理をキャンセルしました')
-                        if not keep:
-                            webctrl.deinit()
-                        return retcount
-                continue
-
-            # メニューをaddmenuにセットして詳細画面を開く
-            webctrl.set('bookingMenuBalloonSelectMenu', conf['addmenu'])
-            webctrl.selindex('startHour',   0, webctrl.By.CLASS_NAME)
-            webctrl.selindex('startMinute', 0, webctrl.By.CLASS_NAME)
-            time.sleep(WAIT_SET) # 入力確認も兼ねて、表示したまま少し待つ
-            webctrl.click('bookingRegist')
-            time.sleep(WAIT_SET) # 入力確認も兼ねて、表示したまま少し待つ
-
-
-            # 開始時間を設定 (2025/01/23 12:34)
-            webctrl.set('rmStartDate',       tbgn[  :10])
-            time.sleep(WAIT_SET)
-            webctrl.selindexvalue('rmStartTimeHour',   tbgn[11:13])
-            time.sleep(WAIT_SET)
-            webctrl.selindexvalue('rmStartTimeMinute', tbgn[14:16])
-            time.sleep(WAIT_SET)
-
-            # 終了時間を設定
-            webctrl.set('rmEndDate',         tend[  :10])
-            time.sleep(WAIT_SET)
-            webctrl.selindexvalue('rmEndTimeHour',     tend[11:13])
-            time.sleep(WAIT_SET)
-            webctrl.selindexvalue('rmEndTimeMinute',   tend[14:16])
-            time.sleep(WAIT_SET)
-            webctrl.click('exItem01', webctrl.By.NAME) # カレンダのフォーカス外し
-
-            # 場所/人をセット
-            sel = webctrl.finds('resrcSelect', webctrl.By.CLASS_NAME)
-            time.sleep(WAIT_SET) # 入力確認も兼ねて、表示したまま少し待つ
-            if len(sel) < 2:
-                g_logger.error('arr:Invalid menu %d' % (len(sel)))
-                break # 予期せぬ事態。継続しても同じなので停止する。
-            webctrl.fset(sel[0], summ[1])
-            webctrl.fset(sel[1], summ[2])
-
-            # セイは全角カナのみ。登録した文字をセット
-            webctrl.set('lastNmKn', conf['addsei'], webctrl.By.NAME)
-            webctrl.set('lastNm',   i['desc'][        :MAX_DESC    ], webctrl.By.NAME)
-            webctrl.set('firstNm',  i['desc'][MAX_DESC:MAX_DESC * 2], webctrl.By.NAME)
- 
-            # 少しだけ設定を見えるようにする
-            time.sleep(WAIT_SHOW)
-            webctrl.click('rmRegistButton')
-
-            # 継続するか確認する設定なら入力待ち
-            if conf['waitadd']:
-                ret = input('追加処理を継続しますか？(y/n):')
-                if ret != 'y' and ret != 'Y':
-                    g_logger.info('追加処理をキャンセルしました')
-                    # ×ボタン & OK
-                    webctrl.click('js-popupRegistClose', webctrl.By.CLASS_NAME)
-                    time.sleep(WAIT_AFTER)
-                    webctrl.click('js-popupAlertClose')
-                    time.sleep(WAIT_AFTER)
+    # 予約番号の対応表は溜めておき、最後にまとめて保存する (例外で抜けた場合も保存)
+    try:
+        count = 0 # 表示用のカウンタ
+        for i in merge:
+            count += 1
+        
+            tbgn  = i.tbgn.strftime('%Y/%m/%d %H:%M')
+            tend  = i.tend.strftime('%Y/%m/%d %H:%M')
+            group = i.store
+
+            if i.ctyp == '+': # 追加マーク
+                # 追加が無効化されている場合はログ出力のみ
+                if conf['skipadd']:
+                    g_logger.info('arr:skip reg %s～%s:%s %s' % (tbgn, tend, i.summ, i.desc))
                     continue
 
-            time.sleep(WAIT_SHOW)
-            webctrl.click('rmRegistButton')
-            time.sleep(WAIT_SHOW)
-
-            # 上手く押せなかった場合はエラーを出す
-            if webctrl.get('rmRegistButton'):
-                g_logger.error('arr:failed %s～%s:%s' % (tbgn, tend, i['desc']))
-                # ×ボタン & OK
-                webctrl.click('js-popupRegistClose', webctrl.By.CLASS_NAME)
-                time.sleep(WAIT_AFTER)
-                webctrl.click('js-popupAlertClose')
-                time.sleep(WAIT_AFTER)
-            else:
-                retcount += 1 # 追加成功
+                # 追加処理開始
+                g_logger.info('追加:#%d/%d %s-%s %s %s' % (count, len(merge), tbgn, tend[-5:], i.summ, i.desc))
+                sent = {} # 登録ボタンを押したか (リトライ間で共有)
 
-        if i['ctyp'] == '-': # 削除マーク
-            if conf['skipdel']:
-                g_logger.info('arr:skip del %s～%s:%s %s' % (tbgn, tend, i['summ'], i['desc']))
-                continue
+                # 1件単位でリトライ (処理を継続できない場合は終了)
+                res = ar_retry(conf, lambda: ar_addone(conf, i, sent), URL_APPEND)
+                if res is None:
+                    break
+                retcount += res
 
-            # 予約番号が格納されているかチェック
-            if len(summ) < 5 or len(summ[4]) < 8:
-                g_logger.error('arr:invalid booking No %s' % summ)
-                continue
-
-            ## 事務所確認
-            ar_checkgroup(group)
-
-            ## 予定検索ページを開く
-            webctrl.jump(URL_SEARCH)
+            if i.ctyp == '-': # 削除マーク
+                if conf['skipdel']:
+                    g_logger.info('arr:skip del %s～%s:%s %s' % (tbgn, tend, i.summ, i.desc))
+                    continue
 
-            # 削除処理追加
-            g_logger.info('削除:#%d/%d %s-%s %s %s' % (count, len(merge), tbgn, tend[-5:], i['summ'], i['desc']))
-            webctrl.set('bookingNo', summ[4])
+                # 予約番号が格納されているかチェック
+                if len(i.no) < 8:
+                    g_logger.error('arr:invalid booking No %s' % i.summ)
+                    continue
 
-            # 検索実行
-            webctrl.click('btn-search', webctrl.By.CLASS_NAME)
-            time.sleep(WAIT_SEARCH)
+                # 事務所の最初の削除予定で、事務所内の削除予定をまとめて削除 (リトライ時は続きから)
+                if group not in delres:
+                    delres[group] = {}
+                    # リトライ回数は1件単位 (処理済みの予約が増えていれば数え直す)
+                    ar_retry(conf, lambda: ar_delbatch(conf, group, dels[group], len(merge), delres[group]), URL_SEARCH, lambda: len(delres[group]))
+                res = delres[group].get(i.no)
+                if res is not None:
+                    retcount += res
+                    if res:
+                        journal.applied(i, i.no)
+                    continue
 
-            # 検索ヒットが１件かつ、サイボウズ入力の場合だけ削除
-            bookary = webctrl.get('bookingSearchList').split('\n')
-            if len(bookary) != SEARCH_COLUMN:
-                g_logger.warning('arr:del 検索数異常 %d' % (len(bookary)))
-                continue
+                # 一覧から削除できなかった予約は個別に検索して削除
+                g_logger.info('削除:#%d/%d %s-%s %s %s' % (count, len(merge), tbgn, tend[-5:], i.summ, i.desc))
+                retcount += ar_retry(conf, lambda: ar_delone(conf, i), URL_SEARCH)
 
-            # サイボウズ追加でなければ警告
-             
-            if bookary[5] != conf['addmenu']:
-                g_logger.warning('arr:del 検索タイプ異常 "%s"' % (bookary[5]))
-                continue
-
-            # 「該当する予約がありません」の場合はスキップ
-            if 'ありません' in webctrl.get('dialogueMessage'):
-                g_logger.info('arr:del no data')
-                webctrl.click('closeErrDialogue')
-                continue
+            if i.ctyp == '~': # 更新マーク (削除+追加をまとめたもの)
+                if conf['skipadd'] or conf['skipdel']:
+                    g_logger.info('arr:skip upd %s～%s:%s %s' % (tbgn, tend, i.summ, i.desc))
+                    continue
 
-            # 継続するか確認する設定なら入力待ち
-            if conf['waitdel']:
-                ret = input('削除処理を継続しますか？(y/n):')
-                if ret != 'y' and ret != 'Y':
-                    g_logger.info('削除処理をキャンセルしました')
+                # 予約番号が格納されているかチェック
+                if len(i.no) < 8:
+                    g_logger.error('arr:invalid booking No %s' % i.summ)
                     continue
 
-            # 削除実行
-            webctrl.click('js-popupCancelTrigger', webctrl.By.CLASS_NAME)
-            time.sleep(WAIT_AFTER)
-            webctrl.set('cancelReason', conf['delreason']) # キャンセル理由
-            time.sleep(WAIT_SET)
-            webctrl.click('doCancel')
-            time.sleep(WAIT_AFTER)
-            retcount += 1 # 削除成功
+                # 更新処理開始
+                g_logger.info('更新:#%d/%d %s-%s %s %s (%s-%s %s)' % (count, len(merge), tbgn, tend[-5:], i.summ, i.desc, i.obgn.strftime('%Y/%m/%d %H:%M'), i.oend.strftime('%H:%M'), i.odesc))
+                sent = {} # 登録ボタンを押したか (リトライ間で共有)
+                res = ar_retry(conf, lambda: ar_updone(conf, i, sent), URL_SEARCH)
+                if res is None:
+                    break
+                retcount += res
+    finally:
+        idmap.flush()
 
     # 開放
     if not keep:
         webctrl.deinit()
-    
+
+    ar_report(estsw, estld)
     return retcount
 
 ################################################################################
@@ -513,10 +1216,9 @@ def get_one_cal(conf):
 ################################################################################
 if __name__ == '__main__':
     # 直呼び出しは読み出しテスト
-    with open(CONF_FILE, 'r', encoding='utf-8') as f:
-        confs = yaml.safe_load(f)
+    confs = loadconf.load(CONF_FILE)
 
-    conf = next(filter(lambda c: c['file'] == CAL_TYPE, confs['cals']), None)
+    conf = confs and next(filter(lambda c: c['file'] == CAL_TYPE, confs['cals']), None)
     if conf:
         ret = get_cal(conf)
         print(ret)
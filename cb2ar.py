@@ -5,16 +5,33 @@
 #
 # 2025.03.15 rinos4u	new
 # 2025.03.23 rinos4u	一致チェックにdescを含めるか設定できるように変更
+# 2026.10.18 rinos4u	サイボウズUID→予約番号の対応表(idmap)で一致を判定し、対応表に無い予定だけ文字列比較する
+# 2026.10.18 rinos4u	時刻が移動した予定の削除+追加を更新(~)にまとめるように変更(movepair)
+# 2026.10.18 rinos4u	比較キーをタプル化し、deepcopy/文字列ソートを廃止 (大量予定の差分を高速化)
+# 2026.10.18 rinos4u	予定が多い場合(difflog)は1件ごとのデバッグログを省略
+# 2026.10.18 rinos4u	設定読み込み時のコンパイル(compile_conf)を追加し、正規表現/タプル/逆引き表を予定比較のたびに作らないように変更
+# 2026.10.18 rinos4u	予定を共通のEventで扱い、summの分割をEventの事務所/部屋/人/メニュー/予約番号の参照に変更
+# 2026.10.18 rinos4u	中間ファイルをsnapshot(既定はバイナリ)で読み書きするように変更
+# 2026.10.18 rinos4u	前回の実行からの予定の変更を実行履歴DB(eventdb)で確認してログに出す
+# 2026.10.18 rinos4u	対応表で一致した予定の名前が変わっていれば(compdesc=1)更新(~)にする
+# 2026.10.18 rinos4u	前回の実行よりサイボウズの予定が大きく減っていたら削除を行わない(dropguard)
+# 2026.10.18 rinos4u	中間ファイルはdifflogと同じ条件(middump)でのみ書き出す (大量予定の差分を高速化)
+# 2026.10.18 rinos4u	dropguardは既定で無効にし、前回の予定は実行履歴DBの期間検索(prev_events)で数える
 
 ################################################################################
 # import
 ################################################################################
-import yaml
-import copy
 import re
 import unicodedata
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
 from datetime import datetime, timedelta
 
+import idmap
+import loadconf
+import snapshot
+import eventdb
+from event import Event
 from logconf import g_logger
 
 ################################################################################
@@ -26,16 +43,27 @@ CAL_CYBOZU = 'cybozu'
 CAL_ARR    = 'airr'
 
 CONF_FILE = 'config.yaml'
-MIDDLE_FILE1 = 'log/mid_cb2ar1.yaml'
-MIDDLE_FILE2 = 'log/mid_cb2ar2.yaml'
+MIDDLE_FILE1 = 'log/mid_cb2ar1' # 拡張子は形式(snapshot)に応じて付く
+MIDDLE_FILE2 = 'log/mid_cb2ar2'
+MERGE_FILE   = 'log/mid_merge'
 
 # 名前欄に入れられる最大文字列
 MAX_DESC  = 20
 COMP_DESC = 40 # DESCの比較長さ (姓20文字+名20文字で最大40文字まで)
 
+# 1件ごとの判定をデバッグログに出す予定数の上限 (difflog未指定時)
+DIFFLOG_MAX = 5000
+
 # 開始/終了時刻の間隔の最小値[s]
 MINIMAL_DIFF = 10 * 60 # 最低でも10分以上が必要
 
+# 予定の移動(削除+追加→更新)の判定 (movewindow/movesim未指定時)
+MOVE_WINDOW = 24  # 開始時刻の差がこの時間[h]以内
+MOVE_SIM    = 0.8 # 名前の類似度(0～1)がこの値以上
+
+# サイボウズの予定が前回の実行からこの割合を超えて減ったら、取得の失敗を疑って削除しない (dropguard未指定時。0:無効)
+DROP_GUARD = 0
+
 ################################################################################
 # globals
 ################################################################################
@@ -50,43 +78,166 @@ TO_ZENKAKU = str.maketrans(''.join(chr(0x20 + i) for i in range(95)), '　' + ''
 def normalize_text(s):
     return unicodedata.normalize('NFKC', s.encode('shift-jis', errors='replace').decode('shift-jis')).translate(TO_ZENKAKU)
 
+# 比較用の名前 (Airリザーブは姓[20]+名[20]に分けて格納され、それぞれ前後の全角スペースが削除される)
+def comp_desc(zendesc):
+    return zendesc[:MAX_DESC].strip('　') + zendesc[MAX_DESC:MAX_DESC * 2].strip('　')
+
+# 同じ事務所@部屋@人で開始時刻が近く、名前が似ている削除と追加の組を、予約を編集する更新(~)にまとめる
+# 更新はsummに削除側(予約番号付き)、日時/descに追加側、obgn/oend/odescに変更前の値を持つ
+def pair_moves(conf, ret, trace = 1):
+    window = timedelta(hours=conf.get('movewindow', MOVE_WINDOW))
+    sim    = conf.get('movesim', MOVE_SIM)
+
+    # 追加予定を事務所@部屋@人ごとに開始時刻順で索引 (比較用の名前は同じ会議の予定で共有して1回だけ作る)
+    adds   = {}
+    cdescs = {}
+    for item in ret:
+        if item.ctyp == '+':
+            cdesc = cdescs.get(item.desc)
+            if cdesc is None:
+                cdesc = cdescs[item.desc] = comp_desc(item.desc)
+            adds.setdefault(item.summ, []).append((item.tbgn, cdesc, item))
+    starts = {}
+    for summ, lst in adds.items():
+        lst.sort(key=lambda x: x[0])
+        starts[summ] = [x[0] for x in lst]
+
+    # 削除予定ごとに、開始時刻が±window内の追加予定から、名前が似ていて時刻が最も近いものを選ぶ
+    # 時刻の近い順に調べ、類似度は上限値(real_quick_ratio/quick_ratio)で足切りしてから計算する
+    used  = set() # 更新にまとめた追加予定 (id)
+    moved = set() # 更新にまとめた削除予定 (id)
+    upd   = []
+    sm    = SequenceMatcher(None)
+    for item in ret:
+        if item.ctyp != '-':
+            continue
+        summ = item.place
+        lst  = adds.get(summ)
+        if not lst:
+            continue
+        lo = bisect_left (starts[summ], item.tbgn - window)
+        hi = bisect_right(starts[summ], item.tbgn + window)
+        desc = item.desc[:COMP_DESC]
+        seq2 = False # 類似度の計算が必要になった時だけ削除側を準備する
+        for _, cdesc, add in sorted(lst[lo:hi], key=lambda a: abs(a[0] - item.tbgn)):
+            if id(add) in used:
+                continue
+            if cdesc == desc:
+                break
+            if not seq2:
+                sm.set_seq2(desc)
+                seq2 = True
+            sm.set_seq1(cdesc)
+            if sm.real_quick_ratio() >= sim and sm.quick_ratio() >= sim and sm.ratio() >= sim:
+                break
+        else:
+            continue
+        used.add(id(add))
+        moved.add(id(item))
+        upd.append(add.replace(ctyp='~', summ=item.summ, obgn=item.tbgn, oend=item.tend, odesc=item.desc))
+        if trace:
+            g_logger.debug('c2a:move %s %s -> %s' % (item.summ, item.tbgn, add.tbgn))
+
+    return [x for x in ret if id(x) not in used and id(x) not in moved] + upd
+
 ################################################################################
 # Plugin API
 ################################################################################
+# 設定のコンパイル (loadconfから設定読み込み時に1回だけ呼ばれる)
+# 除外/無視の条件はタプル/正規表現に、曜日ごとのSUMM変更は曜日 → [(正規表現, 置換文字列)] にしておく
+# 逆引き表として、事務所 → Airリザーブの部屋(stores)も作る
+def compile_conf(conf):
+    for key in ('room', 'person', 'noroom', 'noperson', 'automenu'):
+        if key not in conf:
+            raise KeyError(key)
+    for name, loc in conf['room'].items():
+        if len(loc) != 2:
+            raise ValueError('room %s: %s' % (name, loc))
+    conf['room']     = {name: tuple(loc) for name, loc in conf['room'].items()}
+    conf['deldesc']  = tuple(conf.get('deldesc') or ()) # 先頭一致での削除用 (startswith用にタプル化)
+    conf['skipdesc'] = re.compile(conf.get('skipdesc') or '(?!)') # 正規表現用 (未指定なら何にも一致しない)
+    conf['eject']    = tuple(conf.get('eject') or ())   # 除外者 (startswith用にタプル化)
+    conf['compdesc'] = conf.get('compdesc', 1)
+    conf['dropguard'] = conf.get('dropguard', DROP_GUARD)
+    if not 0 <= conf['dropguard'] < 1:
+        raise ValueError('dropguard %s' % conf['dropguard'])
+
+    # 曜日ごとのSUMM変更 (曜日 → [(正規表現, 置換文字列)])
+    weeksumm = conf.get('weeksumm') or []
+    conf['weekre'] = tuple(tuple((re.compile(ws[1]), ws[2]) for ws in weeksumm if ws[0] & (1 << wd)) for wd in range(7))
+
+    # 事務所 → Airリザーブの部屋
+    stores = {}
+    for loc in conf['room'].values():
+        stores.setdefault(loc[0], set()).add(loc[1])
+    conf['stores'] = {store: frozenset(rooms) for store, rooms in stores.items()}
+    for name, store in conf['person'].items():
+        if store not in conf['stores']:
+            g_logger.debug('c2a:no room in %s for %s (use %s)' % (store, name, conf['noroom']))
+    return conf
+
 # 予定比較
+# 比較キーは文字列ではなくタプル (開始, 終了, 事務所, 部屋, 人, desc) で作り、辞書引きだけで一致判定する
 def sync_cal(conf, merge):
-    cyb = list(filter(lambda x: x['ctyp'] == CAL_CYBOZU, merge))
-    arr = list(filter(lambda x: x['ctyp'] == CAL_ARR,    merge))
+    cyb = []
+    arr = []
+    for x in merge:
+        if x.ctyp == CAL_CYBOZU:
+            cyb.append(x)
+        elif x.ctyp == CAL_ARR:
+            arr.append(x)
     g_logger.debug('c2a:start (%d, %d)' % (len(cyb), len(arr)))
 
+    # 予定が多い場合は1件ごとのデバッグログを省略 (ファイル出力が差分処理の大半を占めるため)
+    trace = conf.get('difflog', len(merge) <= DIFFLOG_MAX)
+    dump  = conf.get('middump', trace) # 中間ファイルも同じ条件で書き出す
+
+    # 前回の実行からの変更を実行履歴DBで確認 (DBが無い/初回は何もしない)
+    for cal in (CAL_CYBOZU, CAL_ARR) if trace else ():
+        chg = eventdb.changes(cal)
+        if chg:
+            g_logger.debug('c2a:changes since last run %s +%d -%d' % (cal, len(chg[0]), len(chg[1])))
+            for e in chg[0]:
+                g_logger.debug('c2a:  + %s' % (e,))
+            for e in chg[1]:
+                g_logger.debug('c2a:  - %s' % (e,))
+
+    # コンパイル済みの設定 (compile_conf)
+    rooms    = conf['room']
+    persons  = conf['person']
+    deltuple = conf['deldesc']
+    skipre   = conf['skipdesc']
+    ejects   = conf['eject']
+    weekre   = conf['weekre']
+
     # サイボウズの同一予定を集約
     uniq = {}
     for item in cyb:
-        key = '%s%s%s' % (item['tbgn'], item['tend'], item['desc'])
+        key = (item.tbgn, item.tend, item.desc)
         # 同一時刻 & 同一descなら、同じ予定とみなす
-        if key not in uniq:
-            uniq[key] = {'item':item, 'room':[], 'person':[]}
-        if item['summ'] in conf['room']:
-            uniq[key]['room'].append(item['summ'])
-        elif item['summ'] in conf['person']:
-            uniq[key]['person'].append(item['summ'])
+        ui = uniq.get(key)
+        if ui is None:
+            ui = uniq[key] = {'item':item, 'room':[], 'person':[]}
+        if item.summ in rooms:
+            ui['room'].append(item.summ)
+        elif item.summ in persons:
+            ui['person'].append(item.summ)
         else:
-            g_logger.error('c2a:invalid summ %s' % (item['summ']))
+            g_logger.error('c2a:invalid summ %s' % (item.summ))
     
     # サイボウズの事務所-ルーム-人のマッチングした新mergeを作成
     # 予定名が除外リストに入っていれば除外
-    deltuple = tuple(conf['deldesc'])       # 先頭一致での削除用 (startswith用にタプル化)
-    skipre   = re.compile(conf['skipdesc']) # 正規表現用
-
     merge2 = []
     for ui in uniq.values():
         # 無視する予定は除外
         item = ui['item']
-        if item['desc'].startswith(deltuple):
-            g_logger.debug('c2a:del  %s' % (item['desc']))
+        if item.desc.startswith(deltuple):
+            if trace:
+                g_logger.debug('c2a:del  %s' % (item.desc))
             continue
-        if skipre.match(item['desc']):
-            g_logger.debug('c2a:skip %s' % (item['desc']))
+        if skipre.match(item.desc):
+            if trace:
+                g_logger.debug('c2a:skip %s' % (item.desc))
             continue
 
         # 人→roomマッチング
@@ -94,121 +245,179 @@ def sync_cal(conf, merge):
         person = ui['person']
         cat  = set()
         for p in person:
-            locP = conf['person'][p]   # 人に紐づいた事務所
+            locP = persons[p]   # 人に紐づいた事務所
             for r in room:
-                locR = conf['room'][r] # 部屋に紐づいた事務所
+                locR = rooms[r] # 部屋に紐づいた事務所
                 if locP == locR[0]:
                     cat.add('%s@%s@%s' % (locP, locR[1], p)) # 一致あり → そのペアを追加
                     break
             else:
                 # 一致無し → 部屋無し(noroom)で割り当て
-                g_logger.debug('c2a:Unmatch person %s %s, use %s for %s' % (p, room, conf['noroom'], item['desc']))
+                if trace:
+                    g_logger.debug('c2a:Unmatch person %s %s, use %s for %s' % (p, room, conf['noroom'], item.desc))
                 cat.add('%s@%s@%s' % (locP, conf['noroom'], p))
             
         # room→人マッチング
         for r in room:
-            locR = conf['room'][r]         # 部屋に紐づいた事務所
+            locR = rooms[r]         # 部屋に紐づいた事務所
             for p in person:
-                locP = conf['person'][p]   # 人に紐づいた事務所
+                locP = persons[p]   # 人に紐づいた事務所
                 if locP == locR[0]:
                     cat.add('%s@%s@%s' % (locP, locR[1], p)) # 一致あり → そのペアを追加
                     break
             else:
                 # 一致無し → 人無し(noperson)で割り当て
-                g_logger.debug('c2a:Unmatch room %s %s, use %s for %s' % (r, person, conf['noperson'], item['desc']))
+                if trace:
+                    g_logger.debug('c2a:Unmatch room %s %s, use %s for %s' % (r, person, conf['noperson'], item.desc))
                 cat.add('%s@%s@%s' % (locR[0], locR[1], conf['noperson']))
         
-        # 除外者チェック
-        for eject in conf['eject']:
-            for pp in list(filter(lambda x: x.startswith(eject), cat)):
-                # 部屋無しなら無条件で除外
-                if pp.split('@')[1] == conf['noroom']:
-                    cat.remove(pp)
-                else:
-                    # 同じ会議でeject者以外が部屋を予約しているなら除外
-                    endw = pp[len(eject):]
-                    hit = list(filter(lambda x: x.endswith(endw) and not x.startswith(eject) , cat))
-                    if len(hit):
-                        g_logger.debug('c2a:eject %s %s' % (pp, hit))
+        # 除外者チェック (除外者に該当するものがある会議だけ調べる)
+        if ejects and [pp for pp in cat if pp.startswith(ejects)]:
+            for eject in ejects:
+                for pp in [x for x in cat if x.startswith(eject)]:
+                    # 部屋無しなら無条件で除外
+                    if pp.split('@')[1] == conf['noroom']:
                         cat.remove(pp)
+                    else:
+                        # 同じ会議でeject者以外が部屋を予約しているなら除外
+                        endw = pp[len(eject):]
+                        hit = [x for x in cat if x.endswith(endw) and not x.startswith(eject)]
+                        if hit:
+                            if trace:
+                                g_logger.debug('c2a:eject %s %s' % (pp, hit))
+                            cat.remove(pp)
         
         # 曜日に応じたSUMM変更処理
-        for ws in conf['weeksumm']:
-            if ws[0] & (1 << item['tbgn'].weekday()): # 対象曜日
-                for su in list(cat):
-                    # もし正規表現で置換されたらcatを入れ替える
-                    rep = re.sub(ws[1], ws[2], su)
-                    if rep != su:
-                        g_logger.debug('c2a:replce %s %s -> %s' % (item['tbgn'], su, rep))
-                        cat.remove(su)
-                        cat.add(rep)
+        for rex, repl in weekre[item.tbgn.weekday()]:
+            for su in list(cat):
+                # もし正規表現で置換されたらcatを入れ替える
+                rep = rex.sub(repl, su)
+                if rep != su:
+                    if trace:
+                        g_logger.debug('c2a:replce %s %s -> %s' % (item.tbgn, su, rep))
+                    cat.remove(su)
+                    cat.add(rep)
 
         # 有効なマッチングが1つ以上あれば登録
-        if len(cat):
-            merge2.append(item | {'summ': list(cat)})
+        if cat:
+            merge2.append((item, list(cat)))
 
-    # デバッグ用に、中間の会議リストをダンプしておく
-    with open(MIDDLE_FILE1, mode='w', encoding='utf-8')as f:
-        yaml.safe_dump(merge2, f, allow_unicode=True)
+    # デバッグ用に、中間の会議リストをダンプしておく (summは事務所@部屋@人のリスト)
+    if dump:
+        snapshot.save(MIDDLE_FILE1, [item for item, _ in merge2], summ=[cat for _, cat in merge2])
 
     # Airリザーブで予約済みの情報をリストアップ
-    airrmap = {} # マッピング用
+    # ※compdesc=Falseならdescは比較対象にしない
+    compdesc = conf['compdesc']
+    airrmap = {} # 比較キー → 予約 (マッピング用)
+    airrno  = {} # 予約番号 → 比較キー
     for item in arr:
         # Airリザーブのsummは「@」区切り (事務所@部屋@人@メニュー名@予約番号)
-        sep = item['summ'].split('@')
+        store, room, person, _, no = item.split()
 
-        # 比較文字の作成 ※compdesc=Falseならdescは比較対象にしない
-        ids = '%s %s %s@%s@%s %s' % (item['tbgn'], item['tend'], sep[0], sep[1], sep[2], item['desc'][:COMP_DESC] if conf['compdesc'] else '') # 開始時間 終了時間 事務所@部屋@人 desc
+        # 比較キー (開始時間, 終了時間, 事務所, 部屋, 人, desc)
+        ids = (item.tbgn, item.tend, store, room, person, item.desc[:COMP_DESC] if compdesc else '')
         airrmap[ids] = item # マッピングテーブル (重複しているものは後半優先)
-        g_logger.debug('c2a:arr-ids %s' % (ids))
+        airrno[no] = ids
+        if trace:
+            g_logger.debug('c2a:arr-ids %s' % (ids,))
+
+    # サイボウズUID+summ → 予約番号の対応表 (今回一致したものだけを残す)
+    oldmap = idmap.load()
+    newmap = {}
+    nmap   = 0 # 対応表で一致した数
     
     # 差分チェックして追加/削除が必要なものだけ返す
     ret = []
-    for item in merge2:
+    for item, cat in merge2:
+        # サイボウズは開始時刻=終了時刻を設定できるが、エアリザーブはエラーとなるため最小期間を加える
+        if (item.tend - item.tbgn).seconds < MINIMAL_DIFF:
+            item = item.replace(tend=item.tbgn + timedelta(seconds=MINIMAL_DIFF))
+            g_logger.info('arr:Change end time to %s' % (item.tend))
+
         # エアリザーブに登録できる文字に変換しておく
-        zendesc = normalize_text(item['desc'])[:COMP_DESC]
+        zendesc = normalize_text(item.desc)[:COMP_DESC]
+        cmpdesc = comp_desc(zendesc)
+        tbgn    = item.tbgn
+        tend    = item.tend
+        uid     = item.uid
 
         # 全summ(事務所@部屋@人)をチェックして、Airリザーブに予定が無ければ追加リストに入れる
-        for summ in item['summ']:
-            # エアリザーブは、姓[20]+名[20]に分けて格納されるが、それぞれ前後スペースが削除されることに注意
-            se = zendesc[        :MAX_DESC    ]
-            na = zendesc[MAX_DESC:MAX_DESC * 2]
+        for summ in cat:
+            ids = (tbgn, tend, *summ.split('@'), cmpdesc)
 
-            # サイボウズは開始時刻=終了時刻を設定できるが、エアリザーブはエラーとなるため最小期間を加える
-            if (item['tend'] - item['tbgn']).seconds < MINIMAL_DIFF:
-                item['tend'] = item['tbgn'] + timedelta(seconds=MINIMAL_DIFF)
-                g_logger.info('arr:Change end time to %s' % (item['tend']))
-
-            ids = '%s %s %s %s' % (item['tbgn'], item['tend'], summ, se.strip('　') + na.strip('　'))
+            # 対応表に予約番号があり、日時と事務所@部屋@人が同じなら登録済
+            # compdesc=1で名前だけが変わっていれば、自動入力した予約は更新(~)で名前を直す (それ以外は従来の文字列比較)
+            key = idmap.mapkey(item, summ) if uid else None
+            mid = airrno.get(oldmap.get(key)) if key else None
+            book = airrmap.get(mid) if mid and mid[:5] == ids[:5] else None
+            if book and (mid[5] == ids[5] or book.menu == conf['automenu']):
+                newmap[key] = oldmap[key]
+                del airrmap[mid] # 後続処理の削除対象にならないように外しておく
+                nmap += 1
+                if compdesc and mid[5] != ids[5]:
+                    ret.append(Event('~', tbgn, tend, book.summ, zendesc, uid, book.tbgn, book.tend, book.desc))
+                    if trace:
+                        g_logger.debug('c2a:rename id %s %s -> %s' % (key, book.desc, zendesc))
+                elif trace:
+                    g_logger.debug('c2a:match id %s %s' % (key, mid))
 
             # 既にAirリザーブに登録済？
-            if ids in airrmap:
+            elif ids in airrmap:
                 # 登録済 (追加はautomenuで入れたもの以外も同一判定)
+                if key:
+                    newmap[key] = airrmap[ids].no # 次回から対応表で一致させる
                 del airrmap[ids] # 後続処理の削除対象にならないように外しておく
-                g_logger.debug('c2a:match %s' % (ids))
+                if trace:
+                    g_logger.debug('c2a:match %s' % (ids,))
             else:
                 # 未登録
-                ret.append(copy.deepcopy(item) | {'ctyp': '+', 'summ': summ, 'desc':zendesc})
-                g_logger.debug('c2a:add list %s' % (ids))
+                ret.append(Event('+', tbgn, tend, summ, zendesc, uid))
+                if trace:
+                    g_logger.debug('c2a:add list %s' % (ids,))
+
+    # 対応表を保存 (追加した予定の予約番号はset_calで追記される)
+    idmap.save(newmap)
+    g_logger.debug('c2a:idmap %d/%d matched by id' % (nmap, len(newmap)))
 
     # エアリザーブにしか無い予定は削除リストとして追加
+    automenu = conf['automenu']
     for ids, item in airrmap.items():
         # 自動ツールが入力したものだけを対象にする
-        if item['summ'].split('@')[3] == conf['automenu']: # 自分で追加したのと同じメニュー
-            ret.append(copy.deepcopy(item) | {'ctyp': '-'})
-            g_logger.debug('c2a:del list %s' % (ids))
+        if item.menu == automenu: # 自分で追加したのと同じメニュー
+            ret.append(item.replace(ctyp='-'))
+            if trace:
+                g_logger.debug('c2a:del list %s' % (ids,))
         else:
-            g_logger.debug('c2a:skip list %s' % (ids))
-    
-    # Airリザーブの入力を最適化するため、優先度「1.事務所、2.追加/削除、3.日付」順でソートしておく
-    ret = sorted(ret, key=lambda x: '%s%s%s' % (x['summ'].split('@')[0], x['ctyp'], x['tbgn']))
+            if trace:
+                g_logger.debug('c2a:skip list %s' % (ids,))
+
+    # サイボウズの予定が前回の実行(実行履歴DB)より大きく減っていたら、取得の失敗を疑って今回は削除しない
+    # 前回の予定は今回取得した期間の先頭以降だけを数える (期間外に過ぎた予定は減少に含めない)
+    guard = conf['dropguard']
+    prev  = None
+    if guard and merge:
+        prev = eventdb.prev_events(CAL_CYBOZU, tmin=min(x.tbgn for x in merge))
+        prev = len(prev) if prev is not None else None
+    if prev and len(cyb) < prev * (1 - guard):
+        ndel = sum(1 for x in ret if x.ctyp == '-')
+        if ndel:
+            g_logger.warning('c2a:サイボウズの予定が前回の%d件から%d件に減ったため、今回は%d件の削除を行いません' % (prev, len(cyb), ndel))
+            ret = [x for x in ret if x.ctyp != '-']
+
+    # 時刻が移動しただけの予定は、削除+追加をやめて予約の更新にする
+    if conf.get('movepair', 1):
+        ret = pair_moves(conf, ret, trace)
+
+    # Airリザーブの入力を最適化するため、優先度「1.事務所、2.追加/削除/更新、3.日付」順でソートしておく
+    ret.sort(key=lambda x: (x.store, x.ctyp, x.tbgn))
 
     g_logger.info("c2a:サイボウズ:%d件 → 集約:%d会議 → リザーブ差分:%d予定" % (len(cyb), len(uniq), len(ret)))
     print('─' * 70)
 
     # デバッグ用に、中間の予定リストをダンプしておく
-    with open(MIDDLE_FILE2, mode='w', encoding='utf-8')as f:
-        yaml.safe_dump(ret, f, allow_unicode=True)
+    if dump:
+        snapshot.save(MIDDLE_FILE2, ret)
 
     return ret
 
@@ -216,13 +425,11 @@ def sync_cal(conf, merge):
 # main
 ################################################################################
 if __name__ == '__main__':
-    with open(CONF_FILE, 'r', encoding='utf-8') as f:
-        confs = yaml.safe_load(f)
+    confs = loadconf.load(CONF_FILE)
 
-    conf = next(filter(lambda c: c['file'] == MERGE_TYPE, confs['merge']), None)
+    conf = confs and next(filter(lambda c: c['file'] == MERGE_TYPE, confs['sync']), None)
     if conf:
-        with open('log/mid_merge.yaml', mode='r', encoding='utf-8')as f:
-            merge = yaml.safe_load(f)
+        merge = snapshot.load(MERGE_FILE)
 
-        ret = sync_cal(conf, merge)
+        ret = sync_cal(conf, merge or [])
         print('%d件抽出' % len(ret))
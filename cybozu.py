@@ -4,17 +4,44 @@
 # Copyright (c) 2025 rinos4u, released under the MIT open source license.
 #
 # 2025.03.15 rinos4u	new
+# 2026.10.18 rinos4u	固定ウェイトをwebctrlの条件待ちに置き換え
+# 2026.10.18 rinos4u	週表示テーブルをwebctrl.tableで一括抽出するように変更
+# 2026.10.18 rinos4u	webctrl.Poolから呼ぶログイン処理(login)を追加
+# 2026.10.18 rinos4u	グループを複数タブで同時に読み込むモード(tabs)を追加
+# 2026.10.18 rinos4u	ログイン後はHTTPで直接予定表を取得するモード(fetch: http)を追加
+# 2026.10.18 rinos4u	グループ/日付を指定したURLで週を直接開くモード(deeplink)を追加
+# 2026.10.18 rinos4u	週1ページ/グループ1つ単位のリトライ(opretry)を追加。応答しないブラウザは作り直して継続
+# 2026.10.18 rinos4u	予定の詳細リンクからUIDを取り出して予定に追加(uid)
+# 2026.10.18 rinos4u	設定読み込み時のコンパイル(compile_conf)を追加し、終日判定を予定ごとに作り直さないように変更
+# 2026.10.18 rinos4u	予定を共通のEventで扱い、重複チェックを文字列化からEventの同一判定に変更
+# 2026.10.18 rinos4u	中間ファイルをsnapshot(既定はバイナリ)で書き出すように変更
+# 2026.10.18 rinos4u	週/ページ/(グループ, 日)の指紋が前回と同じなら解析を省略するモード(incremental)を追加
+# 2026.10.18 rinos4u	グループ選択&翌週ボタンでの取得を週1ページ単位のリトライに変更。タブ読み込みの失敗時はタブを閉じて順に読み込む
+# 2026.10.18 rinos4u	HTTP取得モードの行解析(CbHtml)で、ブラウザ取得(webctrl.table)と同じくネストしたtdも拾うように変更
+# 2026.10.18 rinos4u	HTTP取得で日付ヘッダの無いページ(セッション切れ等)はブラウザでの取得に切り替える
+# 2026.10.18 rinos4u	webctrl(selenium)はブラウザを使う時に読み込むように変更 (解析/設定のテストはseleniumが無くても動く)
+# 2026.10.18 rinos4u	予定のIDをリンクのUID(ユーザID)からsEID(+繰り返し予定の日付)に変更し、UIDはsEIDが無い場合だけ使う
+# 2026.10.18 rinos4u	対象グループが1つだけの設定もエラーにせず警告のみにする
+# 2026.10.18 rinos4u	URL指定のタブ読み込み(cb_scanlinktabs)に失敗したら、その組の週を順に読み込む
 
 ################################################################################
 # import
 ################################################################################
 import time
-import yaml
-import webctrl
+import os
+import pickle
+import hashlib
+import loadconf
+import snapshot
+from event import Event
 import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
 from datetime import datetime, timedelta
 from logconf import g_logger
 
+webctrl = loadconf.lazy_import('webctrl') # selenium(ブラウザ)は最初に使う時に読み込む
+
 ################################################################################
 # const
 ################################################################################
@@ -22,20 +49,37 @@ from logconf import g_logger
 URL_SEARCH = 'https://%s.cybozu.com/o/ag.cgi?page=ScheduleIndex'
 # 詳細ページ (待機用)
 URL_DETAIL = 'https://%s.cybozu.com/o/ag.cgi?page=ScheduleView&UID='
+# グループ/日付指定の予定表ページ (サーバ, グループID, 日付(da.年.月.日), 日付)
+URL_WEEK   = URL_SEARCH + '&GID=%s&Date=da.%s&BDate=da.%s'
 
 CAL_TYPE = 'cybozu'
 
 CONF_FILE = 'config.yaml'
-MIDDLE_FILE = 'log/mid_cybozu.yaml'
+MIDDLE_FILE = 'log/mid_cybozu' # 拡張子は形式(snapshot)に応じて付く
+CACHE_FILE  = 'log/cache_cybozu_%s.pkl' # 前回の解析結果 (%sは設定名)
+CACHE_VER   = 2
 
 WAIT_LOGIN  = 1 # どのアカウントでログインしたか分かるように表示を止める
-WAIT_SEARCH = 1 # カレンダ表示が更新されるまでの時間
+WAIT_SEARCH = 1 # カレンダ表示が更新されるまでの時間 (固定ウェイト設定時のみ使用)
+WAIT_UPDATE = 15 # カレンダ表示の更新待ちのタイムアウト
+
+# HTMLからテキストを取り出す際に改行を入れるタグ (ブラウザのinnerText相当にするため)
+HTML_BREAK = {'br', 'div', 'p', 'li', 'ul', 'ol', 'tr', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'dd', 'dt'}
 
 BTN_NEXTWEEK = -1 # 翌週ボタンはユニークIDがないためインデックスで指定(-1=最後のボタン)
 
+# 予定の詳細リンク (sEID: 予定ID、Date: 繰り返し予定の日付、UID: 表示中のユーザID)
+VIEW_RE = re.compile(r'[?&]page=ScheduleView(?:[&#]|$)')
+EID_RE  = re.compile(r'[?&]sEID=([^&#]+)')
+DATE_RE = re.compile(r'[?&]Date=(?:da\.)?([^&#]+)')
+UID_RE  = re.compile(r'[?&]UID=([^&#]+)')
+
+OP_RETRY = 2 # 週1ページ/グループ1つ単位のリトライ回数 (opretry未指定時)
+
 ################################################################################
 # globals
 ################################################################################
+g_cache = {} # 設定名 → 前回の解析結果 (cb_loadcacheで読み込む)
 
 ################################################################################
 # util funcs
@@ -52,8 +96,9 @@ def cb_login(conf):
     time.sleep(WAIT_LOGIN) # 入力確認も兼ねて、表示したまま少し待つ
 
     # クリックしてページ遷移を待つ
+    tok = webctrl.mark()
     webctrl.click('login-button', webctrl.By.CLASS_NAME)
-    webctrl.wait() # ページ読み込み待ち
+    webctrl.wait(since=tok) # ページ読み込み待ち
 
 # 分を計算
 def calcmin(s):
@@ -64,157 +109,729 @@ def calcmin(s):
         return int(t[0]) * 60 + int(t[1])
     except ValueError:
         return -1
+
+# 予定表ページのHTML解析 (HTTP取得モード用)
+# webctrl.tableと同じ形式の行リスト(rows)、日付ヘッダ(dates)、グループ選択肢(groups: 名前→ID)を抽出する
+# webctrl.table(ブラウザのquerySelectorAll)と同じく、行内のtdはネストしたtableの中も含めて開始順に全て拾う
+# (外側のセルのテキスト/リンクには内側のセルの分も含む)。見出しは行内で最初のth
+class CbHtml(HTMLParser):
+    def __init__(self, base):
+        super().__init__()
+        self.base   = base
+        self.rows   = []
+        self.dates  = []
+        self.groups = {}
+        self.depth  = 0    # tableのネスト数
+        self.row    = None # 解析中のeventrow
+        self.rowdep = 0    # 解析中のeventrowのtableネスト数
+        self.cells  = []   # 解析中のセル(外側から順) [タグ名, tableネスト数, 格納位置, テキスト片のリスト, リンク]
+        self.head   = False # 行の見出し(最初のth)を割り当て済みか
+        self.date   = None # 解析中の日付ヘッダ(テキスト片のリスト)
+        self.datedep = 0   # 解析中の日付ヘッダのタグのネスト数
+        self.opt    = None # 解析中の選択肢 [value, テキスト片のリスト]
+        self.insel  = False
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        cls = (a.get('class') or '').split()
+        if tag == 'table':
+            self.depth += 1
+        elif tag == 'tr' and 'eventrow' in cls and self.row is None:
+            self.row = {'head': '', 'cells': [], 'links': []}
+            self.rowdep = self.depth
+            self.head = False
+        elif tag in ('td', 'th') and self.row is not None and self.depth >= self.rowdep:
+            self.endcells(self.depth) # 終了タグの無い同じtableのセルを閉じる
+            if tag == 'td':
+                pos = len(self.row['cells'])
+                self.row['cells'].append('')
+                self.row['links'].append([])
+            elif not self.head:
+                pos = -1 # 見出し
+                self.head = True
+            else:
+                pos = None # 2つ目以降のthはテキストだけ外側のセルに含める
+            self.cells.append([tag, self.depth, pos, [], []])
+        elif tag == 'select' and a.get('id') == 'groupSelect':
+            self.insel = True
+        elif tag == 'option' and self.insel:
+            self.opt = [a.get('value'), []]
+
+        # 日付ヘッダは終了タグまでのテキストを取り出す
+        if self.date is not None:
+            self.datedep += 1
+        elif 'dateheadInnerDateCellText' in cls:
+            self.date = []
+            self.datedep = 1
+
+        # セル内のリンク (開いている全てのtdに入れる)
+        if tag == 'a' and a.get('href'):
+            for c in self.cells:
+                if c[0] == 'td':
+                    c[4].append(urljoin(self.base, a['href']))
+        if tag in HTML_BREAK:
+            self.text('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'br':
+            self.text('\n')
+        else:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in HTML_BREAK:
+            self.text('\n')
+        if self.date is not None:
+            self.datedep -= 1
+            if self.datedep <= 0:
+                self.dates.append(self.join(self.date))
+                self.date = None
+        if tag == 'table':
+            self.endcells(self.depth)
+            self.depth -= 1
+        elif tag == 'tr' and self.row is not None and self.depth == self.rowdep:
+            self.endcells(self.depth)
+            self.rows.append(self.row)
+            self.row = None
+        elif tag in ('td', 'th') and self.row is not None and self.depth >= self.rowdep:
+            self.endcells(self.depth)
+        elif tag == 'select':
+            self.insel = False
+        elif tag == 'option' and self.opt:
+            self.groups[self.join(self.opt[1])] = self.opt[0]
+            self.opt = None
+
+    def handle_data(self, data):
+        self.text(re.sub(r'\s+', ' ', data))
+
+    # 解析中の要素にテキストを追加
+    def text(self, t):
+        for c in self.cells:
+            c[3].append(t)
+        if self.date is not None:
+            self.date.append(t)
+        if self.opt:
+            self.opt[1].append(t)
+
+    # tableネスト数がdepth以上のセルを確定
+    def endcells(self, depth):
+        while self.cells and self.cells[-1][1] >= depth:
+            _, _, pos, parts, links = self.cells.pop()
+            if pos is None:
+                continue
+            if pos < 0:
+                self.row['head'] = self.join(parts)
+            else:
+                self.row['cells'][pos] = self.join(parts)
+                self.row['links'][pos] = links
+
+    # テキスト片を行単位に整形 (前後空白と空行を除く)
+    @staticmethod
+    def join(parts):
+        return '\n'.join(filter(None, (line.strip() for line in ''.join(parts).split('\n'))))
+
+# グループを選択 (読み込み完了は待たず、wait用のmarkを返す)
+def cb_selgroup(group):
+    tok = webctrl.mark()
+    #webctrl.selvalue('groupSelect', group['value'])
+    webctrl.selindexvalue('groupSelect', group['name'])
+    return tok
+
+# [翌週]ボタンを押下 (読み込み完了は待たず、wait用のmarkを返す)
+# 押下後の先頭は日曜日。1週間後でない事に注意
+def cb_nextweek():
+    btn = webctrl.finds('scheduleMove', webctrl.By.CLASS_NAME)
+    tok = webctrl.mark()
+    webctrl.fclick(btn[BTN_NEXTWEEK]) # 最後のボタンが翌週
+    return tok
+
+# 表示中の週のグループ予定を抽出 (表全体を1回で取得)
+def cb_readweek(conf, group, daymin, daymax):
+    return cb_parseweek(conf, group, webctrl.texts('.dateheadInnerDateCellText'), webctrl.table('.eventrow'), daymin, daymax)
+
+# カレンダーのタイトルから表示中の週の先頭日を抽出 (dt→0:年、1:月、2:日)
+# 日付ヘッダが無い/読めないページ(ログイン画面やエラー画面)ならNone
+def cb_weekstart(dates):
+    if len(dates) < 2:
+        return None
+    title = re.split('[ 　年月日]+', dates[1])
+    try:
+        return datetime(*[int(n) for n in title[:3]])
+    except (TypeError, ValueError):
+        return None
+
+# セルのリストから予定の詳細リンクの予定IDを順に取り出す
+# 予定IDはsEID(繰り返し予定を区別するため、Dateがあれば「sEID:日付」)。同じ予定への連続したリンクは1つにまとめる
+# sEIDの無いリンクはUIDを使う (UIDはユーザIDで予定ごとに違うとは限らないため、まとめない)
+def cb_uids(links):
+    ret  = []
+    last = None # 直前のsEIDの予定ID
+    for link in links:
+        if not VIEW_RE.search(link):
+            continue
+        m = EID_RE.search(link)
+        if m:
+            d = DATE_RE.search(link)
+            eid = '%s:%s' % (m.group(1), d.group(1)) if d else m.group(1)
+            if eid != last:
+                ret.append(eid)
+            last = eid
+            continue
+        m = UID_RE.search(link)
+        if m:
+            ret.append(m.group(1))
+        last = None
+    return ret
+
+# テキストの指紋 (変更検出用の短いハッシュ)
+def cb_fingerprint(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+# 解析結果に影響する設定の指紋 (変われば前回の解析結果は使わない)
+def cb_confsig(conf):
+    return cb_fingerprint(repr((CACHE_VER, conf['alldaysw'], conf['alldayre'].pattern, conf['alltime'],
+                                [(g['name'], g['target']) for g in conf['group']])))
+
+# 前回の解析結果 (incremental=0ならNone)
+# weeks: (グループ名, 週の先頭日, 範囲) → (週の指紋, 予定)
+# days:  (グループ名, 日) → (列の指紋, 予定)
+# pages: (グループ名, 日, 範囲) → (HTTPで取得したページの指紋, 予定)
+def cb_cache(conf):
+    if not conf.get('incremental', 1):
+        return None
+    return g_cache.get(conf['name'])
+
+# 前回の解析結果を読み込む (無い/設定が変わった場合は空から始める)
+def cb_loadcache(conf):
+    if not conf.get('incremental', 1):
+        return
+    sig = cb_confsig(conf)
+    path = CACHE_FILE % conf['name']
+    cache = None
+    if os.path.exists(path):
+        try:
+            with open(path, mode='rb') as f:
+                cache = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            g_logger.warning('cyb:cache load error %s %s' % (path, e))
+    if not cache or cache.get('sig') != sig:
+        cache = {'sig': sig, 'weeks': {}, 'days': {}, 'pages': {}}
+    g_cache[conf['name']] = cache
+    g_logger.debug('cyb:cache %d weeks %d days %d pages' % (len(cache['weeks']), len(cache['days']), len(cache['pages'])))
+
+# 今回の解析結果を保存 (範囲外になった日と、範囲の違う週/ページは捨てる)
+def cb_savecache(conf, daymin, daymax):
+    cache = cb_cache(conf)
+    if cache is None:
+        return
+    rng = (daymin, daymax)
+    cache['weeks'] = {k: v for k, v in cache['weeks'].items() if k[2:] == rng}
+    cache['pages'] = {k: v for k, v in cache['pages'].items() if k[2:] == rng}
+    cache['days']  = {k: v for k, v in cache['days'].items() if daymin <= k[1] < daymax}
+    path = CACHE_FILE % conf['name']
+    with open(path + '.tmp', mode='wb') as f:
+        pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path) # 書きかけのファイルを残さない
+
+# 1日分のセル(cell)から予定を抽出 (keyは人/部屋の名前、linksはセル内のリンク)
+# セル内の予定数と詳細リンクの数が一致すれば、予定にUID(uid)を付ける
+def cb_parsecell(conf, key, day, cell, links):
+    ret = []
+    alldaysw = conf['alldaysw'] # 先頭一致の終日判定
+    alldayre = conf['alldayre'] # 正規表現の終日判定
+
+    # 有効な予定を抽出(1日の列挙)
+    #g_logger.debug('cyb:COL\n%s' % (cell))
+    sched = cell.split('\n')
+    idx = 0
+    nch = len(sched)
+    while idx < nch: # "時間&Desc"が連続するペアを有効データとして抽出
+        # 次レコードチェック
+        tm = sched[idx]
+        idx += 1
+
+        # 終日予定の確認
+        if tm.startswith(alldaysw) or alldayre.match(tm):
+            desc = tm
+            tm = conf['alltime']
+        else:
+            desc = None
+
+        # 時刻チェック
+        t = tm.split('-')
+        if len(t) < 2:
+            g_logger.debug('cyb:invalid schedule %s' % (tm))
+            continue # 正しい時刻が含まれない、かつ終日予定でもない (恐らく、先頭の予定メモ)
+        tbegin = calcmin(t[0])
+        tend   = calcmin(t[1])
+        if tbegin < 0 or tend < 0:
+            g_logger.debug('cyb:invalid time %s %s' % (t[0], t[1]))
+            continue # 正しい時刻が含まれない (予定メモに'-'が含まれていた?)
+        if tbegin > tend:
+            g_logger.debug('cyb:all night %s > %s' % (t[0], t[1]))
+            tend += 60 * 24 # 日またぎ
+
+        # 終日予定でなければ、次がDESC
+        if not desc:
+            # 予定内容(=DESC)があるか確認
+            if idx >= nch:
+                g_logger.warning('cyb:empty desc1 %s %s' % (idx, nch))
+                # DESC情報が取れない場合は追加できない
+                break
+
+            # 予定内容チェック
+            desc = sched[idx]
+            idx += 1
+            if len(desc) < 1:
+                g_logger.warning('cyb:empty desc2 %s %s' % (idx - 1, tm))
+                continue # 情報が空ならスキップ
+
+        # 抽出した予定を共通フォーマットに変換
+        ret.append(Event(CAL_TYPE, day + timedelta(minutes = tbegin), day + timedelta(minutes = tend), key, desc))
+
+    # 予定とリンクが1対1ならUIDを付ける
+    uids = cb_uids(links)
+    if uids and len(uids) == len(ret):
+        ret = [e.replace(uid=uid) for e, uid in zip(ret, uids)]
+    elif uids:
+        g_logger.debug('cyb:uid unmatch %d %d' % (len(uids), len(ret)))
+    return ret
+
+# 週の日付ヘッダ(dates)とeventrowの行リスト(rows)からグループ予定を抽出
+# incremental=1なら、週全体と(グループ, 日)の列ごとの指紋を前回と比べ、変わっていない所は解析せずに前回の予定を使う
+def cb_parseweek(conf, group, dates, rows, daymin, daymax):
+    start_dt = cb_weekstart(dates)
+    if start_dt is None:
+        raise ValueError('week header not found %s' % (dates,))
+    g_logger.debug('cyb:week %s: %s...' % (group['name'], start_dt.strftime('%Y/%m/%d')))
+
+    # 週全体が前回と同じなら、そのまま前回の予定を返す
+    cache = cb_cache(conf)
+    if cache is not None:
+        wkey = (group['name'], start_dt, daymin, daymax)
+        wfp  = cb_fingerprint(repr((dates, rows)))
+        hit  = cache['weeks'].get(wkey)
+        if hit and hit[0] == wfp:
+            g_logger.debug('cyb:week unchanged %s' % (start_dt.strftime('%Y/%m/%d')))
+            return list(hit[1])
+
+    # 受付可能な行 (人/部屋の名前, セル, リンク)
+    groupOK = group['target']
+    targets = []
+    for row in rows:
+        col = row['head']
+        if not col.startswith(groupOK):
+            g_logger.debug('cyb:skip %s' % (col.split('\n')[0]))
+            continue # 対象外のIDはスキップ
+        targets.append((col.split('\n')[0].strip(), row['cells'], row.get('links') or []))
+
+    # 有効な予定を抽出(1週間の列挙)
+    ret = []
+    for i in range(max((len(cells) for _, cells, _ in targets), default=0)):
+        day = start_dt + timedelta(days=i)
+        # 検索範囲のチェック
+        if day < daymin:  # 発生しないはずだが、念のためチェック
+            g_logger.warning('cyb:past %s %s' % (day, daymin))
+            continue
+        if day >= daymax: # 最終日を過ぎたら、週ループそのものを終える
+            g_logger.debug('cyb:break %s %s' % (day, daymax))
+            break
+
+        # この日の列 (対象行のセル)
+        cols = [(key, cells[i], links[i] if i < len(links) else []) for key, cells, links in targets if i < len(cells)]
+
+        # 列の指紋が前回と同じなら前回の予定を使う
+        if cache is not None:
+            dkey = (group['name'], day)
+            dfp  = cb_fingerprint(repr(cols))
+            hit  = cache['days'].get(dkey)
+            if hit and hit[0] == dfp:
+                ret += hit[1]
+                continue
+
+        books = []
+        for key, cell, links in cols:
+            books += cb_parsecell(conf, key, day, cell, links)
+        if cache is not None:
+            cache['days'][dkey] = (dfp, books)
+            g_logger.debug('cyb:day parsed %s %s %d' % (group['name'], day.strftime('%Y/%m/%d'), len(books)))
+        ret += books
+
+    if cache is not None:
+        cache['weeks'][wkey] = (wfp, ret)
+    return list(ret)
+
+# 1操作をリトライ付きで実行 (ブラウザを作り直した場合はログインしてから再実行)
+def cb_retry(conf, func):
+    return webctrl.retry(func, conf.get('opretry', OP_RETRY) + 1, conf.get('opbackoff', webctrl.RETRY_BACKOFF), lambda: login(conf))
+
+# グループのweek週目(0=今週)を表示する。posは表示中の週 ({'week': 週、不明ならNone})
+# 表示中の週が不明か先の週なら、トップカレンダーからグループを選び直して[翌週]ボタンで進む
+def cb_openweek(conf, group, pos, week):
+    if pos['week'] is None or pos['week'] > week:
+        pos['week'] = None
+        webctrl.jump(URL_SEARCH % conf['serv']) # 日付を戻すためにトップカレンダーに移動
+        tok = cb_selgroup(group)
+        webctrl.wait(WAIT_UPDATE, tok, webctrl.WAIT_AFTER + WAIT_SEARCH) # グループ変更後の更新待ち
+        pos['week'] = 0
+    while pos['week'] < week:
+        cur = pos['week']
+        pos['week'] = None # 押下後に失敗すると表示中の週が分からないため、完了するまで不明にしておく
+        tok = cb_nextweek()
+        webctrl.wait(WAIT_UPDATE, tok, webctrl.WAIT_AFTER + WAIT_SEARCH) # ページ読み込み待ち
+        pos['week'] = cur + 1
+
+# グループのweek週目を開いて予定を抽出 (失敗したら次はグループの選択からやり直す)
+def cb_scanweek(conf, group, pos, week, daymin, daymax):
+    try:
+        cb_openweek(conf, group, pos, week)
+        return cb_readweek(conf, group, daymin, daymax)
+    except Exception:
+        pos['week'] = None
+        raise
+
+# 1グループの指定期間を、グループ選択と[翌週]ボタンで読み込む (週1ページ単位でリトライ)
+# 2回目以降は[翌週]ボタンで進むため、1回目と2回目で日付重複することがある。また最終日は余分なデータが追加されることがある。
+def cb_scangroup(conf, group, nweek, daymin, daymax):
+    pos   = {'week': None}
+    books = []
+    for week in range(nweek):
+        books += cb_retry(conf, lambda: cb_scanweek(conf, group, pos, week, daymin, daymax))
+    return books
+
+# グループを順に1つずつ読み込み、グループごとの予定リストを返す
+def cb_scan(conf, nweek, daymin, daymax):
+    return [cb_scangroup(conf, group, nweek, daymin, daymax) for group in conf['group']]
+
+# 開いたタブを閉じて元のタブに戻る (ブラウザが作り直されていた場合など、閉じられないタブは無視する)
+def cb_closetabs(tabs, top):
+    for h in tabs:
+        try:
+            webctrl.closetab(h)
+        except Exception:
+            g_logger.debug('cyb:closetab failed %s' % h)
+    if top:
+        try:
+            webctrl.tab(top)
+        except Exception:
+            g_logger.debug('cyb:tab failed %s' % top)
+
+# グループ/日付指定の予定表URL
+def cb_weekurl(conf, gid, day):
+    da = '%d.%d.%d' % (day.year, day.month, day.day)
+    return URL_WEEK % (conf['serv'], gid, da, da)
+
+# 日付指定で開く各週の先頭日 (当日から7日ごと。重複も余分な週も無い)
+def cb_weekdays(conf, daymin):
+    return [daymin + timedelta(days=7 * w) for w in range(-(-conf['range'] // 7))]
+
+# 開いた週の先頭日が指定どおりか確認 (日付指定が効かない場合は従来の操作に切り替えるため)
+def cb_checkweek(dates, day):
+    start = cb_weekstart(dates)
+    if start is None:
+        g_logger.info('cyb:予定表の日付が読めません(%s)' % day.strftime('%m/%d'))
+        return False
+    if start != day:
+        g_logger.info('cyb:日付指定のページが%sから始まっていません(%s)' % (day.strftime('%m/%d'), start.strftime('%m/%d')))
+        return False
+    return True
+
+# トップの予定表の選択肢から、各グループのグループIDを取得 (group.value指定があれば優先)
+def cb_groupids(conf, groups):
+    ret = []
+    for group in conf['group']:
+        gid = group.get('value') or (groups or {}).get(group['name'])
+        if not gid:
+            g_logger.info('cyb:グループIDが見つかりません(%s)' % group['name'])
+            return None
+        ret.append(gid)
+    return ret
+
+# グループ/日付を指定したURLで1週を開いて予定を抽出 (日付指定が効かない場合はNone)
+def cb_readlink(conf, group, gid, day, daymin, daymax):
+    webctrl.jump(cb_weekurl(conf, gid, day))
+    dates = webctrl.texts('.dateheadInnerDateCellText')
+    if not cb_checkweek(dates, day):
+        return None
+    return cb_parseweek(conf, group, dates, webctrl.table('.eventrow'), daymin, daymax)
+
+# グループ/週ごとにURLを指定して開き、グループごとの予定リストを返す (週1ページ単位でリトライ)
+# 日付指定が効かない場合はNone(従来の操作に切り替える)
+def cb_scanlink(conf, gids, daymin, daymax):
+    ret = []
+    for group, gid in zip(conf['group'], gids):
+        books = []
+        for day in cb_weekdays(conf, daymin):
+            week = cb_retry(conf, lambda: cb_readlink(conf, group, gid, day, daymin, daymax))
+            if week is None:
+                return None
+            books += week
+        ret.append(books)
+    return ret
+
+# グループ/週の組をURL指定で最大tabs個のタブで同時に開き、グループごとの予定リストを返す
+# タブでの読み込みに失敗したら、タブを閉じてその組の週を順に読み込む (週1ページ単位でリトライ)
+# 日付指定が効かない場合はNone(従来の操作に切り替える)
+def cb_scanlinktabs(conf, gids, daymin, daymax):
+    groups = conf['group']
+    ntab   = conf['tabs']
+    ret    = [[] for _ in groups]
+    jobs   = [(gi, day) for gi in range(len(groups)) for day in cb_weekdays(conf, daymin)]
+    top    = webctrl.tab()
+    for base in range(0, len(jobs), ntab):
+        batch = jobs[base:base + ntab]
+        tabs  = []
+        weeks = []
+        try:
+            try:
+                # 全タブで開く (読み込み完了は待たない)
+                for gi, day in batch:
+                    tabs.append(webctrl.newtab(cb_weekurl(conf, gids[gi], day)))
+                g_logger.debug('cyb:open %d tabs' % len(tabs))
+
+                # 開いた順に読み込み完了を待って解析
+                for (gi, day), h in zip(batch, tabs):
+                    webctrl.tab(h)
+                    webctrl.wait(WAIT_UPDATE, fallback = webctrl.WAIT_AFTER * 2)
+                    dates = webctrl.texts('.dateheadInnerDateCellText')
+                    if not cb_checkweek(dates, day):
+                        return None
+                    weeks.append(cb_parseweek(conf, groups[gi], dates, webctrl.table('.eventrow'), daymin, daymax))
+            finally:
+                # タブを閉じて元に戻る
+                cb_closetabs(tabs, top)
+        except Exception as e:
+            # ブラウザが強制終了されていても、順の読み込みのリトライで作り直してログインする
+            g_logger.info('cyb:タブでの読み込みに失敗したため、週を順に読み込みます (%s)' % type(e).__name__)
+            g_logger.debug('cyb:scanlinktabs', exc_info=True)
+            weeks = []
+            for gi, day in batch:
+                week = cb_retry(conf, lambda: cb_readlink(conf, groups[gi], gids[gi], day, daymin, daymax))
+                if week is None:
+                    return None
+                weeks.append(week)
+        for (gi, _), week in zip(batch, weeks):
+            ret[gi] += week
+    return ret
+
+# 予定表ページをHTTPで取得 (ログイン切れ等で取得できなければNone)
+def cb_httpload(cli, url):
+    status, location, html = cli.get(url)
+    if status != 200 or 'login' in (location or ''):
+        g_logger.info('cyb:HTTP取得に失敗しました(%d %s)' % (status, location or ''))
+        return None
+    return html
+
+# 予定表ページのHTMLを解析
+def cb_httpparse(url, html):
+    page = CbHtml(url)
+    page.feed(html)
+    page.close()
+    return page
+
+# 予定表ページをHTTPで取得して解析 (ログイン切れ等で取得できなければNone)
+def cb_httpget(cli, url):
+    html = cb_httpload(cli, url)
+    if html is None:
+        return None
+    return cb_httpparse(url, html)
+
+# グループ/日付を指定した1週をHTTPで取得して予定を抽出 (取得できない/日付指定が効かない場合はNone)
+# ページ全体の指紋が前回と同じなら、HTMLも解析せずに前回の予定を返す
+def cb_httpweek(conf, cli, group, gid, day, daymin, daymax):
+    url  = cb_weekurl(conf, gid, day)
+    html = cb_httpload(cli, url)
+    if html is None:
+        return None
+
+    cache = cb_cache(conf)
+    if cache is not None:
+        pkey = (group['name'], day, daymin, daymax)
+        pfp  = cb_fingerprint(html)
+        hit  = cache['pages'].get(pkey)
+        if hit and hit[0] == pfp:
+            g_logger.debug('cyb:page unchanged %s %s' % (group['name'], day.strftime('%Y/%m/%d')))
+            return list(hit[1])
+
+    wpage = cb_httpparse(url, html)
+    if not cb_checkweek(wpage.dates, day):
+        return None
+    ret = cb_parseweek(conf, group, wpage.dates, wpage.rows, daymin, daymax)
+    if cache is not None:
+        cache['pages'][pkey] = (pfp, ret)
+    return ret
+
+# ブラウザのCookieを引き継ぎ、グループ/週ごとの予定表ページをHTTPで直接取得して解析
+# グループごとの予定リストを返す。取得できなかった場合はNone(ブラウザでの取得に切り替える)
+def cb_scanhttp(conf, daymin, daymax):
+    cli = webctrl.http('%s.cybozu.com' % conf['serv'])
+    try:
+        # グループ名→グループIDの対応はトップの予定表の選択肢から取得
+        page = cb_httpget(cli, URL_SEARCH % conf['serv'])
+        if not page:
+            return None
+        gids = cb_groupids(conf, page.groups)
+        if not gids:
+            return None
+
+        ret = []
+        for group, gid in zip(conf['group'], gids):
+            # 週ごとに日付を指定して取得
+            books = []
+            for day in cb_weekdays(conf, daymin):
+                week = cb_httpweek(conf, cli, group, gid, day, daymin, daymax)
+                if week is None:
+                    return None
+                books += week
+            ret.append(books)
+        return ret
+    except (IndexError, KeyError, ValueError) as e:
+        # 想定外のページ(セッション切れのエラー画面等)は解析できないので、ブラウザでの取得に任せる
+        g_logger.info('cyb:HTTP取得したページを解析できませんでした(%s %s)' % (type(e).__name__, e))
+        return None
+    finally:
+        cli.close()
+
+# グループを最大tabs個のタブに振り分けて同時に読み込み、グループごとの予定リストを返す
+# 各タブの読み込み(ページ遷移)はブラウザ側で並行して進み、その間に他のタブを解析する
+# タブでの読み込みに失敗したら、タブを閉じてその組のグループを順に読み込む (週1ページ単位でリトライ)
+def cb_scantabs(conf, nweek, daymin, daymax):
+    groups = conf['group']
+    ntab   = conf['tabs']
+    ret    = [[] for _ in groups]
+    top    = webctrl.tab()
+    for base in range(0, len(groups), ntab):
+        batch = range(base, min(base + ntab, len(groups)))
+        tabs  = {}
+        try:
+            try:
+                # 全タブでトップカレンダーを開く (読み込み完了は待たない)
+                for gi in batch:
+                    tabs[gi] = webctrl.newtab(URL_SEARCH % conf['serv'])
+                g_logger.debug('cyb:open %d tabs' % len(tabs))
+
+                # 読み込みが終わったタブからグループを選択
+                toks = {}
+                for gi in batch:
+                    webctrl.tab(tabs[gi])
+                    webctrl.wait(WAIT_UPDATE, fallback = webctrl.WAIT_AFTER * 2)
+                    toks[gi] = cb_selgroup(groups[gi])
+
+                # 各タブで週を読んでは次週ボタンを押す、を巡回
+                books = {gi: [] for gi in batch}
+                for week in range(nweek):
+                    for gi in batch:
+                        webctrl.tab(tabs[gi])
+                        webctrl.wait(WAIT_UPDATE, toks[gi], webctrl.WAIT_AFTER + WAIT_SEARCH) # ページ読み込み待ち
+                        books[gi] += cb_readweek(conf, groups[gi], daymin, daymax)
+                        if week + 1 < nweek:
+                            toks[gi] = cb_nextweek()
+            finally:
+                # タブを閉じて元に戻る
+                cb_closetabs(tabs.values(), top)
+        except Exception as e:
+            # ブラウザが強制終了されていても、順の読み込みのリトライで作り直してログインする
+            g_logger.info('cyb:タブでの読み込みに失敗したため、グループを順に読み込みます (%s)' % type(e).__name__)
+            g_logger.debug('cyb:scantabs', exc_info=True)
+            books = {gi: cb_scangroup(conf, groups[gi], nweek, daymin, daymax) for gi in batch}
+        for gi in batch:
+            ret[gi] = books[gi]
+    return ret
     
 
 ################################################################################
 # Plugin API
 ################################################################################
-# 予定取得
-def get_cal(conf):
-    keep = webctrl.driver()
-    if not keep:
-        webctrl.init(conf['devscale'])
+# 設定のコンパイル (loadconfから設定読み込み時に1回だけ呼ばれる)
+# 終日判定はタプル/正規表現に、対象グループの名前はタプルにしておく
+def compile_conf(conf):
+    for key in ('serv', 'user', 'pass', 'range', 'group', 'alltime', 'alldayre'):
+        if key not in conf:
+            raise KeyError(key)
+    if len(conf['group']) < 2:
+        g_logger.warning('cyb:group %d件 (予定詳細の参加者は2つ目のグループの対象で絞り込みます)' % len(conf['group']))
+    if len(conf['alltime'].split('-')) != 2:
+        raise ValueError('alltime %s' % conf['alltime'])
+    conf['alldaysw'] = tuple(conf.get('alldaysw') or ())
+    conf['alldayre'] = re.compile(conf['alldayre'])
+    for group in conf['group']:
+        group['target'] = tuple(group['target'])
+    return conf
 
-    # 予定検索ページを開く
+# 予定検索ページを開き、必要ならログイン (webctrl.Poolのlogin用)
+def login(conf):
     webctrl.jump(URL_SEARCH % conf['serv'])
 
     # ユーザ/パスワード画面に遷移した？
     if 'login' in webctrl.url():
         cb_login(conf)
 
-    # カレンダーから予定を抽出
-    old = set() # 追加済みセット
-    ret = []    # 関数から戻す配列
-    pre = 0     # カウント用
+# 予定取得
+def get_cal(conf):
+    keep = webctrl.driver()
+    if not keep:
+        webctrl.initconf(conf)
+
+    # 予定検索ページを開く
+    login(conf)
+
     # 抽出範囲
     today = datetime.now()
     daymin = today.replace(hour=0, minute=0, second=0, microsecond=0)
     daymax = daymin + timedelta(days=conf['range'])
     g_logger.debug('cyb:get %s to %s' % (daymin, daymax))
+    cb_loadcache(conf)
+
+    # 登録された全グループの予定を抽出
+    # fetch=httpならブラウザはログインのみに使い、予定表はHTTPで直接取得する
+    # deeplink=1ならグループ/週ごとにURLを指定して開き、できなければ従来のグループ選択&翌週ボタン操作で開く
+    # tabs>1なら複数タブで同時に読み込む
+    books = None
+    if conf.get('fetch', 'browser') == 'http':
+        books = cb_scanhttp(conf, daymin, daymax)
+        if books is None:
+            g_logger.info('cyb:ブラウザでの取得に切り替えます')
+    if books is None and conf.get('deeplink', 0):
+        gids = cb_groupids(conf, webctrl.options('groupSelect'))
+        if gids:
+            if conf.get('tabs', 1) > 1:
+                books = cb_scanlinktabs(conf, gids, daymin, daymax)
+            else:
+                books = cb_scanlink(conf, gids, daymin, daymax)
+        if books is None:
+            g_logger.info('cyb:グループ選択と翌週ボタンでの取得に切り替えます')
+    if books is None:
+        nweek = int(conf['range'] / 7) + 1
+        if conf.get('tabs', 1) > 1:
+            books = cb_scantabs(conf, nweek, daymin, daymax)
+        else:
+            books = cb_scan(conf, nweek, daymin, daymax)
 
-    # 登録された全グループの予定を順に抽出
-    alldayre   = re.compile(conf['alldayre']) # 正規表現の終日判定
+    # カレンダーから予定を抽出
+    old = set() # 追加済みセット
+    ret = []    # 関数から戻す配列
+    for group, gbooks in zip(conf['group'], books):
+        pre = len(ret)
+        for book in gbooks:
+            # 同一の予定が無ければ追加 (Eventの同一判定でチェック)
+            if book not in old:
+                old.add(book)
+                ret.append(book)
+                g_logger.debug('cyb:add  %s' % (book))
+            else:
+                g_logger.debug('cyb:skip %s' % (book))
 
-    for group in conf['group']:
-        webctrl.jump(URL_SEARCH % conf['serv']) # 日付を戻すためにグループ毎にトップカレンダーに移動
-        #webctrl.selvalue('groupSelect', group['value'])
-        webctrl.selindexvalue('groupSelect', group['name'])
-        webctrl.wait() # ページ読み込み待ち
-        time.sleep(WAIT_SEARCH) # グループ変更後の更新待ち
-        
-        # 受付可能なリストを作成
-        groupOK = tuple(group['target'])
-
-        # 指定期間をサーチ
-        for week in range(int(conf['range'] / 7) + 1):
-            # 2回目以降は[翌週]ボタンで進む (押下後の先頭は日曜日。1週間後でない事に注意)
-            # このため、1回目と2回目で日付重複することがある。また最終日は余分なデータが追加されることがある。
-            if week:
-                btn = webctrl.finds('scheduleMove', webctrl.By.CLASS_NAME)
-                webctrl.fclick(btn[BTN_NEXTWEEK]) # 最後のボタンが翌週
-                webctrl.wait() # ページ読み込み待ち
-                time.sleep(WAIT_SEARCH)
-
-            # カレンダーのタイトルから年月日を抽出 (dt→0:年、1:月、2:日)
-            title = re.split('[ 　年月日]+', webctrl.gets('dateheadInnerDateCellText', webctrl.By.CLASS_NAME)[1])
-            start_dt = datetime(*[int(n) for n in title[:3]])
-            g_logger.debug('cyb:week %s: %s...' % (group['name'], '/'.join(title[:3])))
-            
-            # グループ予定のアイテムをサーチ        
-            for row in webctrl.finds('eventrow', webctrl.By.CLASS_NAME):
-                col = webctrl.get('th', webctrl.By.TAG_NAME, row)
-                if not col.startswith(groupOK):
-                    g_logger.debug('cyb:skip %s' % (key))
-                    continue # 対象外のIDはスキップ
-                key = col.split('\n')[0].strip()
-                
-                # 有効な予定を抽出(1週間の列挙)
-                col = webctrl.gets('td', webctrl.By.TAG_NAME, row)
-                for i in range(len(col)):
-                    day = start_dt + timedelta(days=i)
-                    # 検索範囲のチェック
-                    if day < daymin:  # 発生しないはずだが、念のためチェック
-                        g_logger.warning('cyb:past %s %s' % (day, daymin))
-                        continue
-                    if day >= daymax: # 最終日を過ぎたら、週ループそのものを終える
-                        g_logger.debug('cyb:break %s %s' % (day, daymax))
-                        break
-                        
-                    # 有効な予定を抽出(1日の列挙)
-                    #g_logger.debug('cyb:COL\n%s' % (col[i]))
-                    sched = col[i].split('\n')
-                    idx = 0
-                    nch = len(sched)
-                    while idx < nch: # "時間&Desc"が連続するペアを有効データとして抽出
-                        # 次レコードチェック
-                        tm = sched[idx]
-                        idx += 1
-
-                        # 終日予定の確認
-                        if tm.startswith(tuple(conf['alldaysw'])) or alldayre.match(tm):
-                            desc = tm
-                            tm = conf['alltime']
-                        else:
-                            desc = None
-
-                        # 時刻チェック
-                        t = tm.split('-')
-                        if len(t) < 2:
-                            g_logger.debug('cyb:invalid schedule %s' % (tm))
-                            continue # 正しい時刻が含まれない、かつ終日予定でもない (恐らく、先頭の予定メモ)
-                        tbegin = calcmin(t[0])
-                        tend   = calcmin(t[1])
-                        if tbegin < 0 or tend < 0:
-                            g_logger.debug('cyb:invalid time %s %s' % (t[0], t[1]))
-                            continue # 正しい時刻が含まれない (予定メモに'-'が含まれていた?)
-                        if tbegin > tend:
-                            g_logger.debug('cyb:all night %s > %s' % (t[0], t[1]))
-                            tend += 60 * 24 # 日またぎ
-                        
-                        # 終日予定でなければ、次がDESC
-                        if not desc:
-                            # 予定内容(=DESC)があるか確認
-                            if idx >= nch:
-                                g_logger.warning('cyb:empty desc1 %s' % (idx, nch))
-                                # DESC情報が取れない場合は追加できない
-                                break
-
-                            # 予定内容チェック
-                            desc = sched[idx]
-                            idx += 1
-                            if len(desc) < 1:
-                                g_logger.warning('cyb:empty desc2 %s %s' % (idx - 1, tm))
-                                continue # 情報が空ならスキップ
-
-                        # 抽出した予定を共通フォーマットに変換
-                        book = {
-                            'ctyp': CAL_TYPE,
-                            'tbgn': day + timedelta(minutes = tbegin),
-                            'tend': day + timedelta(minutes = tend),
-                            'summ': key,
-                            'desc': desc  
-                        }
-
-                        # 同一の予定が無ければ追加
-                        sbook = str(book) # 文字列化したオブジェクトで同一チェック
-                        if sbook not in old:
-                            old.add(sbook)
-                            ret.append(book)
-                            g_logger.debug('cyb:add  %s' % (sbook))
-                        else:
-                            g_logger.debug('cyb:skip %s' % (sbook))
-                            
         # グループごとに取得した件数を表示しておく
         g_logger.info('cyb:%-4s=%d件' % (group['name'], len(ret) - pre))
-        pre = len(ret)
 
     # 開放
     if not keep:
         webctrl.deinit()
 
     # 中間ファイルを保存しておく
-    with open(MIDDLE_FILE, mode='w', encoding='utf-8')as f:
-        yaml.safe_dump(ret, f, allow_unicode=True)
+    snapshot.save(MIDDLE_FILE, ret)
+    cb_savecache(conf, daymin, daymax)
 
     return ret
 
@@ -227,7 +844,7 @@ def set_cal(conf, merge):
 def get_one_cal(conf):
     keep = webctrl.driver()
     if not keep:
-        webctrl.init() #  コピーモードはユーザ操作させるためdevscaleは指定しない
+        webctrl.init(fixedwait=conf.get('fixedwait', 0)) #  コピーモードはユーザ操作させるためdevscaleは指定しない
 
     # 予定検索ページを開く
     webctrl.jump(URL_SEARCH % conf['serv'])
@@ -244,8 +861,9 @@ def get_one_cal(conf):
     # 参加者が縮小表示されている可能性があるため、フル表示しておく
     tofull = webctrl.search('a', '参加者をすべて表示', webctrl.By.TAG_NAME)
     if tofull:
+        tok = webctrl.mark()
         webctrl.fclick(tofull)
-        webctrl.wait(WAIT_SEARCH) # ページ読み込み待ち
+        webctrl.wait(WAIT_UPDATE, tok, WAIT_SEARCH) # ページ読み込み待ち
 
     # 詳細ページからテキスト抽出取得
     text = webctrl.get('scheduleDataView', webctrl.By.CLASS_NAME)
@@ -258,7 +876,7 @@ def get_one_cal(conf):
     dt = re.split('[ 　年月日火水木金土]+', dt)
     roomOK = tuple(conf['group'][0]['target'])
     room = list(filter(lambda a: a.startswith(roomOK), room.split(' ')))
-    personOK = tuple(conf['group'][1]['target'])
+    personOK = tuple(conf['group'][1]['target']) if len(conf['group']) > 1 else () # グループが1つなら参加者は対象外
     person = list(filter(lambda a: a.startswith(personOK), person.split(' ')))
 
     # 日付パターン
@@ -274,13 +892,7 @@ def get_one_cal(conf):
     ret = []
     for summ in person + room:
         # 共通フォーマットに設定
-        book = {
-        'ctyp': CAL_TYPE,
-            'tbgn': day + timedelta(minutes = calcmin(tbgn)),
-            'tend': day + timedelta(minutes = calcmin(tend)),
-            'summ': summ,
-            'desc': desc  
-        }
+        book = Event(CAL_TYPE, day + timedelta(minutes = calcmin(tbgn)), day + timedelta(minutes = calcmin(tend)), summ, desc)
         g_logger.debug('cyb:book:%s' % (book))
         ret.append(book)
 
@@ -293,10 +905,9 @@ def get_one_cal(conf):
 ################################################################################
 if __name__ == '__main__':
     # 直呼び出しは読み出しテスト
-    with open(CONF_FILE, 'r', encoding='utf-8') as f:
-        confs = yaml.safe_load(f)
+    confs = loadconf.load(CONF_FILE)
 
-    conf = next(filter(lambda c: c['file'] == CAL_TYPE, confs['cals']), None)
+    conf = confs and next(filter(lambda c: c['file'] == CAL_TYPE, confs['cals']), None)
     if conf:
         ret = get_cal(conf)
         print(ret)
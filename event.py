@@ -0,0 +1,108 @@
+#!/usr/bin/env python  # -*- coding: utf-8 -*-
+#
+# SynCals  予定レコード
+# Copyright (c) 2025 rinos4u, released under the MIT open source license.
+#
+# 全プラグインで共通の予定 (種別, 開始, 終了, summ, desc) を__slots__のクラスで持つ
+# summは「@」区切り (Airリザーブは事務所@部屋@人@メニュー名@予約番号、サイボウズは人/部屋の名前) で、
+# 分割した結果は初回参照時に1回だけ作ってstore/room/person/menu/noで引けるようにする
+# 予定は作成後に変更しない (変更はreplaceで作り直す)。YAMLとの変換はファイル入出力の所だけで行う
+#
+# 2026.10.18 rinos4u	new
+
+################################################################################
+# const
+################################################################################
+# 予定の項目 (uid以降は省略可)
+#  ctyp: 種別 (取得時はカレンダ名、差分は +:追加 -:削除 ~:更新)
+#  uid:  サイボウズの予定UID
+#  obgn/oend/odesc: 更新(~)の変更前の開始/終了/desc
+FIELDS   = ('ctyp', 'tbgn', 'tend', 'summ', 'desc', 'uid', 'obgn', 'oend', 'odesc')
+OPTIONAL = FIELDS[5:]
+
+################################################################################
+# Event
+################################################################################
+class Event:
+    __slots__ = FIELDS + ('parts',)
+
+    def __init__(self, ctyp, tbgn, tend, summ, desc, uid = None, obgn = None, oend = None, odesc = None):
+        self.ctyp  = ctyp
+        self.tbgn  = tbgn
+        self.tend  = tend
+        self.summ  = summ
+        self.desc  = desc
+        self.uid   = uid
+        self.obgn  = obgn
+        self.oend  = oend
+        self.odesc = odesc
+        self.parts = None # summの分割結果 (初回参照時に作成)
+
+    # 項目を変更した予定を作り直す
+    def replace(self, **kw):
+        ret = Event(self.ctyp, self.tbgn, self.tend, self.summ, self.desc, self.uid, self.obgn, self.oend, self.odesc)
+        for f, v in kw.items():
+            setattr(ret, f, v)
+        if 'summ' not in kw:
+            ret.parts = self.parts
+        return ret
+
+    # summの分割 (事務所, 部屋, 人, メニュー名, 予約番号)。足りない所は空文字
+    def split(self):
+        if self.parts is None:
+            sp = self.summ.split('@')
+            self.parts = tuple(sp) + ('',) * (5 - len(sp))
+        return self.parts
+
+    @property
+    def store(self):  return self.split()[0]
+    @property
+    def room(self):   return self.split()[1]
+    @property
+    def person(self): return self.split()[2]
+    @property
+    def menu(self):   return self.split()[3]
+    @property
+    def no(self):     return self.split()[4]
+
+    # 事務所@部屋@人
+    @property
+    def place(self):
+        return '@'.join(self.split()[:3])
+
+    # 同一判定のキー (取得時の重複チェック用)
+    def key(self):
+        return (self.ctyp, self.tbgn, self.tend, self.summ, self.desc, self.uid)
+
+    def __eq__(self, other):
+        return isinstance(other, Event) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    # ログ表示用 (従来の辞書と同じ表示)
+    def __repr__(self):
+        return str(self.todict())
+
+    # 辞書に変換 (省略可の項目は値がある場合だけ)
+    def todict(self):
+        ret = {'ctyp': self.ctyp, 'tbgn': self.tbgn, 'tend': self.tend, 'summ': self.summ, 'desc': self.desc}
+        for f in OPTIONAL:
+            v = getattr(self, f)
+            if v is not None:
+                ret[f] = v
+        return ret
+
+################################################################################
+# util funcs
+################################################################################
+# 辞書から作成 (不明な項目は無視)
+def fromdict(d):
+    return Event(**{f: d[f] for f in FIELDS if f in d})
+
+# 予定リスト ⇔ 辞書リスト (YAMLの読み書き用)
+def todicts(events):
+    return [e.todict() for e in events]
+
+def fromdicts(dicts):
+    return [fromdict(d) for d in dicts or []]
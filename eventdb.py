@@ -0,0 +1,217 @@
+#!/usr/bin/env python  # -*- coding: utf-8 -*-
+#
+# SynCals  予定の実行履歴DB (SQLite)
+# Copyright (c) 2025 rinos4u, released under the MIT open source license.
+#
+# 実行(run)ごとに、取得した予定(events)、差分の操作(ops)、カレンダへの書き込み結果(writes)を記録する
+# 中間ファイル(log/mid_*)は毎回上書きされるが、DBには過去の実行が残るため、
+# 前回の実行時点の予定を索引付きで引いたり(cb2arの削除の抑止)、前回からの変更だけを調べたりできる
+# 索引: 予定は(カレンダ, 事務所, 開始時刻)、(実行, カレンダ)と予約番号、操作は実行と予約番号、書き込みは実行
+#
+# 2026.10.18 rinos4u	new
+# 2026.10.18 rinos4u	前回の予定数(prev_count)を追加し、使っていない予約番号/期間の検索を削除
+# 2026.10.18 rinos4u	予約番号の索引と検索(booking)、前回の予定の検索(prev_events)を戻し、prev_countを置き換え
+
+################################################################################
+# import
+################################################################################
+import sqlite3
+from datetime import datetime
+
+from event import Event
+from logconf import g_logger
+
+################################################################################
+# const
+################################################################################
+DB_FILE  = 'log/events.db'
+DB_KEEP  = 30 # 残す実行履歴の数 (eventkeep未指定時)
+
+# 予定の列 (Eventの項目 + summの分割結果)
+EV_COLS = ('ctyp', 'tbgn', 'tend', 'summ', 'desc', 'uid', 'obgn', 'oend', 'odesc', 'store', 'room', 'person', 'menu', 'no')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    mode     TEXT,
+    started  TEXT,
+    finished TEXT,
+    status   INTEGER
+);
+CREATE TABLE IF NOT EXISTS events (
+    run INTEGER, cal TEXT,
+    ctyp TEXT, tbgn TEXT, tend TEXT, summ TEXT, desc TEXT, uid TEXT, obgn TEXT, oend TEXT, odesc TEXT,
+    store TEXT, room TEXT, person TEXT, menu TEXT, no TEXT
+);
+CREATE TABLE IF NOT EXISTS ops (
+    run INTEGER, cal TEXT,
+    ctyp TEXT, tbgn TEXT, tend TEXT, summ TEXT, desc TEXT, uid TEXT, obgn TEXT, oend TEXT, odesc TEXT,
+    store TEXT, room TEXT, person TEXT, menu TEXT, no TEXT
+);
+CREATE TABLE IF NOT EXISTS writes (
+    run INTEGER, time TEXT, key TEXT, st TEXT, no TEXT, msg TEXT
+);
+CREATE INDEX IF NOT EXISTS ev_cal_store_tbgn ON events (cal, store, tbgn);
+CREATE INDEX IF NOT EXISTS ev_run_cal        ON events (run, cal);
+CREATE INDEX IF NOT EXISTS ev_no             ON events (no);
+CREATE INDEX IF NOT EXISTS op_run            ON ops (run);
+CREATE INDEX IF NOT EXISTS op_no             ON ops (no);
+CREATE INDEX IF NOT EXISTS wr_run            ON writes (run);
+'''
+
+################################################################################
+# util funcs
+################################################################################
+# 日時 ⇔ 文字列 (文字列のままで時刻順に並ぶ形式)
+def dt2s(d):
+    return d.isoformat(' ') if d else None
+
+def s2dt(s):
+    return datetime.fromisoformat(s) if s else None
+
+# Event → 行
+def ev2row(run, cal, e):
+    store, room, person, menu, no = e.split()
+    return (run, cal, e.ctyp, dt2s(e.tbgn), dt2s(e.tend), e.summ, e.desc, e.uid, dt2s(e.obgn), dt2s(e.oend), e.odesc,
+            store, room, person, menu, no)
+
+# 行 → Event (ctyp～odescの列)
+def row2ev(r):
+    return Event(r[0], s2dt(r[1]), s2dt(r[2]), r[3], r[4], r[5], s2dt(r[6]), s2dt(r[7]), r[8])
+
+################################################################################
+# EventDB
+################################################################################
+class EventDB:
+    def __init__(self, path = DB_FILE, keep = DB_KEEP):
+        self.db   = sqlite3.connect(path)
+        self.keep = keep
+        self.run  = None
+        self.db.executescript(SCHEMA)
+
+    # 実行開始 (実行IDを返す)
+    def begin(self, mode):
+        with self.db:
+            cur = self.db.execute('INSERT INTO runs (mode, started) VALUES (?, ?)', (mode, dt2s(datetime.now())))
+        self.run = cur.lastrowid
+        g_logger.debug('edb:begin run %d (%s)' % (self.run, mode))
+        return self.run
+
+    # 実行終了 (古い実行履歴は削除)
+    def end(self, status):
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ?, status = ? WHERE id = ?', (dt2s(datetime.now()), status, self.run))
+            old = [r[0] for r in self.db.execute('SELECT id FROM runs ORDER BY id DESC LIMIT -1 OFFSET ?', (self.keep,))]
+            for table, col in (('events', 'run'), ('ops', 'run'), ('writes', 'run'), ('runs', 'id')):
+                self.db.executemany('DELETE FROM %s WHERE %s = ?' % (table, col), [(r,) for r in old])
+        g_logger.debug('edb:end run %d status %s (pruned %d)' % (self.run, status, len(old)))
+
+    # 取得した予定を記録 (calは取得元カレンダ。Noneなら予定の種別(ctyp))
+    def events(self, events, cal = None):
+        with self.db:
+            self.db.executemany('INSERT INTO events VALUES (%s)' % ','.join('?' * (len(EV_COLS) + 2)),
+                                (ev2row(self.run, cal or e.ctyp, e) for e in events))
+
+    # 差分の操作を記録 (calは同期プラグイン名)
+    def ops(self, ops, cal):
+        with self.db:
+            self.db.executemany('INSERT INTO ops VALUES (%s)' % ','.join('?' * (len(EV_COLS) + 2)),
+                                (ev2row(self.run, cal, e) for e in ops))
+
+    # カレンダへの書き込み結果を記録 (journalのエントリ)
+    def write(self, ent):
+        with self.db:
+            self.db.execute('INSERT INTO writes VALUES (?, ?, ?, ?, ?, ?)', (self.run, ent['time'], ent['key'], ent['st'], ent['no'], ent['msg']))
+
+    # 予定を取得した直前の実行ID (無ければNone)
+    def prev_run(self, cal):
+        r = self.db.execute('SELECT MAX(run) FROM events WHERE cal = ? AND run < ?', (cal, self.run or 1 << 62)).fetchone()
+        return r[0]
+
+    # 指定実行の予定 (store/期間で絞り込み。索引(cal, store, tbgn)を使う)
+    def query(self, run, cal, store = None, tmin = None, tmax = None):
+        sql  = 'SELECT ctyp, tbgn, tend, summ, desc, uid, obgn, oend, odesc FROM events WHERE run = ? AND cal = ?'
+        args = [run, cal]
+        if store is not None:
+            sql += ' AND store = ?'
+            args.append(store)
+        if tmin:
+            sql += ' AND tbgn >= ?'
+            args.append(dt2s(tmin))
+        if tmax:
+            sql += ' AND tbgn < ?'
+            args.append(dt2s(tmax))
+        return [row2ev(r) for r in self.db.execute(sql + ' ORDER BY tbgn', args)]
+
+    # 前回の実行から増えた予定と無くなった予定 (今回, 前回)
+    def changes(self, cal):
+        prev = self.prev_run(cal)
+        if prev is None:
+            return None
+        cols = 'ctyp, tbgn, tend, summ, desc, uid, obgn, oend, odesc'
+        sql  = 'SELECT %s FROM events WHERE run = ? AND cal = ? EXCEPT SELECT %s FROM events WHERE run = ? AND cal = ?' % (cols, cols)
+        added   = [row2ev(r) for r in self.db.execute(sql, (self.run, cal, prev, cal))]
+        removed = [row2ev(r) for r in self.db.execute(sql, (prev, cal, self.run, cal))]
+        return added, removed
+
+    # 予約番号の履歴 (実行ID, 種別, 開始, 終了, summ, desc) を新しい順に
+    def booking(self, no):
+        return self.db.execute('SELECT run, ctyp, tbgn, tend, summ, desc FROM events WHERE no = ? '
+                               'UNION ALL SELECT run, ctyp, tbgn, tend, summ, desc FROM ops WHERE no = ? ORDER BY run DESC', (no, no)).fetchall()
+
+    def close(self):
+        self.db.close()
+
+################################################################################
+# 共通DB (openしていなければ記録関数は何もしない)
+################################################################################
+g_db = None
+
+def open_db(path = DB_FILE, keep = DB_KEEP):
+    global g_db
+    g_db = EventDB(path, keep)
+    return g_db
+
+def close_db():
+    global g_db
+    if g_db:
+        g_db.close()
+        g_db = None
+
+def begin(mode):
+    if g_db:
+        g_db.begin(mode)
+
+def end(status):
+    if g_db:
+        g_db.end(status)
+
+def events(events, cal = None):
+    if g_db:
+        g_db.events(events, cal)
+
+def ops(ops, cal):
+    if g_db:
+        g_db.ops(ops, cal)
+
+def write(ent):
+    if g_db:
+        g_db.write(ent)
+
+# 前回の実行で取得した予定 (store/期間[tmin, tmax)で絞り込み。DBが無い/前回が無ければNone)
+def prev_events(cal, store = None, tmin = None, tmax = None):
+    if g_db and g_db.run:
+        prev = g_db.prev_run(cal)
+        if prev is not None:
+            return g_db.query(prev, cal, store, tmin, tmax)
+    return None
+
+# 予約番号の履歴 (DBが無ければ空)
+def booking(no):
+    return g_db.booking(no) if g_db else []
+
+# 前回の実行からの変更 (DBが無い/前回が無ければNone)
+def changes(cal):
+    if g_db and g_db.run:
+        return g_db.changes(cal)
+    return None
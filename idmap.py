@@ -0,0 +1,69 @@
+#!/usr/bin/env python  # -*- coding: utf-8 -*-
+#
+# SynCals  カレンダ間のIDマッピング
+# Copyright (c) 2025 rinos4u, released under the MIT open source license.
+#
+# サイボウズの予定ID(詳細リンクのsEID[:日付]、無ければUID)+展開後のsumm(事務所@部屋@人) → Airリザーブの予約番号 の対応表を保存する
+# 同期時は対応表で一致を判定し、対応表に無い予定だけを従来の文字列比較で判定する
+#
+# 2026.10.18 rinos4u	new
+# 2026.10.18 rinos4u	予定をEventの属性で参照するように変更
+# 2026.10.18 rinos4u	追加分は溜めてflushでまとめて保存し、保存は一時ファイル経由で置き換える
+
+################################################################################
+# import
+################################################################################
+import os
+import yaml
+
+from logconf import g_logger
+
+################################################################################
+# const
+################################################################################
+IDMAP_FILE = 'log/idmap.yaml'
+
+################################################################################
+# global
+################################################################################
+g_pending = {} # putで追加され、まだ保存していない対応 (キー → 予約番号)
+
+################################################################################
+# util funcs
+################################################################################
+# 対応表のキー (UIDの無い予定はNone)
+def mapkey(item, summ = None):
+    if not item.uid:
+        return None
+    return '%s@%s' % (item.uid, summ or item.summ)
+
+# 対応表の読み込み (無ければ空)
+def load(path = IDMAP_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, mode='r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+# 対応表の保存 (書き込み途中で中断しても壊れないよう、一時ファイルに書いてから置き換える)
+def save(idmap, path = IDMAP_FILE):
+    tmp = path + '.tmp'
+    with open(tmp, mode='w', encoding='utf-8') as f:
+        yaml.safe_dump(idmap, f, allow_unicode=True)
+    os.replace(tmp, path)
+    g_logger.debug('map:save %d ids' % len(idmap))
+
+# 1件追加 (予約番号が分かった時点で呼ぶ。保存はflushでまとめて行う)
+def put(item, no):
+    key = mapkey(item)
+    if not key or not no:
+        return
+    g_pending[key] = no
+
+# putで溜めた対応を対応表に追記して保存
+def flush(path = IDMAP_FILE):
+    if not g_pending:
+        return
+    idmap = load(path)
+    idmap.update(g_pending)
+    save(idmap, path)
+    g_pending.clear()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python  # -*- coding: utf-8 -*-
+#
+# SynCals  予定設定の操作ジャーナル
+# Copyright (c) 2025 rinos4u, released under the MIT open source license.
+#
+# 予定の追加/削除ごとに、状態(pending/sent/applied/failed)を追記専用のファイルに書き出す
+# 同じ操作を複数のカレンダに設定するため、操作はカレンダ名(target)と組で記録する
+# 設定処理が例外で中断してリトライする場合や、異常終了後に再実行した場合は、
+# 適用済み(applied)の操作を飛ばして、残りの操作だけを実行する
+# 登録ボタンを押した後(sent)に中断した操作は、登録されたか分からないため再実行せず、手動で確認するよう警告する
+# ジャーナルは差分(merge)の指紋(sig)ごとに有効。先頭行の指紋が違う記録は別の実行のものなので破棄する
+# 全カレンダの設定が完了したらジャーナルは空に戻す
+#
+# 2026.10.18 rinos4u	new
+# 2026.10.18 rinos4u	予定をEventの属性で参照するように変更
+# 2026.10.18 rinos4u	エントリを実行履歴DB(eventdb)にも記録
+# 2026.10.18 rinos4u	操作キーに設定先のカレンダ名を含め、カレンダごとに適用済みを判定
+# 2026.10.18 rinos4u	登録ボタン押下後の状態(sent)を記録して再実行しないように変更し、記録を差分の指紋(sig)で区切る
+
+################################################################################
+# import
+################################################################################
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import eventdb
+from logconf import g_logger
+
+################################################################################
+# const
+################################################################################
+JOURNAL_FILE = 'log/journal.jsonl'
+
+# 操作の状態
+ST_PENDING = 'pending' # 実行開始
+ST_SENT    = 'sent'    # 登録ボタンを押した (結果は未確認)
+ST_APPLIED = 'applied' # 適用済み
+ST_FAILED  = 'failed'  # 失敗
+
+################################################################################
+# Journal
+################################################################################
+# 1行1エントリのJSONで追記する
+# 先頭行: {"time": 作成日時, "sig": 差分の指紋}
+# 以降:   {"time": 記録日時, "key": 操作キー, "st": 状態, "no": 予約番号等, "msg": 補足}
+class Journal:
+    def __init__(self, path = JOURNAL_FILE, sig = ''):
+        self.path = path
+        self.cal  = '' # 設定中のカレンダ名 (targetで切り替え)
+        self.last = {} # 操作キー → 最後のエントリ
+
+        # 前回の記録を読み込む (書きかけの最終行は無視)
+        line = '\n'
+        head = None
+        if os.path.exists(path):
+            with open(path, mode='r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        ent = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 'sig' in ent:
+                        head = ent['sig']
+                    else:
+                        self.last[ent['key']] = ent
+            g_logger.debug('jnl:load %d ops from %s' % (len(self.last), path))
+
+        # 別の差分の記録(異常終了した以前の実行など)は使わない
+        if head != sig:
+            if self.last:
+                g_logger.info('jnl:前回の記録(%d件)は今回と別の差分のため破棄します' % len(self.last))
+            self.last = {}
+            line = '\n'
+            self.f = open(path, mode='w', encoding='utf-8')
+            self.f.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'), 'sig': sig}) + '\n')
+            self.f.flush()
+        else:
+            self.f = open(path, mode='a', encoding='utf-8')
+        if not line.endswith('\n'):
+            self.f.write('\n') # 書きかけの行は閉じておく
+
+    # エントリを追記 (異常終了しても残るようにディスクまで書き出す)
+    def write(self, item, st, no = '', msg = ''):
+        ent = {'time': datetime.now().isoformat(timespec='seconds'), 'key': opkey(item, self.cal), 'st': st, 'no': no, 'msg': msg}
+        self.last[ent['key']] = ent
+        self.f.write(json.dumps(ent, ensure_ascii=False) + '\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        eventdb.write(ent) # 実行履歴にも残す
+
+    # 前回の記録の状態 (記録が無ければNone)
+    def status(self, item):
+        return self.last.get(opkey(item, self.cal), {}).get('st')
+
+    # ジャーナルを閉じる (clear=1なら記録を消す)
+    def close(self, clear = 0):
+        self.f.close()
+        if clear:
+            open(self.path, mode='w').close()
+            self.last = {}
+
+################################################################################
+# util funcs
+################################################################################
+# 操作を識別するキー (カレンダ名 種別 開始 終了 summ desc)
+def opkey(item, cal = ''):
+    return '%s %s %s %s %s %s' % (cal, item.ctyp, item.tbgn, item.tend, item.summ, item.desc)
+
+# 差分の指紋 (操作の並び順には依存しない)
+def mergesig(merge):
+    h = hashlib.blake2b(digest_size=16)
+    for k in sorted(opkey(item) for item in merge):
+        h.update(k.encode('utf-8'))
+        h.update(b'\n')
+    return h.hexdigest()
+
+################################################################################
+# 共通ジャーナル (openしていなければ記録関数は何もしない)
+################################################################################
+g_journal = None
+
+def open_journal(path = JOURNAL_FILE, sig = ''):
+    global g_journal
+    g_journal = Journal(path, sig)
+    return g_journal
+
+def close_journal(clear = 0):
+    global g_journal
+    if g_journal:
+        g_journal.close(clear)
+        g_journal = None
+
+# 以降の記録/判定の対象カレンダを切り替える
+def target(cal):
+    if g_journal:
+        g_journal.cal = cal
+
+# 未適用の操作だけを返す
+# 登録ボタンを押した後に中断した操作(sent)は、重複登録を避けるため除いて、手動で確認するよう警告する
+def remains(merge):
+    if not g_journal:
+        return merge
+    ret = []
+    for item in merge:
+        st = g_journal.status(item)
+        if st == ST_APPLIED:
+            g_logger.debug('jnl:skip applied %s' % opkey(item, g_journal.cal))
+            continue
+        if st == ST_SENT:
+            g_logger.warning('jnl:登録ボタンを押した後に中断したため再実行しません。登録されているか確認してください %s' % opkey(item, g_journal.cal))
+            continue
+        ret.append(item)
+    return ret
+
+def pending(item):
+    if g_journal:
+        g_journal.write(item, ST_PENDING)
+
+def sent(item):
+    if g_journal:
+        g_journal.write(item, ST_SENT)
+
+def applied(item, no = ''):
+    if g_journal:
+        g_journal.write(item, ST_APPLIED, no)
+
+def failed(item, msg = ''):
+    if g_journal:
+        g_journal.write(item, ST_FAILED, msg=msg)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python  # -*- coding: utf-8 -*-
+#
+# SynCals  設定ファイルの読み込み
+# Copyright (c) 2025 rinos4u, released under the MIT open source license.
+#
+# 設定ファイルを読み込んだ時点で1回だけ検証し、各プラグインのcompile_confで
+# 正規表現のコンパイル、リストのタプル/集合化、逆引き表の作成を済ませておく
+# プラグインは予定ごとの処理で設定を変換せず、コンパイル済みの値をそのまま引くだけにする
+#
+# 2026.10.18 rinos4u	new
+# 2026.10.18 rinos4u	中間ファイルの形式(snapshot/yamldump)を反映
+# 2026.10.18 rinos4u	モジュールを最初に使う時に読み込むlazy_importを追加 (プラグインのwebctrl/selenium用)
+
+################################################################################
+# import
+################################################################################
+import importlib
+import importlib.util
+import re
+import sys
+import yaml
+
+import snapshot
+from logconf import g_logger
+
+################################################################################
+# const
+################################################################################
+CONF_FILE = 'config.yaml'
+
+# 必須の設定 (トップレベル)
+REQUIRED = ('cals', 'sync', 'waitsync', 'waitcopy', 'waitset', 'skipget', 'keepdriver')
+
+################################################################################
+# util funcs
+################################################################################
+# モジュールを属性の参照時に初めて読み込む (読み込み済みならそのまま返す)
+# プラグインはwebctrl(selenium)をこれで読み込み、HTMLの解析や設定のコンパイルだけならseleniumが無くても動くようにする
+def lazy_import(name):
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    spec   = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    loader.exec_module(mod)
+    return mod
+
+# 設定ファイルを読み込んでコンパイル (不正な設定ならNone)
+def load(path = CONF_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        confs = yaml.safe_load(f)
+    if not confs:
+        g_logger.error('Invalid config file')
+        return None
+    return compile_confs(confs)
+
+# 読み込み済みの設定をコンパイル (不正な設定ならNone)
+# プラグインごとの設定は、プラグインのcompile_conf(conf)で置き換える (無ければそのまま)
+def compile_confs(confs):
+    miss = [k for k in REQUIRED if k not in confs]
+    if miss:
+        g_logger.error('Invalid config: %s not found' % ', '.join(miss))
+        return None
+    try:
+        snapshot.configure(confs) # 中間ファイルの形式
+    except ValueError as e:
+        g_logger.error('Invalid config: %s' % e)
+        return None
+
+    for conf in confs['cals'] + confs['sync']:
+        try:
+            mod = importlib.import_module(conf['file'])
+            comp = getattr(mod, 'compile_conf', None)
+            if comp:
+                comp(conf)
+        except (KeyError, TypeError, ValueError, re.error, ImportError) as e:
+            g_logger.error('Invalid config %s: %s %s' % (conf.get('name'), type(e).__name__, e))
+            return None
+        g_logger.debug('cnf:compiled %s (%s)' % (conf['name'], conf['file']))
+    return confs
+
@@ -8,16 +8,38 @@
 # 2025.03.30 rinos4u	処理継続をinputで確認できるよう機能を追加
 # 2025.04.06 qqe		サイボウズからのコピーモードを追加
 # 2026.04.26 rinos4u	カレンダ取得/設定例外のリトライ追加
+# 2026.10.18 rinos4u	常駐ブラウザの初期化をwebctrl.initconfに変更(ヘッドレス/リソースブロック対応)
+# 2026.10.18 rinos4u	カレンダ取得の並列実行(parallelget)を追加
+# 2026.10.18 rinos4u	並列取得のブラウザをwebctrl.Poolから借りるように変更
+# 2026.10.18 rinos4u	予定設定をjournalに記録し、リトライ/再実行時は適用済みの操作を飛ばすように変更
+# 2026.10.18 rinos4u	更新(~)の予定も同期対象として表示
+# 2026.10.18 rinos4u	設定をloadconfで読み込み、プラグインごとにコンパイルしてから渡すように変更
+# 2026.10.18 rinos4u	予定を共通のEventで扱い、中間ファイルの読み書き時だけ辞書に変換
+# 2026.10.18 rinos4u	中間マージファイルをsnapshot(既定はバイナリ)で読み書きするように変更
+# 2026.10.18 rinos4u	取得した予定/差分/書き込み結果を実行ごとにSQLite(eventdb)に記録
+# 2026.10.18 rinos4u	同期の入力が前回(設定する予定無し)と同じなら同期/設定を省略(fastpath)
+# 2026.10.18 rinos4u	ジャーナルの適用済み判定をカレンダごとに行うように変更
+# 2026.10.18 rinos4u	中断(exit)時も実行履歴DBの実行を終了して閉じる
+# 2026.10.18 rinos4u	ジャーナルを差分の指紋で区切り、別の差分の記録で操作を飛ばさないように変更
 
 ################################################################################
 # import
 ################################################################################
 import importlib
-import yaml
 import webctrl
+import journal
+import loadconf
+import snapshot
+import eventdb
 from logconf import g_logger
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import sys
+import os
 import re
+import json
+import hashlib
+from datetime import datetime
 
 ################################################################################
 # const
@@ -27,10 +49,16 @@ APP_VER = '1.0.4'
 CONF_FILE = 'config.yaml'
 
 # 中間マージファイルの出力用
-MERGE_FILE = 'log/mid_merge.yaml'
+MERGE_FILE = 'log/mid_merge' # 拡張子は形式(snapshot)に応じて付く
+
+# 前回の同期結果 (fastpath用)
+LAST_FILE = 'log/last_sync.json'
 
 DESC_MAX = 25 # 表示目的のみ。よく使う画面幅に応じて設定。
 
+# カレンダに設定する予定の種別 (追加、削除、更新)
+SET_TYPES = ('+', '-', '~')
+
 # ChromeDriverのバージョンエラー検出
 CD_ERR = re.compile(r'.*Chrome version (\d*)\n.*Current browser version is ([\d.]*)')
 CD_URL = 'https://googlechromelabs.github.io/chrome-for-testing/'
@@ -42,38 +70,95 @@ CD_URL = 'https://googlechromelabs.github.io/chrome-for-testing/'
 ################################################################################
 # util funcs
 ################################################################################
+# 設定を比較用の文字列にする (辞書/集合は順序に依存しない形、正規表現はパターン)
+def conf_text(v):
+    if isinstance(v, dict):
+        return '{%s}' % ','.join(sorted('%s:%s' % (conf_text(k), conf_text(x)) for k, x in v.items()))
+    if isinstance(v, (set, frozenset)):
+        return '{%s}' % ','.join(sorted(conf_text(x) for x in v))
+    if isinstance(v, (list, tuple)):
+        return '[%s]' % ','.join(conf_text(x) for x in v)
+    if isinstance(v, re.Pattern):
+        return 're(%r,%d)' % (v.pattern, v.flags)
+    return repr(v)
+
+# 同期の入力(取得した予定と読み込んだ設定)の指紋。予定の並び順や設定ファイルの書式(コメント等)には依存しない
+def sync_fingerprint(confs, merge):
+    h = hashlib.blake2b(conf_text(confs).encode('utf-8'), digest_size=16)
+    for k in sorted(repr(e.key()) for e in merge):
+        h.update(k.encode('utf-8'))
+        h.update(b'\n')
+    return h.hexdigest()
+
+# 前回の同期結果 {'hash': 入力の指紋, 'count': 設定が必要だった件数, 'time': 実行時刻} (無ければNone)
+def load_last(path = LAST_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# 今回の同期結果を保存
+def save_last(fp, count, path = LAST_FILE):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'hash': fp, 'count': count, 'time': datetime.now().isoformat(' ', 'seconds')}, f)
+    os.replace(path + '.tmp', path) # 書きかけのファイルを残さない
 
 ################################################################################
 # Data control
 ################################################################################
 
+# 1つのカレンダから情報を取得 (例外時はgetretry回だけ取得を繰り返す)
+# pool指定時は、プールから借りたブラウザで取得する
+def get_cal(conf, pool = None):
+    g_logger.debug('top:import plugin %s for %s (GET)' % (conf['file'], conf['name']))
+    mod = importlib.import_module(conf['file'])
+
+    # リトライだけ取得を繰り返す
+    retry = conf.get('getretry', 0)
+    while True:
+        try:
+            with pool.session() if pool else nullcontext():
+                return mod.get_cal(conf)
+        except Exception as e:
+            g_logger.debug('%s - get_cal' % conf['name'], exc_info=True) #ダンプはログファイルのみに出す
+            cderr = CD_ERR.match(str(e))
+            if cderr:
+                g_logger.info('ChromeDriverをバージョンアップしてください (%s → %s)' % cderr.groups())
+                g_logger.info(CD_URL)
+                exit(101)
+
+        retry -= 1
+        if retry < 0:
+            g_logger.info('GETプラグインの例外により、プログラムを中断します')
+            exit(102)
+        g_logger.info('GETプラグインの例外により取得をリトライします(残:%d回)' % retry)
+
 # confsに定義されたカレンダーから情報を取得
 def get_cals(confs):
-    ret = []
-    for conf in confs['cals']:
-        g_logger.debug('top:import plugin %s for %s (GET)' % (conf['file'], conf['name']))
-        mod = importlib.import_module(conf['file'])
-
-        # リトライだけ取得を繰り返す
-        retry = conf.get('getretry', 0)
-        while True:
-            try:
-                dat = mod.get_cal(conf)
-                break
-            except Exception as e:
-                g_logger.debug('%s - get_cal' % conf['name'], exc_info=True) #ダンプはログファイルのみに出す
-                cderr = CD_ERR.match(str(e))
-                if cderr:
-                    g_logger.info('ChromeDriverをバージョンアップしてください (%s → %s)' % cderr.groups())
-                    g_logger.info(CD_URL)
-                    exit(101)
+    cals = confs['cals']
+    if confs.get('parallelget', 0) and len(cals) > 1:
+        # カレンダごとに別スレッド&別ブラウザで同時に取得
+        # ブラウザはプラグインのlogin関数でログイン済みにしたものをプールから借りる
+        # 同時に起動するブラウザはプロファイルを分ける必要があるため、未指定ならプラグイン名で分ける
+        g_logger.debug('top:parallel get %d cals' % len(cals))
+        pools = []
+        for conf in cals:
+            mod = importlib.import_module(conf['file'])
+            pools.append(webctrl.Pool(conf, 1, getattr(mod, 'login', None), conf.get('profile', '%s_%s' % (webctrl.CHROME_PROFILE_PATH, conf['file']))))
+        try:
+            with ThreadPoolExecutor(max_workers=len(cals)) as ex:
+                futs = [ex.submit(get_cal, conf, pool) for pool, conf in zip(pools, cals)]
+            dats = [f.result() for f in futs] # 例外(exit含む)はここで再送出される
+        finally:
+            for pool in pools:
+                pool.close()
+    else:
+        dats = [get_cal(conf) for conf in cals]
 
-            retry -= 1
-            if retry < 0:
-                g_logger.info('GETプラグインの例外により、プログラムを中断します')
-                exit(102)
-            g_logger.info('GETプラグインの例外により取得をリトライします(残:%d回)' % retry)
-    
+    # 結果はconfsの定義順にマージ
+    ret = []
+    for conf, dat in zip(cals, dats):
         if len(dat):
             g_logger.info('%sから%d件取得しました' % (conf['name'], len(dat)))
             ret += dat
@@ -92,17 +177,26 @@ def get_cals(confs):
     return ret
 
 # 同期した差分を各カレンダに設定
+# journal=1なら操作をカレンダごとにジャーナルに記録し、前回までにそのカレンダに適用済みの操作は飛ばす (全て完了したらジャーナルを消す)
+# ジャーナルは同じ差分の間だけ有効 (取得し直して差分が変われば、以前の記録は使わない)
 def set_cals(confs, merge):
     ret = 0
+    if confs.get('journal', 1):
+        journal.open_journal(sig=journal.mergesig(merge))
+
     for conf in confs['cals']:
         g_logger.debug('top:import plugin %s for %s (SET)' % (conf['file'], conf['name']))
         mod = importlib.import_module(conf['file'])
+        journal.target(conf['name'])
+        rest = journal.remains(merge)
+        if len(rest) < len(merge):
+            g_logger.info('%sは前回までに適用済みの%d件を除いて設定します' % (conf['name'], len(merge) - len(rest)))
 
         # リトライだけ取得を繰り返す
         retry = conf.get('setretry', 0)
         while True:
             try:
-                ret += mod.set_cal(conf, merge)
+                ret += mod.set_cal(conf, journal.remains(merge)) # リトライ時も適用済みは除く
                 break
             except Exception as e:
                 g_logger.debug('%s - set_cal' % conf['name'],exc_info=True) #ダンプはログファイルのみに出す
@@ -118,6 +212,7 @@ def set_cals(confs, merge):
                 exit(104)
             g_logger.info('SETプラグインの例外により取得をリトライします(残:%d回)' % retry)
 
+    journal.close_journal(1)
     return ret
 
 # カレンダの同期
@@ -127,6 +222,7 @@ def sync_cals(confs, merge):
         mod = importlib.import_module(conf['file'])
         try:
             merge = mod.sync_cal(conf, merge)
+            eventdb.ops(merge, conf['file'])
         except Exception:
             #g_logger.exception('SYNCプラグイン例外(%s)' % conf['name'])
             g_logger.debug('%s - sync_cal' % conf['name'],exc_info=True) #ダンプはログファイルのみに出す
@@ -158,8 +254,10 @@ def DoSync(confs):
     if confs['skipget']:
         # 前回保存したデータを読み込んで進む 
         g_logger.info('top:load old merge file')
-        with open(MERGE_FILE, mode='r', encoding='utf-8') as f:
-            merge = yaml.safe_load(f)
+        merge = snapshot.load(MERGE_FILE)
+        if merge is None:
+            g_logger.error('top:merge file not found %s' % MERGE_FILE)
+            return 203
     else:
         # カレンダーにアクセスして情報を抽出
         g_logger.debug('top:get schedule')
@@ -167,8 +265,22 @@ def DoSync(confs):
         g_logger.debug('top:get %d items', len(merge))
 
         # 中間ファイルの保存(skipget=1の場合に利用 & デバッグ用)
-        with open(MERGE_FILE, mode='w', encoding='utf-8') as f:
-            yaml.safe_dump(merge, f, allow_unicode=True)
+        snapshot.save(MERGE_FILE, merge)
+    eventdb.events(merge)
+
+    # fastpath=1で入力が前回の同期と同じで、前回設定する予定が無かったなら同期/設定を省略 (確認も出さない)
+    # skipgetは保存したデータの解析(デバッグ用)なので省略しない
+    # quickgetは前回の予定を使って取得を省略しているため、取得結果が前回と同じでも実際の予定と同じとは限らないので省略しない
+    fp = None
+    quick = [c['name'] for c in confs['cals'] if c.get('quickget', 0)]
+    if quick and confs.get('fastpath', 0):
+        g_logger.debug('top:fastpath disabled by quickget %s' % quick)
+    elif confs.get('fastpath', 0) and not confs['skipget']:
+        fp = sync_fingerprint(confs, merge)
+        last = load_last()
+        if last and last.get('hash') == fp and last.get('count') == 0:
+            g_logger.info('合計%d件読み込みました。前回(%s)の同期から変更が無いため、同期を省略します' % (len(merge), last.get('time')))
+            return 0
 
     # カレンダーの読み込み数を表示して、継続してよいか確認
     print('─' * 70)
@@ -183,16 +295,20 @@ def DoSync(confs):
     merge2 = sync_cals(confs, merge)
     count = 0
     for item in merge2:
-        if item['ctyp'] == '+' or item['ctyp'] == '-':
+        if item.ctyp in SET_TYPES:
             count += 1
-            g_logger.info('%s%3d %s～%s %s "%s%s"' % (item['ctyp'], count, item['tbgn'].strftime("%m/%d %H:%M"), item['tend'].strftime("%H:%M"), '-'.join(item['summ'].split('@')[:3]), item['desc'][:DESC_MAX], '…' if len(item['desc']) > DESC_MAX else ''))
+            g_logger.info('%s%3d %s～%s %s "%s%s"' % (item.ctyp, count, item.tbgn.strftime("%m/%d %H:%M"), item.tend.strftime("%H:%M"), '-'.join(item.split()[:3]), item.desc[:DESC_MAX], '…' if len(item.desc) > DESC_MAX else ''))
+
+    # 同期結果を残す (設定する予定が無ければ、次回同じ入力なら同期を省略できる)
+    if fp:
+        save_last(fp, count)
 
     # 同期リストでカレンダー登録してよいか確認
     setcount = 0
     if count:
         print('─' * 70)
         if confs['waitset']:
-            ret = input('%d件のカレンダ登録/削除に進みますか？(y/n):' % count)
+            ret = input('%d件のカレンダ登録/削除/更新に進みますか？(y/n):' % count)
             if ret != 'y' and ret != 'Y':
                 g_logger.info('処理を中止しました')
                 return 202
@@ -212,21 +328,22 @@ def DoCopy(confs):
     g_logger.debug('top:get schedule')
     merge = get_one_cals(confs)
     g_logger.debug('top:get %d items', len(merge))
+    eventdb.events(merge)
 
     # 同期処理を実行し、同期が必要なデータを表示
     merge2 = sync_cals(confs, merge)
 
     count = 0
     for item in merge2:
-        if item['ctyp'] == '+' or item['ctyp'] == '-':
+        if item.ctyp in SET_TYPES:
             count += 1
-            g_logger.info('%s%3d %s～%s %s "%s%s"' % (item['ctyp'], count, item['tbgn'].strftime("%m/%d %H:%M"), item['tend'].strftime("%H:%M"), '-'.join(item['summ'].split('@')[:3]), item['desc'][:DESC_MAX], '…' if len(item['desc']) > DESC_MAX else ''))
+            g_logger.info('%s%3d %s～%s %s "%s%s"' % (item.ctyp, count, item.tbgn.strftime("%m/%d %H:%M"), item.tend.strftime("%H:%M"), '-'.join(item.split()[:3]), item.desc[:DESC_MAX], '…' if len(item.desc) > DESC_MAX else ''))
     
     # 同期リストでカレンダー登録してよいか確認
     if count:
         print('─' * 70)
         if confs['waitcopy']:
-            ret = input('%d件のカレンダ登録/削除に進みますか？(y/n):' % count)
+            ret = input('%d件のカレンダ登録/削除/更新に進みますか？(y/n):' % count)
             if ret != 'y' and ret != 'Y':
                 g_logger.info('処理を中止しました')
                 return 202
@@ -242,29 +359,37 @@ def DoCopy(confs):
 # main
 ################################################################################
 if __name__ == '__main__':
-    # 設定を開く
-    with open(CONF_FILE, 'r', encoding='utf-8') as f:
-        confs = yaml.safe_load(f)
+    # 設定を開く (読み込み時に検証して、プラグインごとの設定をコンパイルしておく)
+    confs = loadconf.load(CONF_FILE)
     if not confs:
-        g_logger.error('Invalid config file')
         exit(-1)
 
     g_logger.debug('top:start SyncCalc %s %s' % (APP_VER, confs['keepdriver']))
 
     # ブラウザ常駐設定ならメインでブラウザを開いておく (終了まで使いまわす)
     if confs['keepdriver']:
-        webctrl.init(confs['devscale'])
-        webctrl.init(
-            scale=confs.get('devscale', '1.0'),
-            chrome_exe=confs.get('chrome_exe', webctrl.CHROME_EXE_PATH),
-            driver_path=confs.get('driver_path', webctrl.CHROME_DRIVER_PATH)
-        )
+        webctrl.initconf(confs)
+
+    # 実行履歴DBを開く
+    if confs.get('eventdb', 1):
+        eventdb.open_db(keep=confs.get('eventkeep', eventdb.DB_KEEP))
 
     # 引数に応じてモードを切り替え
-    if len(sys.argv) < 2:
-        ret = DoSync(confs)
-    else:
-        ret = DoCopy(confs)
+    # 途中のexit(中断)でも実行履歴は終了状態を記録して閉じる (閉じないと古い履歴の削除も行われない)
+    ret = -1
+    try:
+        if len(sys.argv) < 2:
+            eventdb.begin('sync')
+            ret = DoSync(confs)
+        else:
+            eventdb.begin('copy')
+            ret = DoCopy(confs)
+    except SystemExit as e:
+        ret = e.code
+        raise
+    finally:
+        eventdb.end(ret)
+        eventdb.close_db()
 
     # ブラウザ常駐設定ならメインで開放
     if confs['keepdriver']:
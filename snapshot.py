@@ -0,0 +1,114 @@
+#!/usr/bin/env python  # -*- coding: utf-8 -*-
+#
+# SynCals  中間ファイル(予定リストのスナップショット)の読み書き
+# Copyright (c) 2025 rinos4u, released under the MIT open source license.
+#
+# 予定リストを項目ごとの列(columnar)にまとめてpickleで保存し、読み込み時にEventへ戻す
+# YAMLは予定数が増えると最も遅い処理になるため、デバッグ用の出力(yamldump)としてのみ残す
+# 形式(snapshot)はloadconfで設定を読み込んだ時に切り替える
+#  - pickle: 高速なバイナリ (拡張子.pkl)。自分で書き出したファイルだけを読むこと
+#  - yaml:   従来のテキスト (拡張子.yaml)
+# 読み込みは指定形式のファイルが無ければ、もう一方の形式を探す
+#
+# 2026.10.18 rinos4u	new
+# 2026.10.18 rinos4u	saveで書いた追加列をload_extraで読み戻せるように変更
+
+################################################################################
+# import
+################################################################################
+import os
+import pickle
+import yaml
+from itertools import repeat
+
+import event
+from event import Event, FIELDS
+from logconf import g_logger
+
+################################################################################
+# const
+################################################################################
+SNAP_VER = 1
+
+# 形式 → 拡張子
+SNAP_EXT = {
+    'pickle': '.pkl',
+    'yaml':   '.yaml',
+}
+
+################################################################################
+# globals
+################################################################################
+g_format   = 'pickle' # 保存形式
+g_yamldump = 0        # 1ならpickleに加えてYAMLも書き出す (デバッグ用)
+
+################################################################################
+# util funcs
+################################################################################
+# 設定の反映 (snapshot: 形式, yamldump: YAMLも書き出すか)
+def configure(confs):
+    global g_format, g_yamldump
+    fmt = confs.get('snapshot', 'pickle')
+    if fmt not in SNAP_EXT:
+        raise ValueError('snapshot %s' % fmt)
+    g_format   = fmt
+    g_yamldump = confs.get('yamldump', 0)
+
+# YAML用の辞書リスト (extraは予定と同じ並びの追加列。辞書の項目を上書きする)
+def snap_dicts(events, extra):
+    ret = event.todicts(events)
+    for key, col in extra.items():
+        for d, v in zip(ret, col):
+            d[key] = v
+    return ret
+
+# 予定リストを保存 (pathは拡張子無し)。extraは予定と同じ並びの追加列 (名前 → リスト)
+def save(path, events, **extra):
+    if g_format == 'pickle':
+        # 列ごとにまとめる (省略可の項目は値のある列だけ)
+        cols = {}
+        for f in FIELDS:
+            col = [getattr(e, f) for e in events]
+            if f in event.OPTIONAL and not any(v is not None for v in col):
+                continue
+            cols[f] = col
+        tmp = path + SNAP_EXT['pickle'] + '.tmp'
+        with open(tmp, mode='wb') as f:
+            pickle.dump({'ver': SNAP_VER, 'count': len(events), 'cols': cols, 'extra': extra}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path + SNAP_EXT['pickle']) # 書きかけのファイルを残さない
+
+    if g_format == 'yaml' or g_yamldump:
+        with open(path + SNAP_EXT['yaml'], mode='w', encoding='utf-8') as f:
+            yaml.safe_dump(snap_dicts(events, extra), f, allow_unicode=True)
+    g_logger.debug('snp:save %s %d events (%s)' % (path, len(events), g_format))
+
+# 予定リストを読み込む (pathは拡張子無し)。ファイルが無ければNone
+def load(path):
+    ret = load_extra(path)
+    return ret and ret[0]
+
+# 予定リストと、saveで書いた追加列(namesで指定、無い列はNone)を読み込む。ファイルが無ければNone
+# ※YAMLは追加列で辞書の項目を上書きしているため、同じ名前の項目は予定側も追加列の値になる
+def load_extra(path, names = ()):
+    order = [g_format] + [f for f in SNAP_EXT if f != g_format]
+    for fmt in order:
+        name = path + SNAP_EXT[fmt]
+        if not os.path.exists(name):
+            continue
+        if fmt == 'pickle':
+            with open(name, mode='rb') as f:
+                snap = pickle.load(f)
+            if snap.get('ver') != SNAP_VER:
+                g_logger.warning('snp:unknown version %s %s' % (name, snap.get('ver')))
+                continue
+            cols = snap['cols']
+            ret = [Event(*row) for row in zip(*[cols.get(f) or repeat(None, snap['count']) for f in FIELDS])]
+            extra = {key: snap['extra'].get(key) for key in names}
+        else:
+            with open(name, mode='r', encoding='utf-8') as f:
+                dicts = yaml.safe_load(f) or []
+            ret = event.fromdicts(dicts)
+            extra = {key: [d.get(key) for d in dicts] if any(key in d for d in dicts) else None for key in names}
+        g_logger.debug('snp:load %s %d events' % (name, len(ret)))
+        return ret, extra
+    return None
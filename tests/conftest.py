@@ -0,0 +1,14 @@
+# SynCals  テスト共通設定
+#
+# ログ/中間ファイル/対応表はカレントのlog/に書かれるため、テストは一時フォルダをカレントにして実行する
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# logconfはimport時にlog/synccals.logを開くため、プラグインのimport前に移動しておく
+os.chdir(tempfile.mkdtemp(prefix='synccals_'))
+os.makedirs('log', exist_ok=True)
@@ -0,0 +1,44 @@
+# SynCals  airrの設定コンパイルのテスト
+
+import pytest
+
+import airr
+
+
+@pytest.fixture
+def conf():
+    return {
+        'user':      'user',
+        'pass':      'pass',
+        'range':     3,
+        'group':     ['江戸', '大阪'],
+        'roomres':   ['合議室', '帝鑑之間'],
+        'addmenu':   'サイボウズ',
+        'addsei':    '・',
+        'delreason': '店舗都合',
+    }
+
+
+def test_compile_conf(conf):
+    airr.compile_conf(conf)
+    assert conf['roomres'] == frozenset({'合議室', '帝鑑之間'})
+    assert conf['group'] == ('江戸', '大阪')
+
+
+def test_compile_conf_missing_key(conf):
+    del conf['roomres']
+    with pytest.raises(KeyError):
+        airr.compile_conf(conf)
+
+
+def test_compile_conf_invalid_fetch(conf):
+    conf['fetch'] = 'xml'
+    with pytest.raises(ValueError):
+        airr.compile_conf(conf)
+
+
+def test_book_swaps_room_and_person(conf):
+    airr.compile_conf(conf)
+    book = airr.ar_book(conf, '江戸', 'AB1', None, None, '定例 会議', 'サイボウズ', '山田、合議室')
+    assert book.summ == '江戸@合議室@山田@サイボウズ@AB1'
+    assert book.desc == '定例会議'
@@ -0,0 +1,135 @@
+# SynCals  cb2arの差分テスト
+
+from datetime import datetime
+
+import pytest
+
+import cb2ar
+import eventdb
+import idmap
+from event import Event
+
+TBGN = datetime(2026, 10, 19, 10, 0)
+TEND = datetime(2026, 10, 19, 11, 0)
+
+
+@pytest.fixture
+def conf():
+    return cb2ar.compile_conf({
+        'room':     {'部屋A': ['江戸', '合議室']},
+        'person':   {'山田': '江戸'},
+        'noroom':   '不使用',
+        'noperson': '担当無し',
+        'automenu': 'サイボウズ',
+        'compdesc': 1,
+        'difflog':  1,
+    })
+
+
+@pytest.fixture(autouse=True)
+def clear_idmap():
+    idmap.save({})
+
+
+
+# putした対応はflushするまで保存せず、flushで既存の対応表に追記する
+def test_idmap_flush():
+    idmap.save({'U1@江戸@合議室@山田': 'AB1'})
+    idmap.put(Event('airr', TBGN, TEND, '江戸@合議室@佐藤', '', 'U2'), 'AB2')
+    idmap.put(Event('airr', TBGN, TEND, '江戸@合議室@佐藤', ''), 'AB3') # UID無しは記録しない
+    assert idmap.load() == {'U1@江戸@合議室@山田': 'AB1'}
+    idmap.flush()
+    assert idmap.load() == {'U1@江戸@合議室@山田': 'AB1', 'U2@江戸@合議室@佐藤': 'AB2'}
+    assert not idmap.g_pending
+
+
+# サイボウズの予定 (部屋と人の2行で1会議)
+def cybozu(desc):
+    return [Event('cybozu', TBGN, TEND, '部屋A', desc, 'U1'),
+            Event('cybozu', TBGN, TEND, '山田',  desc, 'U1')]
+
+
+# 自動入力したAirリザーブの予約
+def airr(desc, menu = 'サイボウズ'):
+    return Event('airr', TBGN, TEND, '江戸@合議室@山田@%s@AB1' % menu, cb2ar.normalize_text(desc))
+
+
+def test_match_by_id(conf):
+    idmap.save({'U1@江戸@合議室@山田': 'AB1'})
+    assert cb2ar.sync_cal(conf, cybozu('定例会議') + [airr('定例会議')]) == []
+
+
+def test_rename_by_id_is_update(conf):
+    idmap.save({'U1@江戸@合議室@山田': 'AB1'})
+    ret = cb2ar.sync_cal(conf, cybozu('定例会議2') + [airr('定例会議')])
+    assert len(ret) == 1
+    upd = ret[0]
+    assert upd.ctyp == '~'
+    assert upd.no == 'AB1'
+    assert upd.desc == cb2ar.normalize_text('定例会議2')
+    assert upd.odesc == cb2ar.normalize_text('定例会議')
+    assert (upd.obgn, upd.oend) == (TBGN, TEND)
+    assert idmap.load() == {'U1@江戸@合議室@山田': 'AB1'}
+
+
+def test_rename_without_idmap(conf):
+    ret = cb2ar.sync_cal(conf, cybozu('全然違う名前') + [airr('定例会議')])
+    assert sorted(e.ctyp for e in ret) == ['+', '-']
+
+
+def test_rename_ignored_without_compdesc(conf):
+    conf['compdesc'] = 0
+    idmap.save({'U1@江戸@合議室@山田': 'AB1'})
+    assert cb2ar.sync_cal(conf, cybozu('定例会議2') + [airr('定例会議')]) == []
+
+
+def test_rename_manual_booking_not_updated(conf):
+    idmap.save({'U1@江戸@合議室@山田': 'AB1'})
+    ret = cb2ar.sync_cal(conf, cybozu('定例会議2') + [airr('定例会議', '手入力')])
+    assert [e.ctyp for e in ret] == ['+']
+
+
+# 前回の実行でcyb件のサイボウズ予定を取得した履歴を作り、今回の実行を開始する
+@pytest.fixture
+def history(tmp_path):
+    def make(prev):
+        eventdb.open_db(str(tmp_path / 'events.db'))
+        eventdb.begin('sync')
+        eventdb.events(prev)
+        eventdb.end(0)
+        eventdb.begin('sync')
+    yield make
+    eventdb.close_db()
+
+
+def test_dropguard_keeps_bookings(conf, history):
+    conf['dropguard'] = 0.5
+    prev = cybozu('定例会議') + [Event('cybozu', TBGN.replace(day=20 + i), TEND.replace(day=20 + i), '部屋A', 'x%d' % i) for i in range(4)]
+    history(prev)
+    merge = [airr('定例会議')]
+    eventdb.events(merge)
+    assert cb2ar.sync_cal(conf, merge) == []
+
+
+def test_dropguard_small_change_deletes(conf, history):
+    conf['dropguard'] = 0.5
+    history(cybozu('定例会議'))
+    merge = cybozu('別の会議')[:1] + [airr('定例会議')]
+    eventdb.events(merge)
+    assert '-' in [e.ctyp for e in cb2ar.sync_cal(conf, merge)]
+
+
+def test_dropguard_disabled_by_default(conf, history):
+    history(cybozu('定例会議') * 3)
+    merge = [airr('定例会議')]
+    eventdb.events(merge)
+    assert [e.ctyp for e in cb2ar.sync_cal(conf, merge)] == ['-']
+
+
+# 今回の期間より前の予定は、前回の予定数に含めない
+def test_dropguard_ignores_past_events(conf, history):
+    conf['dropguard'] = 0.5
+    history(cybozu('定例会議') + [Event('cybozu', TBGN.replace(day=1 + i), TEND.replace(day=1 + i), '部屋A', 'x%d' % i) for i in range(4)])
+    merge = cybozu('別の会議')[:1] + [airr('定例会議')]
+    eventdb.events(merge)
+    assert '-' in [e.ctyp for e in cb2ar.sync_cal(conf, merge)]
@@ -0,0 +1,140 @@
+# SynCals  cybozuのHTTP取得モードの解析テスト
+#
+# cybozu_week.htmlはグループ週表示のページを保存して、予定/メンバーを置き換えたもの
+# HTTP取得(CbHtml)とブラウザ取得(webctrl.table)が同じ予定を返すことを確認する (ブラウザ/seleniumは使わない)
+
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import cybozu
+
+SERV = 'example'
+BASE = 'https://example.cybozu.com/o/ag.cgi?page=ScheduleIndex'
+HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cybozu_week.html')
+DAY  = datetime(2026, 10, 18)
+
+
+def link(uid, eid, date = None):
+    if date is None:
+        return 'https://example.cybozu.com/o/ag.cgi?page=ScheduleView&UID=%d&sEID=%d' % (uid, eid)
+    return ('https://example.cybozu.com/o/ag.cgi?page=ScheduleView&UID=%d&GID=101&Date=da.2026.10.%d&BDate=da.2026.10.18&sEID=%d'
+            % (uid, date, eid))
+
+
+MEMBER = 'https://example.cybozu.com/o/ag.cgi?page=UserListIndex&UID=12'
+
+# ブラウザで同じページを開いた時のwebctrl.texts/webctrl.tableの結果 (innerText、リンクは絶対URL)
+BROWSER_DATES = ['週表示', '2026年 10月 18日', '10/18(日)', '10/19(月)']
+BROWSER_ROWS  = [
+    {'head': '山田\n江戸事務所',
+     'cells': ['', '10:00-11:00\n定例会議', '13:00-14:00\n打合せ\n15:00-16:00\n来客', '', '', '', ''],
+     'links': [[], [link(11, 501, 19)], [link(11, 502, 20), link(11, 503, 20)], [], [], [], []]},
+    {'head': '合議室',
+     'cells': ['', '10:00-11:00\n定例会議', '', '', '', '', ''],
+     'links': [[], [link(11, 501, 19)], [], [], [], [], []]},
+    {'head': '佐藤\n大阪事務所',
+     'cells': ['', '09:00-10:00\n朝会\n会議室\t佐藤', '会議室', '佐藤'],
+     'links': [[], [link(12, 601), MEMBER], [], [MEMBER]]},
+]
+
+
+@pytest.fixture
+def conf():
+    return cybozu.compile_conf({
+        'name':        'cybozu',
+        'serv':        SERV,
+        'user':        'user',
+        'pass':        'pass',
+        'range':       7,
+        'group':       [{'name': '江戸事務所', 'target': ['山田', '合議室']},
+                        {'name': '大阪事務所', 'target': ['佐藤']}],
+        'alltime':     '00:00-23:59',
+        'alldayre':    '^終日',
+        'incremental': 0,
+    })
+
+
+# 対象グループが1つだけの設定も読み込める
+def test_compile_conf_single_group(conf):
+    conf['group'] = conf['group'][:1]
+    assert cybozu.compile_conf(conf)['group'][0]['target'] == ('山田', '合議室')
+
+
+@pytest.fixture
+def html():
+    with open(HTML, encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def page(html):
+    return cybozu.cb_httpparse(BASE, html)
+
+
+def test_groups_and_dates(page):
+    assert page.groups == {'江戸事務所': '101', '大阪事務所': '102'}
+    assert page.dates == BROWSER_DATES
+
+
+# webctrl.table(querySelectorAll('td'))と同じく、ネストしたtableのtdも開始順にセルとして拾う
+# (ブラウザのinnerTextはセル間をタブで区切るが、CbHtmlは空白1つにする)
+def test_nested_cells_like_browser(page):
+    row = page.rows[2]
+    assert row['head'] == '佐藤\n大阪事務所'
+    assert row['cells'] == ['', '09:00-10:00\n朝会\n会議室 佐藤', '会議室', '佐藤']
+    assert row['links'] == BROWSER_ROWS[2]['links']
+
+
+# 終了タグの無いtdは次のtd/行の終わりで閉じる
+def test_unclosed_cells(page):
+    assert page.rows[1] == BROWSER_ROWS[1]
+    assert page.rows[0] == BROWSER_ROWS[0]
+
+
+# HTTP取得の1週分が、ブラウザ取得の1週分と同じ予定になる
+def test_httpweek_matches_browser(conf, html, monkeypatch):
+    group = conf['group'][0]
+    cli = SimpleNamespace(get=lambda url: (200, None, html))
+    http = cybozu.cb_httpweek(conf, cli, group, '101', DAY, DAY, DAY + cybozu.timedelta(days=7))
+
+    monkeypatch.setattr(cybozu, 'webctrl', SimpleNamespace(texts=lambda css: BROWSER_DATES, table=lambda css: BROWSER_ROWS))
+    browser = cybozu.cb_readweek(conf, group, DAY, DAY + cybozu.timedelta(days=7))
+
+    assert [e.todict() for e in http] == [e.todict() for e in browser]
+    assert [(e.tbgn, e.tend, e.summ, e.desc) for e in http] == [
+        (datetime(2026, 10, 19, 10), datetime(2026, 10, 19, 11), '山田',   '定例会議'),
+        (datetime(2026, 10, 19, 10), datetime(2026, 10, 19, 11), '合議室', '定例会議'),
+        (datetime(2026, 10, 20, 13), datetime(2026, 10, 20, 14), '山田',   '打合せ'),
+        (datetime(2026, 10, 20, 15), datetime(2026, 10, 20, 16), '山田',   '来客'),
+    ]
+    # 予定IDは予定ごとのsEID:日付 (UIDは山田のユーザIDなので使わない)
+    assert [e.uid for e in http] == ['501:2026.10.19', '501:2026.10.19', '502:2026.10.20', '503:2026.10.20']
+
+
+# 同じ予定への連続したリンクはまとめ、sEIDの無いリンクはUIDをそのまま使う
+def test_uids():
+    assert cybozu.cb_uids([link(11, 501, 19), link(11, 501, 19), link(11, 502, 19), MEMBER]) == ['501:2026.10.19', '502:2026.10.19']
+    assert cybozu.cb_uids([link(12, 601), link(12, 601)]) == ['601']
+    view = 'https://example.cybozu.com/o/ag.cgi?page=ScheduleView&UID=%d'
+    assert cybozu.cb_uids([view % 11, view % 11]) == ['11', '11']
+
+
+# タブでの読み込みに失敗したら、その組の週を順に読み込む
+def test_scanlinktabs_fallback(conf, monkeypatch):
+    def newtab(url):
+        raise RuntimeError('tab crashed')
+    monkeypatch.setattr(cybozu, 'webctrl', SimpleNamespace(tab=lambda h=None: 'top', newtab=newtab, closetab=lambda h: None))
+    monkeypatch.setattr(cybozu, 'cb_retry', lambda conf, func: func())
+    monkeypatch.setattr(cybozu, 'cb_readlink', lambda conf, group, gid, day, daymin, daymax: [(group['name'], gid, day)])
+    conf['tabs'] = 2
+    assert cybozu.cb_scanlinktabs(conf, ['101', '102'], DAY, DAY + cybozu.timedelta(days=7)) == [
+        [('江戸事務所', '101', DAY)], [('大阪事務所', '102', DAY)]]
+
+
+# セッション切れでログイン画面(200)が返ったら、例外にせずNone(ブラウザでの取得に切り替え)
+def test_httpweek_login_page(conf):
+    cli = SimpleNamespace(get=lambda url: (200, None, '<html><body><form id="login"></form></body></html>'))
+    assert cybozu.cb_httpweek(conf, cli, conf['group'][0], '101', DAY, DAY, DAY + cybozu.timedelta(days=7)) is None
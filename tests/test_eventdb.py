@@ -0,0 +1,39 @@
+# SynCals  実行履歴DBのテスト
+
+from datetime import datetime
+
+import pytest
+
+import eventdb
+from event import Event
+
+D = lambda day, hour: datetime(2026, 10, day, hour)
+
+PREV = [Event('airr', D(19, 10), D(19, 11), '江戸@合議室@山田@サイボウズ@AB1', '定例会議'),
+        Event('airr', D(20, 10), D(20, 11), '江戸@合議室@山田@サイボウズ@AB2', '打合せ'),
+        Event('airr', D(20, 10), D(20, 11), '大阪@合議室@豊臣@サイボウズ@AB3', '打合せ')]
+
+
+@pytest.fixture
+def db(tmp_path):
+    eventdb.open_db(str(tmp_path / 'events.db'))
+    eventdb.begin('sync')
+    eventdb.events(PREV)
+    eventdb.end(0)
+    eventdb.begin('sync')
+    eventdb.events(PREV[:1])
+    yield
+    eventdb.close_db()
+
+
+def test_prev_events_by_store_and_time(db):
+    assert eventdb.prev_events('airr') == PREV
+    assert eventdb.prev_events('airr', store='江戸') == PREV[:2]
+    assert eventdb.prev_events('airr', tmin=D(20, 0)) == PREV[1:]
+    assert eventdb.prev_events('airr', store='江戸', tmin=D(19, 0), tmax=D(20, 0)) == PREV[:1]
+    assert eventdb.prev_events('cybozu') is None
+
+
+def test_booking_history(db):
+    assert [r[0] for r in eventdb.booking('AB1')] == [2, 1]
+    assert eventdb.booking('AB9') == []
@@ -0,0 +1,88 @@
+# SynCals  journalのテスト
+
+from datetime import datetime
+
+import pytest
+
+import journal
+from event import Event
+
+OPS = [Event('+', datetime(2026, 10, 19, 10), datetime(2026, 10, 19, 11), '江戸@合議室@山田', '定例会議'),
+       Event('-', datetime(2026, 10, 19, 12), datetime(2026, 10, 19, 13), '江戸@合議室@山田@サイボウズ@AB1', '打合せ')]
+
+
+@pytest.fixture
+def jnl(tmp_path):
+    yield journal.open_journal(str(tmp_path / 'journal.jsonl'))
+    journal.close_journal()
+
+
+def test_applied_is_per_calendar(jnl):
+    journal.target('cal1')
+    journal.applied(OPS[0], 'AB2')
+    assert journal.remains(OPS) == OPS[1:]
+
+    # 別のカレンダには未適用
+    journal.target('cal2')
+    assert journal.remains(OPS) == OPS
+
+
+def test_applied_survives_reopen(jnl, tmp_path):
+    journal.target('cal1')
+    journal.applied(OPS[1])
+    journal.close_journal()
+
+    journal.open_journal(str(tmp_path / 'journal.jsonl'))
+    journal.target('cal1')
+    assert journal.remains(OPS) == OPS[:1]
+    journal.target('cal2')
+    assert journal.remains(OPS) == OPS
+
+
+def test_clear_on_close(jnl, tmp_path):
+    journal.target('cal1')
+    journal.applied(OPS[0])
+    journal.close_journal(1)
+
+    journal.open_journal(str(tmp_path / 'journal.jsonl'))
+    journal.target('cal1')
+    assert journal.remains(OPS) == OPS
+
+
+# 登録ボタンを押した後に中断した操作は、再実行しない
+def test_sent_is_not_retried(jnl, tmp_path):
+    journal.target('cal1')
+    journal.pending(OPS[0])
+    journal.sent(OPS[0])
+    assert journal.remains(OPS) == OPS[1:]
+
+    journal.close_journal()
+    journal.open_journal(str(tmp_path / 'journal.jsonl'))
+    journal.target('cal1')
+    assert journal.remains(OPS) == OPS[1:]
+
+
+# 登録ボタンを押す前に中断した操作は、再実行する
+def test_pending_is_retried(jnl):
+    journal.target('cal1')
+    journal.pending(OPS[0])
+    assert journal.remains(OPS) == OPS
+
+
+# 別の差分で開いたら、以前の記録は使わない
+def test_other_merge_discards_records(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal.open_journal(path, journal.mergesig(OPS))
+    journal.target('cal1')
+    journal.applied(OPS[0])
+    journal.close_journal()
+
+    journal.open_journal(path, journal.mergesig(OPS[::-1])) # 並び順は関係しない
+    journal.target('cal1')
+    assert journal.remains(OPS) == OPS[1:]
+    journal.close_journal()
+
+    journal.open_journal(path, journal.mergesig(OPS[:1]))
+    journal.target('cal1')
+    assert journal.remains(OPS) == OPS
+    journal.close_journal()
@@ -0,0 +1,38 @@
+# SynCals  snapshotの読み書きテスト
+
+from datetime import datetime
+
+import pytest
+
+import snapshot
+from event import Event
+
+TBGN = datetime(2026, 10, 19, 10, 0)
+TEND = datetime(2026, 10, 19, 11, 0)
+EVENTS = [Event('cybozu', TBGN, TEND, '部屋A', '定例会議', '501:2026.10.19'),
+          Event('cybozu', TBGN, TEND, '山田',  '打合せ')]
+
+
+@pytest.fixture(params=['pickle', 'yaml'])
+def fmt(request, monkeypatch):
+    monkeypatch.setattr(snapshot, 'g_format', request.param)
+    return request.param
+
+
+def test_roundtrip(fmt):
+    snapshot.save('log/snap_%s' % fmt, EVENTS)
+    assert [e.todict() for e in snapshot.load('log/snap_%s' % fmt)] == [e.todict() for e in EVENTS]
+
+
+# saveで書いた追加列をload_extraで読み戻す (指定していない列は返さず、無い列はNone)
+def test_extra(fmt):
+    cats = [['江戸', '合議室'], ['江戸', '山田']]
+    snapshot.save('log/extra_%s' % fmt, EVENTS, cat=cats, memo=['a', 'b'])
+    events, extra = snapshot.load_extra('log/extra_%s' % fmt, ('cat', 'none'))
+    assert [e.desc for e in events] == ['定例会議', '打合せ']
+    assert extra == {'cat': cats, 'none': None}
+
+
+def test_missing():
+    assert snapshot.load('log/nothing') is None
+    assert snapshot.load_extra('log/nothing', ('cat',)) is None
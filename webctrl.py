@@ -5,6 +5,17 @@
 #
 # 2025.03.15 rinos4u	new
 # 2026.04.05 rinos4u	Add CHROME_EXE_PATH for test version
+# 2026.10.18 rinos4u	固定ウェイトを条件待ち(要素/DOM安定/通信完了/URL変化)に置き換え
+# 2026.10.18 rinos4u	テーブルを1回のスクリプト実行で一括抽出するtable/textsを追加
+# 2026.10.18 rinos4u	ヘッドレスモードとCDPによるリソース(画像/フォント/メディア/解析)ブロックを追加
+# 2026.10.18 rinos4u	ドライバをスレッド単位で保持し、複数ブラウザの同時使用に対応
+# 2026.10.18 rinos4u	ブラウザ操作をSessionクラスに移動し、ログイン済みSessionを貸し出すPoolを追加
+# 2026.10.18 rinos4u	タブ操作(newtab/tab/closetab)を追加
+# 2026.10.18 rinos4u	ブラウザのCookieを引き継いでHTTPで直接取得するHttpを追加
+# 2026.10.18 rinos4u	Selectの選択肢を一括取得するoptionsを追加
+# 2026.10.18 rinos4u	ダウンロード先の設定(setdownload)と完了待ち(wait_download)を追加
+# 2026.10.18 rinos4u	操作単位のリトライ(retry)と、応答しないブラウザを強制終了するウォッチドッグ(watchdog)を追加
+# 2026.10.18 rinos4u	ウォッチドッグをWebDriverのコマンド単位に変更し、リトライ回数を進捗(progress)があればリセット
 
 ################################################################################
 # import
@@ -17,8 +28,20 @@ from selenium.webdriver.chrome.service import Service           # type: ignore
 from selenium.webdriver.chrome.options import Options           # type: ignore
 from selenium.webdriver.common.by import By                     # type: ignore
 from selenium.webdriver.common.action_chains import ActionChains# type: ignore
+from selenium.common.exceptions import WebDriverException       # type: ignore
+from selenium.common.exceptions import TimeoutException         # type: ignore
+from selenium.common.exceptions import NoSuchElementException   # type: ignore
+from selenium.common.exceptions import StaleElementReferenceException # type: ignore
 
 from pathlib import Path
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from http.client import HTTPSConnection, HTTPException
+import os
+import queue
+import re
+import subprocess
+import threading
 import time
 from logconf import g_logger
 
@@ -38,212 +61,835 @@ WAIT_AFTER  = 0.5
 WAIT_SCROLL = 0.5
 WAIT_PAGE   = 10
 
+# ヘッドレス時のウィンドウサイズ
+HEADLESS_SIZE = '1920,1080'
+
+# blockresで指定できるリソース種別とブロックするURLパターン (CDP Network.setBlockedURLs形式)
+BLOCK_URLS = {
+    'image':     ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico', '*.bmp'],
+    'font':      ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media':     ['*.mp4', '*.webm', '*.mp3', '*.m4a', '*.ogg', '*.wav'],
+    'analytics': ['*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+                  '*facebook.net*', '*hotjar.com*', '*clarity.ms*', '*adobedtm.com*', '*omtrdc.net*'],
+}
+
+# 条件待ちの設定
+WAIT_POLL   = 0.1   # 条件のポーリング間隔
+WAIT_QUIET  = 0.25  # DOM変化/通信が止まってから安定とみなすまでの時間
+WAIT_SETTLE = 2     # クリックや入力後の安定待ちのタイムアウト
+WAIT_DOWNLOAD = 60  # ダウンロード完了待ちのタイムアウト
+
+# ダウンロード中のファイルの拡張子
+DOWNLOADING = ('.crdownload', '.tmp')
+
+# 操作単位のリトライ
+RETRY_TRIES   = 3 # 実行回数 (初回を含む)
+RETRY_BACKOFF = 1 # 1回目のリトライ待ち[s] (以降は倍々)
+
+# ウォッチドッグ
+WATCH_POLL  = 0.5 # 制限時間の確認間隔[s]
+WATCH_GRACE = 5   # ページ読み込み/スクリプトのタイムアウト(watchdog秒)の例外を待つ猶予[s]
+
+# ブラウザが応答しなくなった(作り直しが必要)とみなす例外メッセージ
+HUNG_MSGS = ('invalid session id', 'session deleted', 'disconnected', 'not reachable', 'Timed out receiving message',
+             'Max retries exceeded', 'Connection aborted', 'Connection refused', 'Read timed out')
+
+# ページ状態取得用スクリプト
+# 初回呼び出し時にDOM変化(MutationObserver)と通信(XHR/fetch)の監視をページに仕込み、
+# [readyState, 最終変化からの経過ms, 通信中の数, ページID, 変化回数]を返す
+JS_STATE = '''
+if (!window.__scw) {
+    var w = window.__scw = {id: Math.random(), seq: 0, req: 0, mut: performance.now()};
+    var touch = function() { w.seq++; w.mut = performance.now(); };
+    new MutationObserver(touch).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        w.req++;
+        this.addEventListener('loadend', function() { w.req--; touch(); });
+        return send.apply(this, arguments);
+    };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function() {
+            w.req++;
+            return fetch.apply(this, arguments).finally(function() { w.req--; touch(); });
+        };
+    }
+}
+var w = window.__scw;
+return [document.readyState, performance.now() - w.mut, w.req, w.id, w.seq];
+'''
+
+# スクロール位置取得用スクリプト
+JS_RECT = 'return arguments[0].getBoundingClientRect().top;'
+
+# テーブル一括抽出用スクリプト (引数: ルート要素(null=document), 行セレクタ, セル/ヘッダセレクタ)
+# 文字列は.textと同様に前後の空白を除去する
+# 行ごとに {head: 行ヘッダ文字列, cells: [セル文字列], links: [[セル内のリンクURL]]} を返す
+JS_TABLE = '''
+var root = arguments[0] || document, ret = [];
+var rows = root.querySelectorAll(arguments[1]);
+for (var i = 0; i < rows.length; i++) {
+    var th = rows[i].querySelector(arguments[3]);
+    var td = rows[i].querySelectorAll(arguments[2]);
+    var cells = [], links = [];
+    for (var j = 0; j < td.length; j++) {
+        cells.push(td[j].innerText.trim());
+        links.push(Array.prototype.map.call(td[j].querySelectorAll('a[href]'), function(a) { return a.href; }));
+    }
+    ret.push({head: th ? th.innerText.trim() : '', cells: cells, links: links});
+}
+return ret;
+'''
+
+# Selectの選択肢一括取得用スクリプト (引数: select要素)
+JS_OPTIONS = '''
+return Array.prototype.map.call(arguments[0].options, function(o) { return [o.text.trim(), o.value]; });
+'''
+
+# HTTP取得時の文字コード判定 (Content-Typeまたはmetaタグ)
+CHARSET_RE = re.compile(rb'charset=["\']?([\w-]+)', re.I)
+
+# 複数エレメントのテキスト一括抽出用スクリプト (引数: ルート要素(null=document), セレクタ)
+JS_TEXTS = '''
+var root = arguments[0] || document;
+return Array.prototype.map.call(root.querySelectorAll(arguments[1]), function(e) { return e.innerText.trim(); });
+'''
+
+################################################################################
+# Session
+################################################################################
+# ブラウザ1つ分の操作 (ドライバと待ち設定を保持)
+class Session:
+    def __init__(self):
+        self.drv       = None # WebDriver
+        self.fixedwait = 0    # 1なら条件待ちを使わず、従来の固定時間ウェイトで動作する
+        self.opts      = {}   # init時の設定 (restart用)
+        self.watchdog  = 0    # WebDriverのコマンド1回がこの秒数で終わらなければブラウザを強制終了 (0:無効)
+        self.deadline  = None # 実行中のコマンドの制限時刻 (time.monotonic。コマンド実行中以外はNone)
+
+    # ドライバの初期化
+    # headless: 1ならウィンドウを表示せずに起動 (表示の無いサーバでも動作可能)
+    # blockres: ブロックするリソース種別のリスト(BLOCK_URLSのキー)。1なら全種別、0ならブロックしない
+    # profile:  プロファイルのフォルダ (同時に起動するブラウザはそれぞれ別のフォルダが必要)
+    # watchdog: WebDriverのコマンド1回の制限時間[s]。超えたらブラウザを強制終了する (0:無効)
+    #           コマンドの間(入力待ちや解析中)は対象外なので、長い処理や確認待ちで終了されることは無い
+    def init(self, scale='1.0', chrome_exe=CHROME_EXE_PATH, driver_path=CHROME_DRIVER_PATH, fixedwait=0, headless=0, blockres=0, profile=CHROME_PROFILE_PATH, watchdog=0):
+        self.fixedwait = fixedwait
+        self.watchdog  = watchdog
+
+        # 初期化済みなら省略
+        if self.drv:
+            g_logger.debug('webctrl::init skip')
+            return
+        self.opts = dict(scale=scale, chrome_exe=chrome_exe, driver_path=driver_path, fixedwait=fixedwait, headless=headless, blockres=blockres, profile=profile, watchdog=watchdog)
+
+        # 新規作成
+        opt = Options()
+        if chrome_exe:
+            opt.binary_location = chrome_exe
+        opt.add_argument(f'--user-data-dir={profile}')
+        opt.add_argument(f"--profile-directory={CHROME_PROFILE_NAME}")
+        opt.add_argument("--no-first-run")
+        opt.add_argument("--no-default-browser-check")
+        opt.add_argument('--no-sandbox')
+        opt.add_argument('--force-device-scale-factor=' + scale)
+        if headless:
+            opt.add_argument('--headless=new')
+            opt.add_argument('--disable-gpu')
+            opt.add_argument('--window-size=' + HEADLESS_SIZE)
+        opt.add_experimental_option("excludeSwitches", ['enable-automation', 'enable-logging']) # seleniumのメッセージを消す
+        self.drv = webdriver.Chrome(service=Service(executable_path=driver_path), options=opt)
+        if watchdog:
+            # ページ読み込みとスクリプトが止まった場合もwatchdog秒で例外にする
+            self.drv.set_page_load_timeout(watchdog)
+            self.drv.set_script_timeout(watchdog)
+            self.arm()
+
+        # 不要なリソースの読み込みをブロック
+        if blockres:
+            self.block(list(BLOCK_URLS) if blockres == 1 else blockres)
+        g_logger.debug('webctrl::init done%s' % (' (headless)' if headless else ''))
+        #self.drv.execute_script("document.body.style.zoom='100%'")
+
+    # 設定(プラグインまたはトップのconf)に従ってドライバを初期化
+    def initconf(self, conf):
+        self.init(
+            scale=conf.get('devscale', '1.0'),
+            chrome_exe=conf.get('chrome_exe', CHROME_EXE_PATH),
+            driver_path=conf.get('driver_path', CHROME_DRIVER_PATH),
+            fixedwait=conf.get('fixedwait', 0),
+            headless=conf.get('headless', 0),
+            blockres=conf.get('blockres', 0),
+            profile=conf.get('profile', CHROME_PROFILE_PATH),
+            watchdog=conf.get('watchdog', 0),
+        )
+
+    # 指定種別のリソースをCDPでブロック (以降の全リクエストが対象)
+    def block(self, kinds):
+        urls = []
+        for k in kinds:
+            if k not in BLOCK_URLS:
+                g_logger.warning('webctrl::block unknown type %s' % k)
+                continue
+            urls += BLOCK_URLS[k]
+        try:
+            self.drv.execute_cdp_cmd('Network.enable', {})
+            self.drv.execute_cdp_cmd('Network.setBlockedURLs', {'urls': urls})
+            g_logger.debug('webctrl::block %s' % kinds)
+        except WebDriverException:
+            g_logger.warning('webctrl::block failed %s' % kinds)
+
+    # ドライバの開放
+    def deinit(self):
+        # 開放済みなら省略
+        if not self.drv:
+            g_logger.debug('webctrl::deinit skip')
+            return
+
+        # ブラウザ終了
+        self.drv.quit()
+        self.drv = None
+        g_logger.debug('webctrl::deinit done')
+
+    # 同じ設定でブラウザを再起動
+    def restart(self):
+        self.deinit()
+        self.init(**self.opts)
+
+    # 応答しないブラウザを強制終了 (quitも応答しないため、chromedriverのプロセスごと終了する)
+    # 別スレッド(ウォッチドッグ)から呼ばれると、ブロック中のドライバ呼び出しは例外で戻る
+    def kill(self):
+        drv, self.drv = self.drv, None
+        proc = drv and getattr(drv.service, 'process', None)
+        if not proc or proc.poll() is not None:
+            return
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)], capture_output=True) # 子プロセスのChromeごと終了
+        else:
+            proc.kill()
+        g_logger.info('webctrl::kill pid %d' % proc.pid)
+
+    # ウォッチドッグの開始 (ドライバのコマンド実行ごとに制限時刻を設定し、別スレッドで監視する)
+    # 制限時刻を過ぎてもコマンドが戻らなければブラウザを強制終了し、ブロック中のコマンドを例外で戻す
+    def arm(self):
+        drv = self.drv
+        execute = drv.execute
+        def guarded(command, params = None):
+            self.deadline = time.monotonic() + self.watchdog + WATCH_GRACE
+            try:
+                return execute(command, params)
+            finally:
+                self.deadline = None
+        drv.execute = guarded # WebElementの操作もドライバのexecuteを通る
+        threading.Thread(target=self.watch, args=(drv,), daemon=True).start()
+
+    # ウォッチドッグの監視 (ドライバが開放/作り直されたら終了)
+    def watch(self, drv):
+        while self.drv is drv:
+            deadline = self.deadline
+            if deadline and time.monotonic() > deadline:
+                g_logger.info('webctrl::watchdog %ds timeout' % self.watchdog)
+                self.kill()
+                return
+            time.sleep(WATCH_POLL)
+
+    # funcを例外が出なくなるまで最大tries回実行し、その戻り値を返す (最後の例外はそのまま送出)
+    # リトライ前はbackoff秒から倍々で待つ。ブラウザが応答しない場合は作り直してからrevive(ログイン等)を呼ぶ
+    # progress指定時は、その値が前回の失敗時から変わって(処理が進んで)いれば回数を数え直す
+    # (続きから再開できる一括処理でも、リトライ回数を1件/1ページ単位にするため)
+    def retry(self, func, tries = RETRY_TRIES, backoff = RETRY_BACKOFF, revive = None, progress = None):
+        n = 0
+        last = progress() if progress else None
+        while True:
+            n += 1
+            try:
+                return func()
+            except Exception as e:
+                if progress:
+                    now = progress()
+                    if now != last:
+                        n, last = 1, now # 処理が進んでいれば1回目の失敗として数え直す
+                if n >= tries:
+                    raise
+                err = e
+                g_logger.info('webctrl::retry %d/%d %s' % (n, tries - 1, (str(e).strip().splitlines() or [type(e).__name__])[0]))
+                g_logger.debug('webctrl::retry', exc_info=True)
+
+            # 待ってからリトライ
+            time.sleep(backoff * 2 ** (n - 1))
+            if not self.drv or ishung(err):
+                g_logger.info('webctrl::ブラウザを再起動します')
+                self.kill()
+                self.init(**self.opts)
+                if revive:
+                    revive()
+
+    # ドライバの存在チェック用 (デバッグでdriverを直コントロールしたい場合にも利用)
+    def driver(self):
+        return self.drv
+
+    # 条件待ち ######################################################################
+    # condが真を返すまで待つ。タイムアウト時はNone
+    # 固定ウェイト設定時、または条件の評価ができないブラウザ状態の場合はfallback秒待つ
+    def until(self, cond, timeout = WAIT_PAGE, fallback = WAIT_AFTER):
+        if self.fixedwait:
+            time.sleep(fallback)
+            try:
+                return cond(self.drv)
+            except WebDriverException:
+                return None
+
+        try:
+            return WebDriverWait(self.drv, timeout, poll_frequency=WAIT_POLL,
+                                 ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)).until(cond)
+        except TimeoutException:
+            g_logger.debug('webctrl::until timeout %s' % timeout)
+        except WebDriverException:
+            g_logger.debug('webctrl::until fallback %s' % fallback, exc_info=True)
+            time.sleep(fallback)
+        return None
+
+    # 現在のページ状態の印を取得 (wait系のsinceに渡すと、その後の変化を待つ)
+    def mark(self):
+        try:
+            st = self.drv.execute_script(JS_STATE)
+            return (st[3], st[4])
+        except WebDriverException:
+            return None
+
+    # ページ読み込み完了後、DOM変化と通信が止まるまで待つ
+    # since: mark()の結果。指定時はページ遷移またはDOM変化が起きるまで安定とみなさない
+    # net:   0なら通信中のリクエストは見ない(DOM変化のみ)
+    def wait_idle(self, timeout = WAIT_PAGE, quiet = WAIT_QUIET, since = None, net = 1, fallback = WAIT_AFTER):
+        def cond(d):
+            st = d.execute_script(JS_STATE)
+            if since and (st[3], st[4]) == since:
+                return False # まだ何も変化していない
+            return st[0] == 'complete' and st[1] >= quiet * 1000 and (not net or st[2] <= 0)
+        return self.until(cond, timeout, fallback)
+
+    # DOM変化が止まるまで待つ(通信は見ない)
+    def wait_stable(self, timeout = WAIT_SETTLE, quiet = WAIT_QUIET, fallback = WAIT_AFTER):
+        return self.wait_idle(timeout, quiet, net = 0, fallback = fallback)
+
+    # 操作後の短い安定待ち (固定ウェイト設定時はfallback秒)
+    def settle(self, fallback = WAIT_AFTER, timeout = WAIT_SETTLE):
+        return self.wait_idle(timeout, fallback = fallback)
+
+    # エレメントが現れる(clickable=1ならクリック可能になる)まで待ち、エレメントを返す
+    def wait_elem(self, locator_value, locator_type = By.ID, timeout = WAIT_PAGE, clickable = 0, fallback = WAIT_AFTER):
+        if clickable:
+            cond = EC.element_to_be_clickable((locator_type, locator_value))
+        else:
+            cond = EC.presence_of_element_located((locator_type, locator_value))
+        return self.until(cond, timeout, fallback)
+
+    # URLが変わるまで待つ
+    def wait_url(self, old, timeout = WAIT_PAGE, fallback = WAIT_AFTER):
+        return self.until(lambda d: d.current_url != old, timeout, fallback)
+
+    # ページ更新待ち
+    def wait(self, sec = WAIT_PAGE, since = None, fallback = WAIT_AFTER):
+        self.wait_idle(sec, since = since, fallback = fallback)
+
+    # ページ遷移&受信待ち
+    def jump(self, url):
+        self.drv.get(url)
+        self.wait(WAIT_PAGE, fallback = WAIT_AFTER * 2)
+
+    # 現在のページを取得
+    def url(self):
+        return self.drv.current_url
+
+    # 新しいタブでurlを開き、そのタブのハンドルを返す (読み込み完了を待たず、タブも切り替えない)
+    def newtab(self, url = 'about:blank'):
+        old = set(self.drv.window_handles)
+        self.drv.execute_script('window.open(arguments[0], "_blank");', url)
+        new = [h for h in self.drv.window_handles if h not in old]
+        if not new:
+            g_logger.error('webctrl::newtab failed %s' % url)
+            return None
+        return new[0]
+
+    # 現在のブラウザのCookieとUser-Agentを引き継いだHTTPクライアントを作成
+    def http(self, host):
+        cookie = '; '.join('%s=%s' % (c['name'], c['value']) for c in self.drv.get_cookies())
+        agent  = self.drv.execute_script('return navigator.userAgent;')
+        return Http(host, {'Cookie': cookie, 'User-Agent': agent})
+
+    # ダウンロード先フォルダを設定 (CDP。ヘッドレスでも有効)
+    def setdownload(self, path):
+        path = Path(path).resolve()
+        path.mkdir(parents=True, exist_ok=True)
+        self.drv.execute_cdp_cmd('Page.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': str(path)})
+
+    # フォルダにbefore(ファイル名の集合)以外のファイルのダウンロードが完了するまで待ち、そのパスを返す
+    # タイムアウト時はNone
+    def wait_download(self, path, before, timeout = WAIT_DOWNLOAD):
+        end = time.time() + timeout
+        while time.time() < end:
+            new = [f for f in Path(path).iterdir() if f.name not in before]
+            if new and not any(f.name.endswith(DOWNLOADING) for f in new):
+                return max(new, key=lambda f: f.stat().st_mtime)
+            time.sleep(WAIT_POLL)
+        g_logger.debug('webctrl::wait_download timeout %s' % path)
+        return None
+
+    # タブを切り替え(handle省略時は切り替えない)、現在のタブのハンドルを返す
+    def tab(self, handle = None):
+        if handle:
+            self.drv.switch_to.window(handle)
+        return self.drv.current_window_handle
+
+    # タブを閉じる (閉じた後はtabで切り替えること)
+    def closetab(self, handle):
+        self.drv.switch_to.window(handle)
+        self.drv.close()
+
+    # エレメントの簡易制御 ##################################################################
+
+    # エレメントの抽出(1つ)
+    def find(self, locator_value, locator_type = By.ID, target = None):
+        return (target or self.drv).find_element(locator_type, locator_value)
+
+    # エレメントの抽出(複数)
+    def finds(self, locator_value, locator_type = By.ID, target = None):
+        return (target or self.drv).find_elements(locator_type, locator_value)
+
+    # 先頭エレメントのテキスト文字列を取得
+    def get(self, locator_value, locator_type = By.ID, target = None):
+        # 対象エレメントを取得
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::get %s failed' % locator_value)
+            return None
+
+        return elm.text
+
+    # 複数エレメントのテキスト抽出
+    def gets(self, locator_value, locator_type = By.ID, target = None):
+        return [i.text for i in self.finds(locator_value, locator_type, target)]
+
+    # 複数エレメントのテキストを1回のスクリプト実行で抽出 (CSSセレクタ指定)
+    def texts(self, css, target = None):
+        return self.drv.execute_script(JS_TEXTS, target, css)
+
+    # テーブルの行を1回のスクリプト実行で一括抽出 (CSSセレクタ指定)
+    # 行数×セル数に関わらずWebDriverとの通信は1往復となる
+    def table(self, row_css, cell_css = 'td', head_css = 'th', target = None):
+        return self.drv.execute_script(JS_TABLE, target, row_css, cell_css, head_css)
+
+    # エレメントを文字列マッチで抽出(1つ)
+    def search(self, locator_value, start, locator_type = By.ID, target = None):
+        for elm in self.finds(locator_value, locator_type, target):
+            if elm.text.startswith(start):
+                return elm
+        g_logger.debug('webctrl::search %s failed' % start)
+        return None
+
+    # find結果のエレメントへ移動
+    def fmove(self, elm, center = 1):
+        if center:
+            # 画面センタに移動 (move_to_elementだとヘッダ/フッタが邪魔してクリックできないことがある)
+            self.drv.execute_script("arguments[0].scrollIntoView({block: 'center'});", elm)
+        else:
+            ActionChains(self.drv).move_to_element(elm).perform() #画面内に移動
+
+        # スクロールが止まるまで待つ
+        last = [None]
+        def cond(d):
+            top = d.execute_script(JS_RECT, elm)
+            ok = top == last[0]
+            last[0] = top
+            return ok
+        self.until(cond, WAIT_SETTLE, WAIT_SCROLL)
+
+    # find結果のエレメントをクリック
+    def fclick(self, elm, center = 1):
+        self.fmove(elm, center)
+        elm.click()
+        self.settle(WAIT_CLICK)
+
+    # find結果のエレメントにセット
+    def fset(self, elm, text, center = 1):
+        self.fmove(elm, center)
+        if elm.tag_name == 'input':
+            elm.clear()
+        # 新しいテキストを入力
+        elm.send_keys(text)
+
+    # 検索しつつ操作 #####################################################################
+    # テキスト文字列を設定
+    def set(self, locator_value, text, locator_type = By.ID, target = None):
+        # 対象エレメントを取得
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::set %s failed' % locator_value)
+            return None
+
+        self.fset(elm, text)
+
+    # エレメントへ移動
+    def move(self, locator_value, locator_type = By.ID, target = None):
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::move %s failed' % locator_value)
+            return None
+        self.fmove(elm)
+
+    # ボタンをクリック
+    def click(self, locator_value, locator_type = By.ID, target = None):
+        # 対象エレメントを取得
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::click %s failed' % locator_value)
+            return None
+        self.fclick(elm)
+
+    # Selectをインデックスで指定
+    def selindex(self, locator_value, index, locator_type = By.ID, target = None):
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::selindex %s failed' % locator_value)
+            return None
+
+        s = Select(elm)
+        if not s:
+            g_logger.error('webctrl::selindex %s failed2' % locator_value)
+            return None
+        s.select_by_index(index)
+
+    # Selectを値で指定
+    def selvalue(self, locator_value, val, locator_type = By.ID, target = None):
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::selvalue %s failed' % locator_value)
+            return None
+
+        s = Select(elm)
+        if not s:
+            g_logger.error('webctrl::selvalue %s failed2' % locator_value)
+            return None
+        s.select_by_value(val)
+
+    # Selectを値で指定
+    def selindexvalue(self, locator_value, val, locator_type = By.ID, target = None):
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::selvalue %s failed' % locator_value)
+            return None
+
+        s = Select(elm)
+        if not s:
+            g_logger.error('webctrl::selvalue %s failed2' % locator_value)
+            return None
+        sel = list(filter(lambda x: x != 'undefined', elm.text.splitlines()))
+        s.select_by_index(sel.index(val))
+
+    # Selectの選択肢を{表示文字列: 値}で取得 (1回のスクリプト実行)
+    def options(self, locator_value, locator_type = By.ID, target = None):
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::options %s failed' % locator_value)
+            return None
+        return dict(self.drv.execute_script(JS_OPTIONS, elm))
+
+    # チェックボックスのチェック確認
+    def isselect(self, locator_value, locator_type = By.ID, target = None):
+        elm = self.find(locator_value, locator_type, target)
+        if not elm:
+            g_logger.error('webctrl::selvalue %s failed' % locator_value)
+            return None
+
+        return elm.is_selected()
+
+    # 複数のエレメントが見つかった場合に、例外が無くなるelmを探してクリック
+    def exclick(self, locator_value, locator_type = By.ID, target = None):
+        for elm in self.finds(locator_value, locator_type, target):
+            try:
+                self.fclick(elm)
+                return True # 例外が発生しなかったら成功
+            except:
+                continue
+        g_logger.debug('webctrl::exclick failed "%s" %s' % (locator_type, locator_value))
+        return False # １つも成功しなかった
+
+# ブラウザが応答しなくなった(作り直しが必要)ことを示す例外か
+def ishung(e):
+    return isinstance(e, (TimeoutException, ConnectionError, TimeoutError)) or any(m in str(e) for m in HUNG_MSGS)
+
+################################################################################
+# Http
+################################################################################
+# ブラウザを使わずにページを直接取得するHTTPSクライアント
+# 同一ホストへの接続はKeep-Aliveで使い回し、切断されていたら1回だけ再接続する
+class Http:
+    def __init__(self, host, headers):
+        self.host    = host
+        self.headers = headers | {'Connection': 'keep-alive'}
+        self.conn    = None
+
+    # GETしてステータス, Locationヘッダ, デコード済み本文を返す (リダイレクトは追わない)
+    def get(self, url):
+        u = urlsplit(url)
+        path = u.path + ('?' + u.query if u.query else '')
+        for retry in range(2):
+            if not self.conn:
+                self.conn = HTTPSConnection(self.host, timeout=WAIT_PAGE)
+            try:
+                self.conn.request('GET', path, headers=self.headers)
+                res  = self.conn.getresponse()
+                body = res.read()
+                break
+            except (HTTPException, OSError):
+                self.close()
+                if retry:
+                    raise
+                g_logger.debug('webctrl::http reconnect %s' % self.host)
+
+        # 文字コードはヘッダ、metaタグ、utf-8の順で判定
+        m = CHARSET_RE.search((res.getheader('Content-Type') or '').encode()) or CHARSET_RE.search(body[:2048])
+        charset = m.group(1).decode() if m else 'utf-8'
+        try:
+            text = body.decode(charset, errors='replace')
+        except LookupError:
+            text = body.decode('utf-8', errors='replace')
+        g_logger.debug('webctrl::http %d %s (%d bytes)' % (res.status, path, len(body)))
+        return res.status, res.getheader('Location'), text
+
+    # 接続を閉じる
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+################################################################################
+# Pool
+################################################################################
+# ログイン済みのSessionを貸し出すプール
+# Sessionは必要になった時点でsize個まで作成し、各Sessionは別のプロファイルフォルダ(<profile>_<番号>)を使う
+# login: 作成直後に呼ぶログイン関数(conf)。呼び出し中は作成したSessionがカレントになる
+#        ログインに失敗してもSessionは貸し出す (利用側で再度ログインを判定する前提)
+class Pool:
+    def __init__(self, conf, size = 1, login = None, profile = None):
+        self.conf     = conf
+        self.login    = login
+        self.profile  = profile or conf.get('profile', CHROME_PROFILE_PATH)
+        self.free     = list(range(size))  # 未使用のSession番号 (プロファイルフォルダ用)
+        self.sessions = []                 # 作成済みSession
+        self.idle     = queue.LifoQueue()  # 貸し出し可能なSession (最後に返却されたものを優先)
+        self.lock     = threading.Lock()
+
+    # Sessionを借りる (空きが無く上限まで作成済みなら返却を待つ)
+    def acquire(self, timeout = None):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            idx = self.free.pop(0) if self.free else None
+        if idx is None:
+            return self.idle.get(timeout=timeout)
+
+        # 新規作成してログインしておく
+        sess = Session()
+        try:
+            sess.initconf(self.conf | {'profile': '%s_%d' % (self.profile, idx)})
+        except Exception:
+            sess.deinit()
+            with self.lock:
+                self.free.append(idx) # 次回のacquireで再作成する
+            raise
+        with self.lock:
+            self.sessions.append(sess)
+        g_logger.debug('webctrl::pool new session %d' % idx)
+
+        if self.login:
+            prev = use(sess)
+            try:
+                self.login(self.conf)
+            except Exception:
+                g_logger.debug('webctrl::pool login failed %d' % idx, exc_info=True)
+            finally:
+                use(prev)
+        return sess
+
+    # Sessionを返す
+    def release(self, sess):
+        self.idle.put(sess)
+
+    # Sessionを借りて、withの間だけカレントスレッドのSessionにする
+    @contextmanager
+    def session(self, timeout = None):
+        sess = self.acquire(timeout)
+        prev = use(sess)
+        try:
+            yield sess
+        finally:
+            use(prev)
+            self.release(sess)
+
+    # 全Sessionのブラウザを終了
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+            self.free = list(range(len(sessions) + len(self.free)))
+        for sess in sessions:
+            sess.deinit()
+        self.idle = queue.LifoQueue()
+
 ################################################################################
 # globals
 ################################################################################
-# WebDriver
-g_driver = None
+# スレッドごとのカレントSession (並列処理時はスレッドごとに別のブラウザを使う)
+class Local(threading.local):
+    session = None
+
+g_local = Local()
 
 ################################################################################
 # util funcs
 ################################################################################
-# ドライバの初期化
-def init(scale='1.0', chrome_exe=CHROME_EXE_PATH, driver_path=CHROME_DRIVER_PATH):
-    global g_driver
-
-    # 初期化済みなら省略
-    if g_driver:
-        g_logger.debug('webctrl::init skip')
-        return
-
-    # 新規作成
-    opt = Options()
-    if chrome_exe:
-        opt.binary_location = chrome_exe
-    opt.add_argument(f'--user-data-dir={CHROME_PROFILE_PATH}')
-    opt.add_argument(f"--profile-directory={CHROME_PROFILE_NAME}")
-    opt.add_argument("--no-first-run")
-    opt.add_argument("--no-default-browser-check")
-    opt.add_argument('--no-sandbox')
-    opt.add_argument('--force-device-scale-factor=' + scale)
-    opt.add_experimental_option("excludeSwitches", ['enable-automation', 'enable-logging']) # seleniumのメッセージを消す
-    g_driver = webdriver.Chrome(service=Service(executable_path=driver_path), options=opt)
-    g_logger.debug('webctrl::init done')
-    #g_driver.execute_script("document.body.style.zoom='100%'")
-    
-# ドライバの開放
+# カレントSessionを取得 (未設定ならスレッド専用のSessionを作る)
+def session():
+    if not g_local.session:
+        g_local.session = Session()
+    return g_local.session
+
+# カレントSessionを切り替え、切り替え前のSessionを返す
+def use(sess):
+    prev = g_local.session
+    g_local.session = sess
+    return prev
+
+# 以下はカレントSessionに対する操作 (従来のモジュール関数API)
+def init(scale='1.0', chrome_exe=CHROME_EXE_PATH, driver_path=CHROME_DRIVER_PATH, fixedwait=0, headless=0, blockres=0, profile=CHROME_PROFILE_PATH, watchdog=0):
+    return session().init(scale, chrome_exe, driver_path, fixedwait, headless, blockres, profile, watchdog)
+
+def initconf(conf):
+    return session().initconf(conf)
+
+def block(kinds):
+    return session().block(kinds)
+
 def deinit():
-    global g_driver
-
-    # 開放済みなら省略
-    if not g_driver:
-        g_logger.debug('webctrl::deinit skip')
-        return
-    
-    # ブラウザ終了
-    g_driver.quit()
-    g_driver = None
-    g_logger.debug('webctrl::deinit done')
-
-# ドライバの存在チェック用 (デバッグでdriverを直コントロールしたい場合にも利用)
+    return session().deinit()
+
+def restart():
+    return session().restart()
+
+def kill():
+    return session().kill()
+
+def retry(func, tries = RETRY_TRIES, backoff = RETRY_BACKOFF, revive = None, progress = None):
+    return session().retry(func, tries, backoff, revive, progress)
+
 def driver():
-    return g_driver
+    return session().driver()
+
+def until(cond, timeout = WAIT_PAGE, fallback = WAIT_AFTER):
+    return session().until(cond, timeout, fallback)
+
+def mark():
+    return session().mark()
+
+def wait_idle(timeout = WAIT_PAGE, quiet = WAIT_QUIET, since = None, net = 1, fallback = WAIT_AFTER):
+    return session().wait_idle(timeout, quiet, since, net, fallback)
+
+def wait_stable(timeout = WAIT_SETTLE, quiet = WAIT_QUIET, fallback = WAIT_AFTER):
+    return session().wait_stable(timeout, quiet, fallback)
+
+def settle(fallback = WAIT_AFTER, timeout = WAIT_SETTLE):
+    return session().settle(fallback, timeout)
+
+def wait_elem(locator_value, locator_type = By.ID, timeout = WAIT_PAGE, clickable = 0, fallback = WAIT_AFTER):
+    return session().wait_elem(locator_value, locator_type, timeout, clickable, fallback)
+
+def wait_url(old, timeout = WAIT_PAGE, fallback = WAIT_AFTER):
+    return session().wait_url(old, timeout, fallback)
 
-# ページ更新待ち
-def wait(sec = WAIT_PAGE):
-    WebDriverWait(g_driver, sec).until(EC.presence_of_all_elements_located)
-    time.sleep(WAIT_AFTER)
+def wait(sec = WAIT_PAGE, since = None, fallback = WAIT_AFTER):
+    return session().wait(sec, since, fallback)
 
-# ページ遷移&受信待ち
 def jump(url):
-    g_driver.get(url)
-    time.sleep(WAIT_AFTER)
-    wait(WAIT_PAGE)
-    time.sleep(WAIT_AFTER)
+    return session().jump(url)
 
-# 現在のページを取得
 def url():
-    return g_driver.current_url
+    return session().url()
 
-# エレメントの簡易制御 ##################################################################
+def http(host):
+    return session().http(host)
+
+def setdownload(path):
+    return session().setdownload(path)
+
+def wait_download(path, before, timeout = WAIT_DOWNLOAD):
+    return session().wait_download(path, before, timeout)
+
+def newtab(url = 'about:blank'):
+    return session().newtab(url)
+
+def tab(handle = None):
+    return session().tab(handle)
+
+def closetab(handle):
+    return session().closetab(handle)
 
-# エレメントの抽出(1つ)
 def find(locator_value, locator_type = By.ID, target = None):
-    return (target or g_driver).find_element(locator_type, locator_value)
+    return session().find(locator_value, locator_type, target)
 
-# エレメントの抽出(複数)
 def finds(locator_value, locator_type = By.ID, target = None):
-    return (target or g_driver).find_elements(locator_type, locator_value)
+    return session().finds(locator_value, locator_type, target)
 
-# 先頭エレメントのテキスト文字列を取得
 def get(locator_value, locator_type = By.ID, target = None):
-    # 対象エレメントを取得
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::get %s failed' % locator_value)
-        return None
+    return session().get(locator_value, locator_type, target)
 
-    return elm.text
-
-# 複数エレメントのテキスト抽出
 def gets(locator_value, locator_type = By.ID, target = None):
-    return [i.text for i in finds(locator_value, locator_type, target)]
+    return session().gets(locator_value, locator_type, target)
+
+def texts(css, target = None):
+    return session().texts(css, target)
+
+def table(row_css, cell_css = 'td', head_css = 'th', target = None):
+    return session().table(row_css, cell_css, head_css, target)
 
-# エレメントを文字列マッチで抽出(1つ)
 def search(locator_value, start, locator_type = By.ID, target = None):
-    for elm in finds(locator_value, locator_type, target):
-        if elm.text.startswith(start):
-            return elm
-    g_logger.debug('webctrl::search %s failed' % start)
-    return None
+    return session().search(locator_value, start, locator_type, target)
 
-# find結果のエレメントへ移動
 def fmove(elm, center = 1):
-    if center:
-        # 画面センタに移動 (move_to_elementだとヘッダ/フッタが邪魔してクリックできないことがある)
-        g_driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elm)
-    else:
-        ActionChains(g_driver).move_to_element(elm).perform() #画面内に移動
-    time.sleep(WAIT_SCROLL)
-
-# find結果のエレメントをクリック
+    return session().fmove(elm, center)
+
 def fclick(elm, center = 1):
-    fmove(elm, center)
-    elm.click()
-    time.sleep(WAIT_CLICK)
+    return session().fclick(elm, center)
 
-# find結果のエレメントにセット
 def fset(elm, text, center = 1):
-    fmove(elm, center)
-    if elm.tag_name == 'input':
-        elm.clear()
-    # 新しいテキストを入力
-    elm.send_keys(text)
-
-# 検索しつつ操作 #####################################################################
-# テキスト文字列を設定
+    return session().fset(elm, text, center)
+
 def set(locator_value, text, locator_type = By.ID, target = None):
-    # 対象エレメントを取得
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::set %s failed' % locator_value)
-        return None
-    
-    fset(elm, text)
+    return session().set(locator_value, text, locator_type, target)
 
-# エレメントへ移動
 def move(locator_value, locator_type = By.ID, target = None):
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::move %s failed' % locator_value)
-        return None
-    fmove(elm)
+    return session().move(locator_value, locator_type, target)
 
-# ボタンをクリック
 def click(locator_value, locator_type = By.ID, target = None):
-    # 対象エレメントを取得
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::click %s failed' % locator_value)
-        return None
-    fclick(elm)
+    return session().click(locator_value, locator_type, target)
 
-# Selectをインデックスで指定
 def selindex(locator_value, index, locator_type = By.ID, target = None):
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::selindex %s failed' % locator_value)
-        return None
-
-    s = Select(elm)
-    if not s:
-        g_logger.error('webctrl::selindex %s failed2' % locator_value)
-        return None
-    s.select_by_index(index)
+    return session().selindex(locator_value, index, locator_type, target)
 
-# Selectを値で指定
 def selvalue(locator_value, val, locator_type = By.ID, target = None):
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::selvalue %s failed' % locator_value)
-        return None
-
-    s = Select(elm)
-    if not s:
-        g_logger.error('webctrl::selvalue %s failed2' % locator_value)
-        return None
-    s.select_by_value(val)
+    return session().selvalue(locator_value, val, locator_type, target)
 
-# Selectを値で指定
 def selindexvalue(locator_value, val, locator_type = By.ID, target = None):
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::selvalue %s failed' % locator_value)
-        return None
+    return session().selindexvalue(locator_value, val, locator_type, target)
 
-    s = Select(elm)
-    if not s:
-        g_logger.error('webctrl::selvalue %s failed2' % locator_value)
-        return None
-    sel = list(filter(lambda x: x != 'undefined', elm.text.splitlines()))
-    s.select_by_index(sel.index(val))
+def options(locator_value, locator_type = By.ID, target = None):
+    return session().options(locator_value, locator_type, target)
 
-# チェックボックスのチェック確認
 def isselect(locator_value, locator_type = By.ID, target = None):
-    elm = find(locator_value, locator_type, target)
-    if not elm:
-        g_logger.error('webctrl::selvalue %s failed' % locator_value)
-        return None
+    return session().isselect(locator_value, locator_type, target)
 
-    return elm.is_selected()
-
-# 複数のエレメントが見つかった場合に、例外が無くなるelmを探してクリック
 def exclick(locator_value, locator_type = By.ID, target = None):
-    for elm in finds(locator_value, locator_type, target):
-        try:
-            fclick(elm)
-            return True # 例外が発生しなかったら成功
-        except:
-            continue
-    g_logger.debug('webctrl::exclick failed "%s" %s' % (locator_type, locator_value))
-    return False # １つも成功しなかった
+    return session().exclick(locator_value, locator_type, target)